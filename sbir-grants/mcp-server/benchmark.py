@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+檢索 benchmark - 以標準查詢集衡量搜尋品質與延遲
+
+以 benchmark_queries.json（有版本號的標準查詢集：查詢 → 相關檔案 / chunk，涵蓋各 category）
+對本機索引執行三種檢索方式（server.rank_chunks 的 mode）：
+
+- keyword：只用 BM25F 關鍵字索引
+- semantic：只用向量搜尋
+- hybrid：完整流程（RRF 融合 + Re-ranking + MMR）
+
+品質指標為 recall@k、MRR、nDCG@k；延遲分冷（查詢向量與 rerank 分數快取為空）、
+熱（同一批查詢再跑一次）兩輪，回報 p50 / p95 / p99。
+索引與模型在量測前先載入，載入耗時另外列在報告的 "load"。
+比較向量庫時以 SBIR_VECTOR_BACKEND=chroma / flat 各跑一次，比對 load.vector_index 與 semantic 的延遲。
+
+只使用本機索引與已下載的模型，不連網。輸出 JSON 報告；指定基準報告時，
+指標下降超過容許值即以 exit code 1 結束，可作為回歸檢查：
+
+    python benchmark.py --output report.json
+    python benchmark.py --baseline baseline.json --tolerance 0.02
+
+加上 --quantization 時，另以目前向量索引的向量建立 float32 / float16 / int8（含全精度重新計分）
+的 flat 索引，比較各格式的矩陣大小與語意搜尋指標（見 vector_quantization.py）。
+加上 --chunk-embeddings 時，重新分段所有文件，比較 chunk 向量以全文 encode 與平均分段時的
+句子向量（pooled，見 chunker.chunk_embeddings_from_sentences）的語意搜尋指標與計算耗時。
+"""
+
+import os
+
+# 只使用已下載的模型，不連網
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+DEFAULT_QUERY_SET = os.path.join(SCRIPT_DIR, "benchmark_queries.json")
+
+MODES = ("keyword", "semantic", "hybrid")
+K_VALUES = (1, 3, 5, 10)
+NDCG_K = 10
+
+# 報告中每個查詢保留的前幾名 id（檢查個別查詢用）
+REPORT_TOP_N = 5
+
+# --quantization 比較的 flat 索引格式：(格式, 全精度重新計分的候選數)
+QUANTIZATION_VARIANTS = (("float32", 0), ("float16", 0), ("int8", 0), ("int8", 50))
+
+
+def load_query_set(path: str = DEFAULT_QUERY_SET) -> dict:
+    """讀取標準查詢集"""
+    with open(path, 'r', encoding='utf-8') as f:
+        query_set = json.load(f)
+    for item in query_set["queries"]:
+        if not item.get("relevant"):
+            raise ValueError(f"查詢 {item['id']} 沒有相關文件")
+    return query_set
+
+
+# ===== 品質指標 =====
+
+def _matches(result_id: str, relevant_item: str) -> bool:
+    """chunk id（含 ::）須完全相同；檔案路徑則比對 chunk 所屬檔案"""
+    if "::" in relevant_item:
+        return result_id == relevant_item
+    return result_id.split("::")[0] == relevant_item
+
+
+def _first_match(result_id: str, relevant: list[str], credited: set) -> str | None:
+    """result_id 對應到的第一個尚未計分的相關項目（同一檔案的多個 chunk 只計一次）"""
+    for item in relevant:
+        if item not in credited and _matches(result_id, item):
+            return item
+    return None
+
+
+def recall_at_k(ranked_ids: list[str], relevant: list[str], k: int) -> float:
+    """前 k 名涵蓋的相關項目比例"""
+    found = {item for item in relevant for result_id in ranked_ids[:k] if _matches(result_id, item)}
+    return len(found) / len(relevant)
+
+
+def reciprocal_rank(ranked_ids: list[str], relevant: list[str]) -> float:
+    """第一個相關結果名次的倒數（沒有相關結果為 0）"""
+    for rank, result_id in enumerate(ranked_ids, 1):
+        if any(_matches(result_id, item) for item in relevant):
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked_ids: list[str], relevant: list[str], k: int) -> float:
+    """二元相關度的 nDCG@k（每個相關項目只在第一次出現時得分）"""
+    credited = set()
+    dcg = 0.0
+    for rank, result_id in enumerate(ranked_ids[:k], 1):
+        item = _first_match(result_id, relevant, credited)
+        if item is not None:
+            credited.add(item)
+            dcg += 1.0 / math.log2(rank + 1)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal
+
+
+def evaluate(ranked_ids: list[str], relevant: list[str]) -> dict:
+    """單一查詢的各項指標"""
+    metrics = {f"recall@{k}": recall_at_k(ranked_ids, relevant, k) for k in K_VALUES}
+    metrics["mrr"] = reciprocal_rank(ranked_ids, relevant)
+    metrics[f"ndcg@{NDCG_K}"] = ndcg_at_k(ranked_ids, relevant, NDCG_K)
+    return metrics
+
+
+def _mean(rows: list[dict]) -> dict:
+    return {name: round(sum(row[name] for row in rows) / len(rows), 4) for name in rows[0]} if rows else {}
+
+
+def percentile(samples: list[float], q: float) -> float | None:
+    """nearest-rank 分位數"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def latency_summary(samples_ms: list[float]) -> dict:
+    return {
+        "p50_ms": round(percentile(samples_ms, 0.50), 2),
+        "p95_ms": round(percentile(samples_ms, 0.95), 2),
+        "p99_ms": round(percentile(samples_ms, 0.99), 2),
+        "max_ms": round(max(samples_ms), 2),
+    }
+
+
+# ===== 執行 =====
+
+async def _prepare() -> dict:
+    """量測前載入索引與模型，回傳各元件的載入耗時"""
+    import server
+    import warmup
+
+    task = warmup.start(server.PERSIST_DIR)
+    if task is not None:
+        await task
+    return warmup.get_status()["components"]
+
+
+def _reset_query_caches(cache_dir: str) -> None:
+    """清空查詢向量快取，並改用空的暫存 rerank 分數快取（不動使用者的 rerank_cache.db）"""
+    import rerank_cache
+    from embedding_cache import get_embedding_cache
+
+    get_embedding_cache().clear()
+    rerank_cache.get_rerank_cache().close()
+    rerank_cache._rerank_cache = rerank_cache.RerankScoreCache(
+        db_path=os.path.join(cache_dir, f"rerank_{time.monotonic_ns()}.db")
+    )
+
+
+async def _run_pass(queries: list[dict], mode: str) -> list[dict]:
+    """依序執行每個查詢，回傳 (排序後 id、延遲、語意搜尋是否可用)"""
+    import server
+    from search_trace import SearchTrace
+
+    runs = []
+    for item in queries:
+        started = time.perf_counter()
+        ranked, semantic_available, _ = await server.rank_chunks(
+            item["query"], item.get("category", "all"), SearchTrace(), mode=mode
+        )
+        runs.append({
+            "ids": [info["id"] for info in ranked],
+            "ms": (time.perf_counter() - started) * 1000,
+            "semantic_available": semantic_available,
+        })
+    return runs
+
+
+async def run_benchmark(query_set_path: str = DEFAULT_QUERY_SET, modes: tuple = MODES) -> dict:
+    """
+    執行 benchmark
+
+    Returns:
+        報告字典（見模組說明）。語意搜尋不可用時 semantic 模式不執行，
+        hybrid 模式照常量測（即降級後的關鍵字結果），兩者都標記為 available: false
+    """
+    import rerank_cache
+    import server
+    from index_generation import get_generation
+    from onnx_backend import read_inference_backend
+    from vector_search import get_vector_backend
+
+    query_set = load_query_set(query_set_path)
+    queries = query_set["queries"]
+    report = {
+        "query_set": {
+            "path": os.path.relpath(query_set_path, SCRIPT_DIR),
+            "version": query_set["version"],
+            "queries": len(queries),
+        },
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "index_generation": get_generation(server.PERSIST_DIR),
+        "vector_backend": get_vector_backend(),
+        "inference_backend": read_inference_backend(),
+        "k": list(K_VALUES),
+        "load": await _prepare(),
+        "modes": {},
+    }
+
+    original_rerank_cache = rerank_cache._rerank_cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        try:
+            for mode in modes:
+                if mode == "semantic" and report["load"]["vector_index"]["state"] == "failed":
+                    report["modes"][mode] = {"available": False, "metrics": None, "by_category": None,
+                                             "latency": None, "queries": []}
+                    continue
+                _reset_query_caches(cache_dir)
+                cold = await _run_pass(queries, mode)
+                warm = await _run_pass(queries, mode)
+
+                available = mode == "keyword" or all(run["semantic_available"] for run in cold)
+                per_query = []
+                for item, run in zip(queries, cold):
+                    per_query.append({
+                        "id": item["id"],
+                        "category": item.get("category", "all"),
+                        "metrics": evaluate(run["ids"], item["relevant"]),
+                        "top": run["ids"][:REPORT_TOP_N],
+                    })
+
+                by_category = {}
+                for category in sorted({row["category"] for row in per_query}):
+                    by_category[category] = _mean([row["metrics"] for row in per_query if row["category"] == category])
+
+                report["modes"][mode] = {
+                    "available": available,
+                    "metrics": _mean([row["metrics"] for row in per_query]),
+                    "by_category": by_category,
+                    "latency": {
+                        "cold": latency_summary([run["ms"] for run in cold]),
+                        "warm": latency_summary([run["ms"] for run in warm]),
+                    },
+                    "queries": per_query,
+                }
+        finally:
+            rerank_cache.get_rerank_cache().close()
+            rerank_cache._rerank_cache = original_rerank_cache
+
+    return report
+
+
+def evaluate_quantization(query_set_path: str = DEFAULT_QUERY_SET) -> dict | None:
+    """
+    比較各量化格式的矩陣大小與語意搜尋（只用向量、依 category 過濾）指標
+
+    Returns:
+        {格式名稱: {"bytes", "metrics", "delta", "overlap@10"}}，
+        delta 為相對 float32 的指標差，overlap@10 為前 10 名與 float32 相同的比例；
+        向量索引為空或無法使用時回傳 None
+    """
+    import numpy as np
+
+    import server
+    from vector_search import FlatVectorStore, encode_queries, get_vector_store
+
+    source = get_vector_store(server.PERSIST_DIR)
+    try:
+        chunks = source.get_all()
+    except Exception as e:
+        print(f"無法讀取向量索引: {e}")
+        return None
+    if not chunks:
+        return None
+    ids = [chunk["id"] for chunk in chunks]
+    embeddings = source.get_embeddings(ids)
+    vectors = np.asarray([embeddings[chunk_id] for chunk_id in ids], dtype=np.float32)
+
+    queries = load_query_set(query_set_path)["queries"]
+    query_vectors = encode_queries([item["query"] for item in queries])
+
+    results = {}
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype, rescore in QUANTIZATION_VARIANTS:
+            name = f"{dtype}+rescore{rescore}" if rescore else dtype
+            store = FlatVectorStore(os.path.join(tmp, name), dtype=dtype, rescore=rescore)
+            store.upsert(ids, vectors, [chunk["content"] for chunk in chunks], [chunk["metadata"] for chunk in chunks])
+            rankings = _vector_rankings(store, queries, query_vectors)
+            if reference is None:
+                reference = rankings
+            results[name] = {"bytes": store.index_bytes(), **_compare_rankings(rankings, reference, queries)}
+
+    _add_deltas(results, "float32")
+    return results
+
+
+def _vector_rankings(store, queries: list, query_vectors: list) -> list[list[str]]:
+    """每個查詢以向量搜尋（依 category 過濾）得到的前 NDCG_K 名 chunk id"""
+    from keyword_index import get_category_keys
+
+    def in_category(hit: tuple, category: str) -> bool:
+        return category == "all" or category in get_category_keys(hit[2].get("file_path") or hit[0].split("::")[0])
+
+    rankings = []
+    for item, query_vector in zip(queries, query_vectors):
+        category = item.get("category", "all")
+        hits = [hit[0] for hit in store.query(query_vector, 50) if in_category(hit, category)]
+        rankings.append(hits[:NDCG_K])
+    return rankings
+
+
+def _compare_rankings(rankings: list, reference: list, queries: list) -> dict:
+    """指標與前 NDCG_K 名和參考排序的重疊比例"""
+    overlaps = [
+        len(set(ranked) & set(expected)) / len(expected) if expected else 1.0
+        for ranked, expected in zip(rankings, reference)
+    ]
+    return {
+        "metrics": _mean([evaluate(ranked, item["relevant"]) for ranked, item in zip(rankings, queries)]),
+        "overlap@10": round(sum(overlaps) / len(overlaps), 4),
+    }
+
+
+def _add_deltas(results: dict, base_name: str) -> None:
+    base = results[base_name]["metrics"]
+    for result in results.values():
+        result["delta"] = {metric: round(value - base[metric], 4) for metric, value in result["metrics"].items()}
+
+
+def evaluate_chunk_embeddings(query_set_path: str = DEFAULT_QUERY_SET) -> dict | None:
+    """
+    比較 chunk 向量的兩種計算方式（見 chunker.chunk_embeddings_from_sentences）
+
+    重新分段所有文件後，分別以 chunk 全文 encode（encode）與平均分段時的句子向量（pooled）
+    建立 float32 flat 索引，比較語意搜尋指標與 chunk 向量的計算耗時。
+
+    Returns:
+        {"encode": {...}, "pooled": {...}}，各含 "seconds"（chunk 向量計算耗時）、"metrics"、
+        "delta"（相對 encode）、"overlap@10"；"pooled" 另有 "reused"（不需 encode 的 chunk 比例）；
+        沒有文件或模型無法使用時回傳 None
+    """
+    import numpy as np
+
+    from build_index import load_all_documents
+    from chunker import chunk_all_documents, chunk_embeddings_from_sentences
+    from vector_search import FlatVectorStore, encode_queries, get_embedding_model
+
+    documents = load_all_documents()
+    if not documents:
+        return None
+    try:
+        model = get_embedding_model()
+        chunks, sentence_embeddings = chunk_all_documents(documents, with_embeddings=True)
+    except Exception as e:
+        print(f"無法分段: {e}")
+        return None
+    contents = [chunk["content"] for chunk in chunks]
+
+    started = time.perf_counter()
+    encoded = np.asarray(model.encode(contents, show_progress_bar=False), dtype=np.float32)
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    derived = chunk_embeddings_from_sentences(sentence_embeddings, "pooled")
+    missing = [i for i, vector in enumerate(derived) if vector is None]
+    fallback = model.encode([contents[i] for i in missing], show_progress_bar=False) if missing else []
+    for i, vector in zip(missing, fallback):
+        derived[i] = vector
+    pooled = np.asarray(derived, dtype=np.float32)
+    pooled_seconds = time.perf_counter() - started
+
+    queries = load_query_set(query_set_path)["queries"]
+    query_vectors = encode_queries([item["query"] for item in queries])
+    ids = [chunk["id"] for chunk in chunks]
+    metadatas = [chunk["metadata"] for chunk in chunks]
+
+    results = {}
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, vectors, seconds in (("encode", encoded, encode_seconds), ("pooled", pooled, pooled_seconds)):
+            store = FlatVectorStore(os.path.join(tmp, name), dtype="float32", rescore=0)
+            store.upsert(ids, vectors, contents, metadatas)
+            rankings = _vector_rankings(store, queries, query_vectors)
+            if reference is None:
+                reference = rankings
+            results[name] = {"seconds": round(seconds, 3), **_compare_rankings(rankings, reference, queries)}
+
+    results["pooled"]["reused"] = round(1 - len(missing) / len(chunks), 4) if chunks else 0.0
+    _add_deltas(results, "encode")
+    return results
+
+
+def compare_reports(report: dict, baseline: dict, tolerance: float = 0.02,
+                    latency_tolerance: float | None = None) -> list[str]:
+    """
+    與基準報告比較
+
+    Args:
+        tolerance: 品質指標可容許的絕對下降值
+        latency_tolerance: 熱延遲 p95 可容許的增加比例（如 0.5 = 慢 50%），None 時不檢查延遲
+                           （延遲與機器有關，只在同一台機器上的基準才有意義）
+
+    Returns:
+        回歸項目說明（空 list 表示沒有回歸）
+    """
+    if report["query_set"]["version"] != baseline["query_set"]["version"]:
+        return [f"查詢集版本不同（{baseline['query_set']['version']} → {report['query_set']['version']}），請重新產生基準報告"]
+
+    regressions = []
+    for mode, base in baseline["modes"].items():
+        current = report["modes"].get(mode)
+        if current is None or not base["available"]:
+            continue
+        if not current["available"]:
+            regressions.append(f"{mode}: 基準可用，本次不可用")
+            continue
+        for name, base_value in base["metrics"].items():
+            value = current["metrics"].get(name, 0.0)
+            if value < base_value - tolerance:
+                regressions.append(f"{mode} {name}: {base_value:.4f} → {value:.4f}")
+        if latency_tolerance is not None:
+            base_p95 = base["latency"]["warm"]["p95_ms"]
+            p95 = current["latency"]["warm"]["p95_ms"]
+            if p95 > base_p95 * (1 + latency_tolerance):
+                regressions.append(f"{mode} 熱延遲 p95: {base_p95:.1f} ms → {p95:.1f} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="檢索 benchmark（recall@k、MRR、nDCG 與延遲分位數）")
+    parser.add_argument("--queries", default=DEFAULT_QUERY_SET, help="標準查詢集（預設 benchmark_queries.json）")
+    parser.add_argument("--modes", default=",".join(MODES), help="檢索方式，以逗號分隔（keyword,semantic,hybrid）")
+    parser.add_argument("--output", help="報告輸出路徑（預設輸出到 stdout）")
+    parser.add_argument("--baseline", help="基準報告；指標下降超過容許值時 exit 1")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="品質指標可容許的絕對下降值（預設 0.02）")
+    parser.add_argument("--latency-tolerance", type=float, help="熱延遲 p95 可容許的增加比例（預設不檢查）")
+    parser.add_argument("--quantization", action="store_true", help="比較 float32 / float16 / int8 向量的大小與指標")
+    parser.add_argument("--chunk-embeddings", action="store_true",
+                        help="比較 chunk 向量以全文 encode 與平均句子向量（pooled）的指標與耗時")
+    args = parser.parse_args()
+
+    modes = tuple(mode.strip() for mode in args.modes.split(",") if mode.strip())
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"未知的檢索方式: {', '.join(sorted(unknown))}")
+
+    import worker_pool
+    try:
+        # 索引與模型載入的訊息改輸出到 stderr，stdout 只留報告
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run_benchmark(args.queries, modes))
+            if args.quantization:
+                report["quantization"] = evaluate_quantization(args.queries)
+            if args.chunk_embeddings:
+                report["chunk_embeddings"] = evaluate_chunk_embeddings(args.queries)
+    finally:
+        worker_pool.shutdown()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for mode, result in report["modes"].items():
+        note = "" if result["available"] else "（語意搜尋不可用，請執行 build_index.py）"
+        metrics = result["metrics"]
+        if metrics is None:
+            print(f"{mode:>8}: 未執行{note}", file=sys.stderr)
+            continue
+        print(f"{mode:>8}: recall@5={metrics['recall@5']:.3f} mrr={metrics['mrr']:.3f} "
+              f"ndcg@{NDCG_K}={metrics[f'ndcg@{NDCG_K}']:.3f} "
+              f"p95 cold/warm={result['latency']['cold']['p95_ms']:.1f}/{result['latency']['warm']['p95_ms']:.1f} ms{note}",
+              file=sys.stderr)
+
+    if args.quantization:
+        if report["quantization"] is None:
+            print("quantization: 向量索引為空或無法使用（請執行 build_index.py）", file=sys.stderr)
+        for name, result in (report["quantization"] or {}).items():
+            print(f"{name:>16}: {result['bytes'] / 1024:.0f} KiB recall@10={result['metrics']['recall@10']:.3f} "
+                  f"(Δ {result['delta']['recall@10']:+.3f}) overlap@10={result['overlap@10']:.3f}", file=sys.stderr)
+
+    if args.chunk_embeddings:
+        if report["chunk_embeddings"] is None:
+            print("chunk embeddings: 沒有文件或模型無法使用", file=sys.stderr)
+        for name, result in (report["chunk_embeddings"] or {}).items():
+            print(f"{name:>16}: {result['seconds']:.1f} s recall@10={result['metrics']['recall@10']:.3f} "
+                  f"(Δ {result['delta']['recall@10']:+.3f}) overlap@10={result['overlap@10']:.3f}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance, args.latency_tolerance)
+        if regressions:
+            print("❌ 與基準相比出現回歸：", file=sys.stderr)
+            for line in regressions:
+                print(f"  - {line}", file=sys.stderr)
+            return 1
+        print("✅ 沒有回歸", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
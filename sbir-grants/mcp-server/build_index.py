@@ -3,10 +3,36 @@
 建立向量索引腳本（語意分段版）
 
 此腳本會掃描所有 Markdown 文件，進行語意分段，並建立搜尋索引
+（向量寫入 SBIR_VECTOR_BACKEND 設定的向量庫，預設 ChromaDB）
+
+    python build_index.py                # 建立索引（已有索引時詢問是否完整重建）
+    python build_index.py --force        # 已有索引時直接完整重建，不詢問
+    python build_index.py --incremental  # 只重建新增、修改的文件，刪除已移除文件的 chunks
+    python build_index.py --workers 4    # 以 4 個行程平行語意分段（預設讀取 SBIR_CHUNK_WORKERS）
+    python build_index.py --batch-size 128  # encode 批次大小（預設依可用記憶體決定）
+    python build_index.py --json         # stdout 只輸出 JSON 進度（每行一個事件），訊息改寫到 stderr
+    python build_index.py --export-flat  # 把既有 ChromaDB 向量匯出成 flat 向量庫（不重新 encode）
+
+每次建立都寫入新的版本目錄（index_versions/<版本>/，見 index_versions.py），
+檢查 chunk 數與範例查詢後才切換 index_versions/current；執行中的 server 在建立期間繼續使用舊版本，
+切換後自動改用新版本，不需重啟。被取代的版本在寬限期（SBIR_INDEX_GRACE_SECONDS）後刪除。
+
+增量更新依目前版本的 index_manifest.json（見 index_manifest.py）比對文件內容雜湊，
+在目前版本的副本上更新；沒有 manifest，或分段規則、模型、向量庫改變時自動改為完整重建。
+
+完整重建每寫入一批 chunks 在版本目錄記錄一次進度（index_progress.json）；
+中斷後再次執行會沿用該版本目錄，從檢查點繼續，不需詢問或加 --force。
 """
 
-from chunker import chunk_all_documents
-from vector_search import index_documents, get_index_count
+from chunker import chunk_all_documents, chunk_embeddings_from_sentences
+from index_manifest import build_manifest, content_hash, diff_documents, incompatibility, load_manifest, save_manifest
+from keyword_index import build_keyword_index
+from index_versions import (activate_version, collect_garbage, copy_version, create_version, discard_version,
+                            find_resumable_version, resolve_persist_directory, validate_version)
+from vector_search import delete_documents, delete_stale_chunks, get_all_chunks, get_index_count, index_documents
+import argparse
+import contextlib
+import json
 import os
 import sys
 import glob
@@ -85,32 +111,273 @@ def load_all_documents() -> list:
     return documents
 
 
-def main():
+def count_chunks_by_file(chunks: list) -> dict:
+    """{文件路徑: chunk 數}"""
+    counts = {}
+    for chunk in chunks:
+        path = chunk.get("metadata", {}).get("file_path") or chunk["id"].split("::")[0]
+        counts[path] = counts.get(path, 0) + 1
+    return counts
+
+
+def plan_incremental_update(documents: list, persist_directory: str) -> tuple[dict | None, str | None]:
+    """
+    比對 manifest 與目前的文件
+
+    Returns:
+        (diff_documents 的結果, None)，或無法增量更新時 (None, 原因)
+    """
+    manifest = load_manifest(persist_directory)
+    reason = incompatibility(manifest)
+    if reason is None and get_index_count(persist_directory) == 0:
+        reason = "向量索引為空"
+    if reason is not None:
+        return None, reason
+    diff = diff_documents(manifest, documents)
+    diff["chunks"] = {path: info.get("chunks", 0) for path, info in manifest["files"].items()}
+    return diff, None
+
+
+def rebuild_index(documents: list, persist_directory: str, workers: int | None = None,
+                  batch_size: int | None = None, progress=None) -> dict:
+    """
+    完整建立向量索引、關鍵字索引與 manifest（persist_directory 應為新的版本目錄，或留有上次中斷的檢查點）
+
+    workers 為語意分段的行程數（見 chunker.chunk_all_documents）；batch_size 與 progress
+    傳給 vector_search.index_documents
+
+    Returns:
+        {"chunks": chunk 數, "keyword_terms": 關鍵字索引詞彙數}
+    """
+    print("步驟 2/4: 語意分段（首次執行需下載模型，約 500MB）...")
+    print()
+    chunks, sentence_embeddings = chunk_all_documents(documents, workers, with_embeddings=True)
+    print(f"\n  分段完成！{len(documents)} 個文件 → {len(chunks)} 個語意 chunks")
+    if documents:
+        print(f"  平均每文件 {len(chunks) / len(documents):.1f} 個 chunks")
+    print()
+
+    print("步驟 3/4: 建立向量索引...")
+    print()
+    index_documents(chunks, persist_directory, chunk_embeddings_from_sentences(sentence_embeddings),
+                    batch_size=batch_size, checkpoint=True, progress=progress)
+    stale = delete_stale_chunks([chunk["id"] for chunk in chunks], persist_directory)
+    if stale:
+        print(f"  已刪除 {stale} 個不再存在的舊 chunks")
+    print()
+
+    print("步驟 4/4: 建立關鍵字倒排索引...")
+    keyword_index = build_keyword_index(documents, chunks, persist_directory)
+    print(f"  關鍵字索引完成！{len(keyword_index.postings)} 個詞彙")
+
+    counts = count_chunks_by_file(chunks)
+    save_manifest(persist_directory, build_manifest({
+        doc["id"]: {"hash": content_hash(doc["content"]), "chunks": counts.get(doc["id"], 0)}
+        for doc in documents
+    }))
+    return {"chunks": len(chunks), "keyword_terms": len(keyword_index.postings)}
+
+
+def update_index_incrementally(documents: list, persist_directory: str, diff: dict,
+                               workers: int | None = None, batch_size: int | None = None, progress=None) -> dict:
+    """
+    只重新分段、encode 新增與修改的文件，刪除修改與移除文件的舊 chunks
+
+    persist_directory 應為目前版本的副本（見 index_versions.copy_version）。增量更新不記錄檢查點：
+    中斷時尚未切換版本，再次執行會以新的副本重做。
+
+    Args:
+        diff: plan_incremental_update() 的結果
+        workers: 語意分段的行程數（見 chunker.chunk_all_documents）
+        batch_size, progress: 傳給 vector_search.index_documents
+
+    Returns:
+        {"chunks": 新寫入的 chunk 數, "deleted": 刪除的 chunk 數, "keyword_terms": 關鍵字索引詞彙數}
+    """
+    pending = diff["added"] + diff["changed"]
+    print(f"  新增 {len(diff['added'])} 個、修改 {len(diff['changed'])} 個、"
+          f"移除 {len(diff['removed'])} 個、未變動 {len(diff['unchanged'])} 個文件")
+    print()
+
+    if not pending and not diff["removed"]:
+        return {"chunks": 0, "deleted": 0, "keyword_terms": None}
+
+    print("步驟 2/4: 語意分段（只處理新增與修改的文件）...")
+    chunks, sentence_embeddings = chunk_all_documents(pending, workers, with_embeddings=True) if pending else ([], [])
+    print(f"  {len(pending)} 個文件 → {len(chunks)} 個語意 chunks")
+    print()
+
+    print("步驟 3/4: 更新向量索引...")
+    # 以文件路徑刪除舊 chunks（分段數可能改變，不能只靠 id 覆蓋）
+    deleted = delete_documents([doc["id"] for doc in diff["changed"]] + diff["removed"], persist_directory)
+    print(f"  已刪除 {deleted} 個舊 chunks")
+    if chunks:
+        index_documents(chunks, persist_directory, chunk_embeddings_from_sentences(sentence_embeddings),
+                        batch_size=batch_size, progress=progress)
+    print()
+
+    print("步驟 4/4: 重建關鍵字倒排索引（不需模型，使用向量索引中的所有 chunks）...")
+    keyword_index = build_keyword_index(documents, get_all_chunks(persist_directory), persist_directory)
+    print(f"  關鍵字索引完成！{len(keyword_index.postings)} 個詞彙")
+
+    counts = diff["chunks"]
+    counts.update(count_chunks_by_file(chunks))
+    save_manifest(persist_directory, build_manifest({
+        path: {"hash": digest, "chunks": counts.get(path, 0)}
+        for path, digest in diff["hashes"].items()
+    }))
+    return {"chunks": len(chunks), "deleted": deleted, "keyword_terms": len(keyword_index.postings)}
+
+
+def build_version(documents: list, persist_directory: str, diff: dict | None = None, workers: int | None = None,
+                  batch_size: int | None = None, progress=None) -> dict:
+    """
+    在新的版本目錄建立索引，驗證後切換為目前版本（見 index_versions.py）
+
+    diff 為 plan_incremental_update() 的結果時在目前版本的副本上增量更新；為 None 時完整重建
+    （有上次中斷、留有檢查點的版本時沿用該目錄）。驗證未通過時刪除新版本並拋出 RuntimeError，
+    目前版本不變。
+
+    Returns:
+        rebuild_index / update_index_incrementally 的結果，加上
+        {"version": 新版本, "removed_versions": 垃圾回收刪除的舊版本}
+    """
+    current_directory = resolve_persist_directory(persist_directory)
+    if diff is not None:
+        base_count = get_index_count(current_directory)
+        version, directory = copy_version(persist_directory, current_directory)
+        print(f"  新索引版本 {version}（複製目前版本後更新）")
+        result = update_index_incrementally(documents, directory, diff, workers, batch_size, progress)
+        expected = base_count - result["deleted"] + result["chunks"]
+    else:
+        resumable = find_resumable_version(persist_directory)
+        if resumable is not None:
+            version, directory = resumable
+            print(f"  沿用上次中斷的索引版本 {version}，從檢查點繼續")
+        else:
+            version, directory = create_version(persist_directory)
+            print(f"  新索引版本 {version}")
+        print()
+        result = rebuild_index(documents, directory, workers, batch_size, progress)
+        expected = result["chunks"]
+
+    print("驗證新版本索引...")
+    try:
+        validation = validate_version(directory, expected)
+    except RuntimeError:
+        discard_version(persist_directory, version)
+        raise
+    print(f"  {validation['chunks']} 個 chunks，範例查詢 {validation['sample_hits']} 筆結果")
+
+    # 切換 current 並換新世代：server 下一次查詢即改用新版本，搜尋快取中的舊結果失效
+    activate_version(persist_directory, version)
+    print(f"  已切換到索引版本 {version}")
+    removed = collect_garbage(persist_directory)
+    if removed:
+        print(f"  已刪除 {len(removed)} 個超過寬限期的舊版本")
+    return {**result, "version": version, "removed_versions": removed}
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="建立 SBIR 知識庫的向量索引與關鍵字索引")
+    parser.add_argument("--force", action="store_true", help="已有索引時直接完整重建，不詢問")
+    parser.add_argument("--incremental", action="store_true", help="只重建新增、修改的文件")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="語意分段的行程數（預設讀取 SBIR_CHUNK_WORKERS）")
+    parser.add_argument("--batch-size", type=int, default=None, help="encode 批次大小（預設依可用記憶體決定）")
+    parser.add_argument("--json", action="store_true", help="stdout 只輸出 JSON 進度事件，其他訊息寫到 stderr")
+    parser.add_argument("--export-flat", action="store_true", help="把既有 ChromaDB 向量匯出成 flat 向量庫")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers 需要一個正整數")
+    if args.batch_size is not None and args.batch_size < 1:
+        parser.error("--batch-size 需要一個正整數")
+    return args
+
+
+@contextlib.contextmanager
+def json_output():
+    """
+    --json 模式：把 stdout（包含平行分段子行程的輸出）導向 stderr，
+    產生一個只寫入原本 stdout 的 emit(event) 函式
+    """
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    saved_stdout = sys.stdout
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    out = os.fdopen(saved_fd, "w", encoding="utf-8", closefd=False)
+
+    def emit(event: dict) -> None:
+        out.write(json.dumps(event, ensure_ascii=False) + "\n")
+        out.flush()
+
+    try:
+        yield emit
+    finally:
+        out.close()
+        sys.stdout.flush()
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+        sys.stdout = saved_stdout
+
+
+def confirm_rebuild(existing_count: int) -> bool:
+    """已有索引時詢問是否完整重建（非互動環境不詢問，視為取消）"""
+    print(f"發現現有索引，包含 {existing_count} 個 chunks")
+    print("（只想更新有變動的文件，請改用 --incremental；不詢問直接重建請加 --force）")
+    if not sys.stdin.isatty():
+        print("非互動環境，無法確認是否重新建立索引")
+        return False
+    try:
+        response = input("是否重新建立索引？(y/N): ").strip().lower()
+    except EOFError:
+        return False
+    return response == 'y'
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+    if not args.json:
+        return run(args, lambda event: None)
+    with json_output() as emit:
+        return run(args, emit)
+
+
+def run(args: argparse.Namespace, emit) -> int:
+    """執行建立索引；emit(event) 接收 JSON 進度事件（非 --json 模式時忽略）"""
+    if args.export_flat:
+        from vector_search import export_flat_index
+        count = export_flat_index(PERSIST_DIR)
+        if count == 0:
+            print("ChromaDB 索引為空，請先執行 build_index.py")
+            emit({"event": "error", "message": "ChromaDB 索引為空"})
+            return 1
+        print(f"✅ 已匯出 {count} 個 chunks 到 flat 向量庫，設定 SBIR_VECTOR_BACKEND=flat 即可使用")
+        emit({"event": "done", "mode": "export-flat", "chunks": count})
+        return 0
+
     print("=" * 50)
     print("SBIR 知識庫向量索引建立工具")
     print("（語意分段版 v2.0）")
     print("=" * 50)
     print()
 
-    # 檢查現有索引
+    # 檢查現有索引（新版本建立完成前現有索引繼續使用；留有檢查點時從檢查點繼續，不需確認）
     existing_count = get_index_count(PERSIST_DIR)
-    if existing_count > 0:
-        print(f"發現現有索引，包含 {existing_count} 個 chunks")
-        response = input("是否重新建立索引？(y/N): ").strip().lower()
-        if response != 'y':
+    resumable = None if args.incremental else find_resumable_version(PERSIST_DIR)
+    if resumable is not None:
+        print(f"發現未完成的索引建立進度（版本 {resumable[0]}），將從檢查點繼續")
+        print()
+    elif not args.incremental and existing_count > 0:
+        if not args.force and not confirm_rebuild(existing_count):
             print("取消操作")
-            return
+            emit({"event": "cancelled", "existing_chunks": existing_count})
+            return 1
         print()
 
-        # 清除現有索引
-        import shutil
-        if os.path.exists(PERSIST_DIR):
-            shutil.rmtree(PERSIST_DIR)
-            print("已清除現有索引")
-            print()
-
     # 載入文件
-    print("步驟 1/3: 載入知識庫文件...")
+    print("步驟 1/4: 載入知識庫文件...")
     documents = load_all_documents()
     print(f"  找到 {len(documents)} 個 Markdown 文件")
 
@@ -125,42 +392,48 @@ def main():
         print(f"    {cat}: {count} 個")
     print()
 
-    # 語意分段
-    print("步驟 2/3: 語意分段（首次執行需下載模型，約 500MB）...")
-    print()
-
-    try:
-        chunks = chunk_all_documents(documents)
-        print(f"\n  分段完成！{len(documents)} 個文件 → {len(chunks)} 個語意 chunks")
-        print(f"  平均每文件 {len(chunks) / len(documents):.1f} 個 chunks")
-    except Exception as e:
-        print(f"\n語意分段失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return 1
+    diff = None
+    if args.incremental:
+        diff, reason = plan_incremental_update(documents, resolve_persist_directory(PERSIST_DIR))
+        if diff is None:
+            print(f"無法增量更新：{reason}，改為完整重建")
+            print()
 
-    print()
+    mode = "full" if diff is None else "incremental"
+    emit({"event": "start", "mode": mode, "documents": len(documents)})
 
-    # 建立索引
-    print("步驟 3/3: 建立向量索引...")
-    print()
+    def progress(done: int, total: int) -> None:
+        emit({"event": "progress", "done": done, "total": total})
 
     try:
-        index_documents(chunks, PERSIST_DIR)
+        if diff is not None and not (diff["added"] or diff["changed"] or diff["removed"]):
+            # 沒有變動：不建立新版本
+            result = {"chunks": 0, "deleted": 0, "keyword_terms": None}
+        else:
+            result = build_version(documents, PERSIST_DIR, diff, args.workers, args.batch_size, progress)
     except Exception as e:
         print(f"\n建立索引失敗: {e}")
         import traceback
         traceback.print_exc()
+        emit({"event": "error", "message": str(e)})
         return 1
 
     print()
     print("=" * 50)
-    print("✅ 索引建立完成！")
-    print(f"   索引位置: {PERSIST_DIR}")
-    print(f"   原始文件: {len(documents)} 個")
-    print(f"   語意 chunks: {len(chunks)} 個")
+    if diff is not None and result["keyword_terms"] is None:
+        print("✅ 沒有文件變動，索引已是最新！")
+    elif diff is not None:
+        print("✅ 索引增量更新完成！")
+        print(f"   重新索引: {len(diff['added']) + len(diff['changed'])} 個文件（{result['chunks']} 個 chunks）")
+        print(f"   移除文件: {len(diff['removed'])} 個（刪除 {result['deleted']} 個舊 chunks）")
+    else:
+        print("✅ 索引建立完成！")
+        print(f"   原始文件: {len(documents)} 個")
+        print(f"   語意 chunks: {result['chunks']} 個")
+    print(f"   索引位置: {resolve_persist_directory(PERSIST_DIR)}")
     print("=" * 50)
 
+    emit({"event": "done", "mode": mode, "documents": len(documents), **result})
     return 0
 
 
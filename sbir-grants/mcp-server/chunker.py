@@ -4,23 +4,24 @@
 使用 embedding 相似度偵測語意邊界，實現真正的語意分段
 """
 
+import os
 import re
+import time
 import numpy as np
 from typing import Dict, Tuple
 
-# 懶加載的全域變數
-_embedding_model = None
+# Embedding 模型與 vector_search 共用同一份
+from model_registry import get_embedding_model
 
+# 分段規則的版本：改變分段邏輯或預設參數時遞增，build_index.py --incremental 會因此完整重建
+CHUNKER_VERSION = 2
 
-def get_embedding_model():
-    """懶加載 Embedding 模型"""
-    global _embedding_model
-    if _embedding_model is None:
-        from sentence_transformers import SentenceTransformer
-        print("正在載入 Embedding 模型...")
-        _embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        print("Embedding 模型載入完成")
-    return _embedding_model
+# 平行分段的行程數（build_index.py --workers 可覆寫）
+CHUNK_WORKERS_ENV = "SBIR_CHUNK_WORKERS"
+
+# chunk 向量的計算方式：encode（以 chunk 全文重新 encode）或 pooled（平均分段時的句子向量）
+CHUNK_EMBEDDING_ENV = "SBIR_CHUNK_EMBEDDING"
+CHUNK_EMBEDDING_MODES = ("encode", "pooled")
 
 
 def extract_frontmatter(content: str) -> Tuple[Dict, str]:
@@ -124,6 +125,26 @@ def semantic_chunk(
     Returns:
         list of chunks with metadata
     """
+    return semantic_chunk_with_embeddings(
+        content, filename, file_path, min_chunk_size, max_chunk_size, threshold_percentile
+    )[0]
+
+
+def semantic_chunk_with_embeddings(
+    content: str,
+    filename: str,
+    file_path: str,
+    min_chunk_size: int = 50,
+    max_chunk_size: int = 800,
+    threshold_percentile: int = 25
+) -> tuple[list[dict], list[np.ndarray | None]]:
+    """
+    語意分段，並保留找邊界時算出的句子 embeddings（參數同 semantic_chunk）
+
+    Returns:
+        (chunks, 每個 chunk 所含句子的 embeddings)；後者依 chunk 順序，
+        每項為 (句子數, 維度) 的陣列，沒有 encode 句子的短文件為 None
+    """
     # 0. 提取 frontmatter
     frontmatter, content = extract_frontmatter(content)
 
@@ -152,7 +173,7 @@ def semantic_chunk(
             "id": f"{file_path}::0",
             "content": content.strip(),
             "metadata": metadata
-        }]
+        }], [None]
 
     # 2. 計算 embeddings
     model = get_embedding_model()
@@ -242,37 +263,152 @@ def semantic_chunk(
             "metadata": metadata
         })
 
-    return result
+    # 7. 每個 chunk 是連續的句子（以換行相接），依序對應回句子 embeddings
+    sentence_embeddings = []
+    start = 0
+    for chunk_text in merged_chunks:
+        end = start + chunk_text.count('\n') + 1
+        sentence_embeddings.append(np.asarray(embeddings[start:end]))
+        start = end
+    if start != len(sentences):
+        # 對應不上時（不應發生）寧可讓呼叫端重新 encode
+        sentence_embeddings = [None] * len(result)
+
+    return result, sentence_embeddings
+
+
+def read_chunk_embedding_mode() -> str:
+    """SBIR_CHUNK_EMBEDDING（未設定或無效時為 encode）"""
+    mode = os.environ.get(CHUNK_EMBEDDING_ENV, "encode").strip().lower()
+    if mode not in CHUNK_EMBEDDING_MODES:
+        print(f"未知的 chunk 向量計算方式 {CHUNK_EMBEDDING_ENV}={mode!r}，改用 encode")
+        return "encode"
+    return mode
+
+
+def pool_sentence_embeddings(sentence_embeddings: np.ndarray) -> np.ndarray:
+    """句子向量 → chunk 向量（L2 正規化後取平均，再正規化）"""
+    vectors = np.asarray(sentence_embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    pooled = (vectors / np.where(norms > 0, norms, 1.0)).mean(axis=0)
+    norm = float(np.linalg.norm(pooled))
+    return pooled / norm if norm > 0 else pooled
+
 
+def chunk_embeddings_from_sentences(sentence_embeddings: list, mode: str | None = None) -> list[np.ndarray | None]:
+    """
+    由分段時的句子 embeddings 推得 chunk 向量（None 表示需要以 chunk 全文重新 encode）
 
-def chunk_all_documents(documents: list[dict]) -> list[dict]:
+    - 只有一個句子的 chunk：內容就是該句，兩種模式都直接沿用
+    - encode（預設）：其餘 chunk 重新 encode，向量與完整重建相同
+    - pooled：其餘 chunk 取句子向量的平均（pool_sentence_embeddings），不再 encode
+    """
+    mode = mode or read_chunk_embedding_mode()
+    vectors = []
+    for members in sentence_embeddings:
+        if members is None or len(members) == 0:
+            vectors.append(None)
+        elif len(members) == 1:
+            vectors.append(np.asarray(members[0], dtype=np.float32))
+        elif mode == "pooled":
+            vectors.append(pool_sentence_embeddings(members))
+        else:
+            vectors.append(None)
+    return vectors
+
+
+def read_chunk_workers() -> int:
+    """SBIR_CHUNK_WORKERS（未設定或無效時為 1，即依序分段）"""
+    value = os.environ.get(CHUNK_WORKERS_ENV, "1").strip()
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"{CHUNK_WORKERS_ENV}={value!r} 不是有效的整數，改為依序分段")
+        return 1
+
+
+def count_sentences(content: str) -> int:
+    """semantic_chunk 會 encode 的句子數"""
+    return len(split_chinese_sentences(extract_frontmatter(content)[1]))
+
+
+def _chunk_document(doc: dict) -> tuple[list[dict], list[np.ndarray | None]]:
+    file_path = doc["id"]
+    filename = doc["metadata"].get("filename", file_path.split("/")[-1])
+    return semantic_chunk_with_embeddings(
+        content=doc["content"],
+        filename=filename,
+        file_path=file_path
+    )
+
+
+def _init_chunk_worker(specs: dict, threads: int) -> None:
+    """子行程初始化：以主行程的模型設定建立自己的註冊表（每個子行程一份模型）"""
+    import model_registry
+    model_registry._model_registry = model_registry.ModelRegistry(specs)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def chunk_all_documents(documents: list[dict], workers: int | None = None, with_embeddings: bool = False):
     """
     對所有文件進行語意分段
 
     Args:
         documents: [{"id": "path", "content": "...", "metadata": {...}}, ...]
+        workers: 分段的行程數（None 時讀取 SBIR_CHUNK_WORKERS）；大於 1 時以 process pool
+            平行分段，每個子行程載入一份模型，結果的內容與順序與依序分段相同
+        with_embeddings: 一併回傳每個 chunk 的句子 embeddings（見 semantic_chunk_with_embeddings）
 
     Returns:
-        chunked documents
+        chunked documents；with_embeddings 時為 (chunks, 句子 embeddings)
     """
+    workers = min(workers or read_chunk_workers(), max(1, len(documents)))
+    started = time.perf_counter()
     all_chunks = []
+    all_embeddings = []
 
-    for i, doc in enumerate(documents):
-        file_path = doc["id"]
-        filename = doc["metadata"].get("filename", file_path.split("/")[-1])
-        content = doc["content"]
-
+    def report(i: int, doc: dict) -> None:
+        filename = doc["metadata"].get("filename", doc["id"].split("/")[-1])
         print(f"  分段中 ({i+1}/{len(documents)}): {filename}")
 
-        chunks = semantic_chunk(
-            content=content,
-            filename=filename,
-            file_path=file_path
-        )
-
-        all_chunks.extend(chunks)
-
-    return all_chunks
+    if workers <= 1:
+        for i, doc in enumerate(documents):
+            report(i, doc)
+            chunks, embeddings = _chunk_document(doc)
+            all_chunks.extend(chunks)
+            all_embeddings.extend(embeddings)
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        from model_registry import get_model_registry
+
+        # spawn：不繼承主行程已載入的模型與執行緒狀態，各平台行為一致
+        # 每個子行程分到的 PyTorch 執行緒數加總不超過 CPU 核心數
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_chunk_worker,
+            initargs=(get_model_registry().specs, threads),
+        ) as executor:
+            # map 依輸入順序回傳，與依序分段的輸出順序相同
+            for i, (doc, (chunks, embeddings)) in enumerate(zip(documents, executor.map(_chunk_document, documents))):
+                report(i, doc)
+                all_chunks.extend(chunks)
+                all_embeddings.extend(embeddings)
+
+    seconds = time.perf_counter() - started
+    if documents and seconds > 0:
+        sentences = sum(count_sentences(doc["content"]) for doc in documents)
+        print(f"  分段速度：{len(documents) / seconds:.1f} 文件/秒、{sentences / seconds:.1f} 句/秒"
+              f"（{workers} 個行程，{seconds:.1f} 秒）")
+
+    return (all_chunks, all_embeddings) if with_embeddings else all_chunks
 
 
 if __name__ == "__main__":
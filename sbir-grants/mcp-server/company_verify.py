@@ -1,7 +1,11 @@
-import urllib.request
-import urllib.parse
 import json
 
+import httpx
+
+# g0v 公司資料 API（非同步請求，不阻塞 MCP event loop）
+G0V_SEARCH_URL = "https://company.g0v.ronny.tw/api/search"
+G0V_TIMEOUT_SECONDS = 15.0
+
 
 async def MCP_verify_company_eligibility_by_g0v(company_name: str, capital_from_user: str | None = None, employee_size_from_user: str | None = None) -> str:
     """
@@ -11,16 +15,16 @@ async def MCP_verify_company_eligibility_by_g0v(company_name: str, capital_from_
         return json.dumps({"error": "請提供公司名稱"}, ensure_ascii=False)
 
     try:
-        url = f"https://company.g0v.ronny.tw/api/search?q={urllib.parse.quote(company_name)}&page=0"
-        req = urllib.request.Request(
-            url,
-            headers={'Accept': 'application/json', 'User-Agent': 'SBIR-Assistant-Skill/1.0'}
-        )
-
-        with urllib.request.urlopen(req) as response:
-            if response.status != 200:
-                return json.dumps({"error": f"g0v API 請求失敗，狀態碼：{response.status}"}, ensure_ascii=False)
-            data = json.loads(response.read().decode('utf-8'))
+        async with httpx.AsyncClient(timeout=G0V_TIMEOUT_SECONDS) as client:
+            response = await client.get(
+                G0V_SEARCH_URL,
+                params={"q": company_name, "page": 0},
+                headers={'Accept': 'application/json', 'User-Agent': 'SBIR-Assistant-Skill/1.0'}
+            )
+
+        if response.status_code != 200:
+            return json.dumps({"error": f"g0v API 請求失敗，狀態碼：{response.status_code}"}, ensure_ascii=False)
+        data = response.json()
 
     except Exception as e:
         return json.dumps({"error": f"連線或解析 g0v API 失敗: {str(e)}"}, ensure_ascii=False)
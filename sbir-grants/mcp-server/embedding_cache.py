@@ -0,0 +1,110 @@
+"""
+查詢向量快取模組 - 重複查詢不重新 encode
+
+search_cache 只快取最終的 markdown 結果，換 category 或結果未寫入快取時，
+同一個查詢字串仍會重新跑一次 Embedding 模型（每次數十毫秒）。
+這裡以「模型名稱 + 正規化後的查詢字串」為 key 快取查詢向量，
+語意搜尋與其他需要查詢向量的呼叫端共用（見 vector_search.encode_queries）。
+"""
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """全形轉半形（NFKC）、合併連續空白（不轉小寫：Embedding 模型區分大小寫）"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query or "")).strip()
+
+
+class QueryEmbeddingCache:
+    """查詢向量快取（LRU 策略；worker 執行緒會同時存取，以 lock 保護）"""
+
+    def __init__(self, max_size: int = 512):
+        """
+        初始化快取
+
+        Args:
+            max_size: 最大快取數量（384 維 float 約 3 KB / 筆）
+        """
+        self.cache: OrderedDict[tuple[str, str], tuple[float, ...]] = OrderedDict()
+        self.max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, query: str) -> Optional[list[float]]:
+        """
+        獲取查詢向量。命中時將項目移至尾端（最近使用）。
+
+        Args:
+            model_name: Embedding 模型名稱
+            query: 已正規化的查詢字串
+
+        Returns:
+            查詢向量，不存在時返回 None
+        """
+        key = (model_name, query)
+        with self._lock:
+            embedding = self.cache.get(key)
+            if embedding is None:
+                self._misses += 1
+                return None
+            self.cache.move_to_end(key)
+            self._hits += 1
+            return list(embedding)
+
+    def set(self, model_name: str, query: str, embedding) -> None:
+        """
+        設定查詢向量。若超過容量則淘汰最舊項目。
+
+        Args:
+            model_name: Embedding 模型名稱
+            query: 已正規化的查詢字串
+            embedding: 查詢向量
+        """
+        key = (model_name, query)
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            elif len(self.cache) >= self.max_size:
+                self.cache.popitem(last=False)
+            self.cache[key] = tuple(float(x) for x in embedding)
+
+    def clear(self) -> None:
+        """清空快取"""
+        with self._lock:
+            self.cache.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self) -> dict:
+        """
+        獲取快取統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            hit_rate = self._hits / total if total > 0 else 0.0
+            return {
+                "size": len(self.cache),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": f"{hit_rate:.1%}",
+            }
+
+
+# 全域快取實例
+_embedding_cache = QueryEmbeddingCache()
+
+
+def get_embedding_cache() -> QueryEmbeddingCache:
+    """獲取全域查詢向量快取"""
+    return _embedding_cache
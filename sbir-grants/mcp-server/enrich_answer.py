@@ -14,6 +14,7 @@ import re
 from pathlib import Path
 from typing import Any
 
+from keyword_matcher import KeywordMatcher
 from roi_calculator import calculate_roi
 
 SHARED_DOMAIN_DIR = Path(__file__).parent.parent.parent / "shared_domain"
@@ -66,6 +67,22 @@ BUSINESS_MODEL_ALIAS_GROUPS: list[tuple[str, list[str]]] = [
     ("其他", ["其他"]),
 ]
 
+# 自由文字判斷「一次性收費」的兩組線索（需同時命中）
+BUSINESS_MODEL_FEE_TOKENS = ["收", "費", "報價", "課金", "付"]
+BUSINESS_MODEL_ONE_OFF_TOKENS = ["企劃書", "提案", "專案", "一次", "生成"]
+
+# 別名群組編譯成自動機，回答只需掃描一次（輸入已是 normalize_text().lower()）
+INDUSTRY_ALIAS_MATCHER = KeywordMatcher(
+    (alias for _, aliases in INDUSTRY_ALIAS_GROUPS for alias in aliases),
+    normalizer=str.lower,
+)
+BUSINESS_MODEL_ALIAS_MATCHER = KeywordMatcher(
+    [alias for _, aliases in BUSINESS_MODEL_ALIAS_GROUPS for alias in aliases]
+    + BUSINESS_MODEL_FEE_TOKENS
+    + BUSINESS_MODEL_ONE_OFF_TOKENS,
+    normalizer=str.lower,
+)
+
 
 def normalize_text(value: str) -> str:
     return (
@@ -130,17 +147,19 @@ def infer_choice_option(question_id: str, answer: str) -> str | None:
             return option
 
     if question_id == "industry":
+        found = INDUSTRY_ALIAS_MATCHER.found(normalized)
         for option, aliases in INDUSTRY_ALIAS_GROUPS:
-            if any(alias in normalized for alias in aliases):
+            if any(alias in found for alias in aliases):
                 return option
 
     if question_id == "business_model":
+        found = BUSINESS_MODEL_ALIAS_MATCHER.found(normalized)
         for option, aliases in BUSINESS_MODEL_ALIAS_GROUPS:
-            if any(alias in normalized for alias in aliases):
+            if any(alias in found for alias in aliases):
                 return option
         if (
-            any(token in normalized for token in ["收", "費", "報價", "課金", "付"])
-            and any(token in normalized for token in ["企劃書", "提案", "專案", "一次", "生成"])
+            any(token in found for token in BUSINESS_MODEL_FEE_TOKENS)
+            and any(token in found for token in BUSINESS_MODEL_ONE_OFF_TOKENS)
         ):
             return "一次性銷售（賣斷）"
 
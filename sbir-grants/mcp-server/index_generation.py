@@ -0,0 +1,50 @@
+"""
+索引世代模組 - 知識庫索引每次變動就換一個世代 id
+
+搜尋結果快取（見 search_cache.py）以世代 id 標記每筆結果：
+build_index.py 重建索引、ingest 寫入新的 chunk、update_knowledge_base 拉到新文件時
+呼叫 bump_generation()，舊世代的快取就不會再被取用，不必靠 TTL 猜測何時過期。
+
+世代 id 存在 chroma_db 同層的 index_generation 檔案（與 keyword_index.json 相同位置），
+server 與 build_index.py 是不同行程，透過檔案共享。
+"""
+
+import os
+import secrets
+import time
+
+GENERATION_FILENAME = "index_generation"
+
+# 尚未有任何索引變動紀錄時的世代
+INITIAL_GENERATION = "0"
+
+
+def get_generation_path(persist_directory: str) -> str:
+    """世代檔案路徑（chroma_db 同層）"""
+    return os.path.join(os.path.dirname(os.path.abspath(persist_directory)), GENERATION_FILENAME)
+
+
+def get_generation(persist_directory: str) -> str:
+    """目前的索引世代 id"""
+    try:
+        with open(get_generation_path(persist_directory), 'r', encoding='utf-8') as f:
+            return f.read().strip() or INITIAL_GENERATION
+    except OSError:
+        return INITIAL_GENERATION
+
+
+def bump_generation(persist_directory: str) -> str:
+    """
+    產生新的世代 id 並寫入（原子寫入，讀取端不會讀到一半的檔案）
+
+    Returns:
+        新的世代 id
+    """
+    generation = f"{time.time_ns():x}-{secrets.token_hex(4)}"
+    path = get_generation_path(persist_directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(generation)
+    os.replace(tmp_path, path)
+    return generation
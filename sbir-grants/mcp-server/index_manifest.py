@@ -0,0 +1,126 @@
+"""
+索引 manifest - 記錄已建立索引的每個文件的內容雜湊
+
+build_index.py 原本只能整個重建：清掉 chroma_db，重新分段、encode 所有 Markdown 文件，
+即使 update_knowledge_base 只拉到一個文件的修改。完成索引時寫入 manifest：
+
+    {
+      "version": 1,
+      "chunker_version": 2,
+      "model": "paraphrase-multilingual-MiniLM-L12-v2",
+      "chunk_embedding": "encode",
+      "vector_backend": "chroma",
+      "files": {"references/foo.md": {"hash": "<sha256>", "chunks": 12}, ...}
+    }
+
+build_index.py --incremental 依此只重新分段、encode 新增或內容改變的文件，並刪除已移除文件的 chunks。
+分段規則、Embedding 模型、chunk 向量計算方式或向量庫改變時 manifest 失效，需完整重建。
+
+manifest 存在各索引版本的 persist_directory（index_versions/<版本>/chroma_db/，見 index_versions.py）中，
+增量更新複製目前版本時一併複製，完整重建的新版本從空目錄開始。
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(persist_directory: str) -> str:
+    return os.path.join(persist_directory, MANIFEST_FILENAME)
+
+
+def content_hash(content: str) -> str:
+    """文件內容的 SHA-256"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def current_settings() -> dict:
+    """影響 chunk 與向量內容的設定；任何一項改變都需要完整重建"""
+    from chunker import CHUNKER_VERSION, read_chunk_embedding_mode
+    from model_registry import EMBEDDING_MODEL_NAME
+    from vector_search import get_vector_backend
+
+    return {
+        "chunker_version": CHUNKER_VERSION,
+        "model": EMBEDDING_MODEL_NAME,
+        "chunk_embedding": read_chunk_embedding_mode(),
+        "vector_backend": get_vector_backend(),
+    }
+
+
+def build_manifest(files: dict, settings: dict | None = None) -> dict:
+    """
+    Args:
+        files: {文件路徑: {"hash": 內容雜湊, "chunks": chunk 數}}
+    """
+    return {"version": MANIFEST_VERSION, **(settings or current_settings()), "files": files}
+
+
+def load_manifest(persist_directory: str) -> dict | None:
+    """讀取 manifest（不存在或無法解析時回傳 None）"""
+    try:
+        with open(get_manifest_path(persist_directory), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict) else None
+
+
+def save_manifest(persist_directory: str, manifest: dict) -> None:
+    """原子寫入 manifest"""
+    os.makedirs(persist_directory, exist_ok=True)
+    path = get_manifest_path(persist_directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def incompatibility(manifest: dict | None, settings: dict | None = None) -> str | None:
+    """manifest 不能用於增量更新的原因（可以使用時回傳 None）"""
+    if manifest is None:
+        return "找不到索引 manifest"
+    if manifest.get("version") != MANIFEST_VERSION:
+        return f"manifest 版本不符（{manifest.get('version')}）"
+    settings = settings or current_settings()
+    labels = {
+        "chunker_version": "分段規則版本",
+        "model": "Embedding 模型",
+        "chunk_embedding": "chunk 向量計算方式",
+        "vector_backend": "向量庫",
+    }
+    for key, label in labels.items():
+        if manifest.get(key) != settings[key]:
+            return f"{label}已改變（{manifest.get(key)} → {settings[key]}）"
+    return None
+
+
+def diff_documents(manifest: dict, documents: list) -> dict:
+    """
+    比對 manifest 與目前的文件
+
+    Args:
+        documents: build_index.load_all_documents() 的輸出
+
+    Returns:
+        {"added": [文件], "changed": [文件], "removed": [路徑], "unchanged": [路徑],
+         "hashes": {路徑: 內容雜湊}}
+    """
+    indexed = manifest["files"]
+    result = {"added": [], "changed": [], "removed": [], "unchanged": [], "hashes": {}}
+    for doc in documents:
+        path = doc["id"]
+        digest = content_hash(doc["content"])
+        result["hashes"][path] = digest
+        if path not in indexed:
+            result["added"].append(doc)
+        elif indexed[path].get("hash") != digest:
+            result["changed"].append(doc)
+        else:
+            result["unchanged"].append(path)
+    current = set(result["hashes"])
+    result["removed"] = sorted(path for path in indexed if path not in current)
+    return result
@@ -0,0 +1,248 @@
+"""
+索引版本 - 每次建立索引寫入新的版本目錄，驗證後原子切換
+
+build_index.py 原本先刪除 chroma_db 再就地重建：執行中的 MCP server 在重建期間查詢會出錯，
+或繼續拿著已刪除目錄的 ChromaDB client。改為每次建立都寫入新的版本目錄：
+
+    index_versions/
+      current                      # 目前版本名稱（os.replace 原子切換）
+      <版本>/chroma_db/            # 該版本的向量庫、manifest、建立進度檢查點
+      <版本>/keyword_index.json    # 該版本的關鍵字索引
+      <版本>/retired               # 被取代的時間（垃圾回收依此計算寬限期）
+
+1. build_index.py 在新版本目錄建立索引（增量更新先複製目前版本再更新）
+2. validate_version 檢查 chunk 數與範例查詢，未通過時不切換，server 繼續使用舊版本
+3. activate_version 切換 current 並換新索引世代；server 的 vector_search.get_vector_store、
+   keyword_index.get_keyword_index 以 resolve_persist_directory 取得目前版本目錄，
+   察覺切換後開啟新目錄，不需重啟
+4. 被取代的版本保留 SBIR_INDEX_GRACE_SECONDS 秒（讓進行中的查詢完成）後由 collect_garbage 刪除
+
+尚未有 current 時 resolve_persist_directory 回傳原本的 chroma_db（舊版就地建立的索引仍可使用）。
+chroma_db 另存有 ingest_reference_document.py 匯入的參考文件，不屬於任何版本，不會被刪除。
+"""
+
+import os
+import secrets
+import shutil
+import time
+
+VERSIONS_DIRNAME = "index_versions"
+POINTER_FILENAME = "current"
+RETIRED_FILENAME = "retired"
+
+GRACE_ENV = "SBIR_INDEX_GRACE_SECONDS"
+DEFAULT_GRACE_SECONDS = 600
+
+# {current 檔路徑: ((mtime_ns, inode, size), 版本的 persist_directory)}
+_resolved = {}
+
+
+def get_versions_root(persist_directory: str) -> str:
+    """版本目錄的上層（chroma_db 同層的 index_versions/）"""
+    return os.path.join(os.path.dirname(os.path.abspath(persist_directory)), VERSIONS_DIRNAME)
+
+
+def version_persist_directory(persist_directory: str, version: str) -> str:
+    """版本內的 persist_directory（與原本的目錄同名，如 index_versions/<版本>/chroma_db）"""
+    return os.path.join(get_versions_root(persist_directory), version, os.path.basename(os.path.abspath(persist_directory)))
+
+
+def current_version(persist_directory: str) -> str | None:
+    """目前使用中的版本名稱（尚未有版本時為 None）"""
+    try:
+        with open(os.path.join(get_versions_root(persist_directory), POINTER_FILENAME), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve_persist_directory(persist_directory: str) -> str:
+    """
+    實際存放目前索引的目錄
+
+    每次呼叫只 stat current 檔；切換版本時 os.replace 換上新檔（inode 改變），下次呼叫即回傳新目錄。
+    沒有 current 或指向的目錄不存在時回傳 persist_directory 本身。
+    """
+    pointer = os.path.join(get_versions_root(persist_directory), POINTER_FILENAME)
+    try:
+        stat = os.stat(pointer)
+    except OSError:
+        return persist_directory
+    key = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    cached = _resolved.get(pointer)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    version = current_version(persist_directory)
+    directory = version_persist_directory(persist_directory, version) if version else None
+    if directory is None or not os.path.isdir(directory):
+        return persist_directory
+    _resolved[pointer] = (key, directory)
+    return directory
+
+
+def create_version(persist_directory: str) -> tuple[str, str]:
+    """
+    建立新的空版本目錄
+
+    Returns:
+        (版本名稱, 版本的 persist_directory)
+    """
+    version = f"{time.time_ns():x}-{secrets.token_hex(4)}"
+    directory = version_persist_directory(persist_directory, version)
+    os.makedirs(directory)
+    return version, directory
+
+
+def copy_version(persist_directory: str, source_directory: str) -> tuple[str, str]:
+    """以 source_directory（目前版本）的內容建立新版本，供增量更新在副本上修改"""
+    from vector_search import CHECKPOINT_FILENAME
+
+    version, directory = create_version(persist_directory)
+    shutil.copytree(source_directory, directory, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns(CHECKPOINT_FILENAME, "*.tmp"))
+    return version, directory
+
+
+def list_versions(persist_directory: str) -> list[str]:
+    """所有版本名稱（依建立時間排序）"""
+    root = get_versions_root(persist_directory)
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return []
+    return sorted(name for name in names if os.path.isdir(os.path.join(root, name)))
+
+
+def find_resumable_version(persist_directory: str) -> tuple[str, str] | None:
+    """
+    上次中斷、留有建立進度檢查點的版本（見 vector_search.index_documents）
+
+    Returns:
+        (版本名稱, 版本的 persist_directory)，沒有時為 None
+    """
+    from vector_search import CHECKPOINT_FILENAME
+
+    current = current_version(persist_directory)
+    for version in reversed(list_versions(persist_directory)):
+        if version == current or _retired_at(persist_directory, version) is not None:
+            continue
+        directory = version_persist_directory(persist_directory, version)
+        if os.path.exists(os.path.join(directory, CHECKPOINT_FILENAME)):
+            return version, directory
+    return None
+
+
+def validate_version(directory: str, expected_chunks: int) -> dict:
+    """
+    切換前檢查新版本：chunk 數與預期相同，且以其中一個 chunk 的內容查詢能取得結果
+
+    Raises:
+        RuntimeError: 檢查未通過
+
+    Returns:
+        {"chunks": chunk 數, "sample_hits": 範例查詢的結果數}
+    """
+    from vector_search import get_all_chunks, get_index_count, semantic_search
+
+    count = get_index_count(directory)
+    if count != expected_chunks:
+        raise RuntimeError(f"新版本索引有 {count} 個 chunks，預期 {expected_chunks} 個")
+    if count == 0:
+        return {"chunks": 0, "sample_hits": 0}
+
+    sample = next((chunk["content"] for chunk in get_all_chunks(directory) if chunk["content"].strip()), "")
+    hits = semantic_search(sample[:500], directory, n_results=5) if sample else []
+    if not hits:
+        raise RuntimeError("新版本索引的範例查詢沒有結果")
+    return {"chunks": count, "sample_hits": len(hits)}
+
+
+def activate_version(persist_directory: str, version: str) -> str:
+    """
+    原子切換 current 到 version，標記舊版本的淘汰時間並換新索引世代
+
+    Returns:
+        新的索引世代 id
+    """
+    from index_generation import bump_generation
+
+    root = get_versions_root(persist_directory)
+    previous = current_version(persist_directory)
+    pointer = os.path.join(root, POINTER_FILENAME)
+    tmp_path = pointer + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, pointer)
+
+    if previous and previous != version and os.path.isdir(os.path.join(root, previous)):
+        with open(os.path.join(root, previous, RETIRED_FILENAME), 'w', encoding='utf-8') as f:
+            f.write(str(time.time()))
+    # 搜尋快取中舊版本的結果失效
+    return bump_generation(persist_directory)
+
+
+def discard_version(persist_directory: str, version: str) -> None:
+    """刪除未啟用的版本（驗證失敗時）"""
+    if version == current_version(persist_directory):
+        raise ValueError(f"不能刪除使用中的版本 {version}")
+    shutil.rmtree(os.path.join(get_versions_root(persist_directory), version), ignore_errors=True)
+
+
+def read_grace_seconds() -> float:
+    """SBIR_INDEX_GRACE_SECONDS（未設定或無效時為 DEFAULT_GRACE_SECONDS）"""
+    value = os.environ.get(GRACE_ENV)
+    if value is None:
+        return DEFAULT_GRACE_SECONDS
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        print(f"{GRACE_ENV}={value!r} 不是有效的秒數，改用 {DEFAULT_GRACE_SECONDS}")
+        return DEFAULT_GRACE_SECONDS
+
+
+def _retired_at(persist_directory: str, version: str) -> float | None:
+    try:
+        with open(os.path.join(get_versions_root(persist_directory), version, RETIRED_FILENAME), 'r', encoding='utf-8') as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def collect_garbage(persist_directory: str, grace_seconds: float | None = None, now: float | None = None) -> list[str]:
+    """
+    刪除超過寬限期的舊版本
+
+    - 被取代的版本：淘汰超過 grace_seconds 秒後刪除
+    - 從未啟用的版本（建立失敗或中斷）：留有檢查點的保留供繼續建立，其餘在目錄超過寬限期未修改後刪除
+
+    Returns:
+        刪除的版本名稱
+    """
+    from vector_search import CHECKPOINT_FILENAME
+
+    grace = read_grace_seconds() if grace_seconds is None else grace_seconds
+    now = time.time() if now is None else now
+    root = get_versions_root(persist_directory)
+    current = current_version(persist_directory)
+    removed = []
+    for version in list_versions(persist_directory):
+        if version == current:
+            continue
+        retired = _retired_at(persist_directory, version)
+        if retired is None:
+            directory = version_persist_directory(persist_directory, version)
+            if os.path.exists(os.path.join(directory, CHECKPOINT_FILENAME)):
+                continue
+            try:
+                retired = os.path.getmtime(directory)
+            except OSError:
+                retired = os.path.getmtime(os.path.join(root, version))
+        if now - retired < grace:
+            continue
+        try:
+            shutil.rmtree(os.path.join(root, version))
+            removed.append(version)
+        except OSError as e:
+            print(f"刪除舊索引版本 {version} 失敗: {e}")
+    return removed
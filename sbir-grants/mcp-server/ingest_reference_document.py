@@ -9,6 +9,9 @@ import json
 import sys
 from pathlib import Path
 from chunker import semantic_chunk
+from index_generation import bump_generation
+from vector_quantization import encode_blob, read_vector_dtype
+from worker_pool import run_blocking
 
 
 def read_document_content(document_path: Path) -> str:
@@ -72,12 +75,13 @@ def chunk_text(text: str, chunk_size: int = 500) -> list:
 def get_real_embedding(text: str, model=None):
     """
     使用 sentence-transformers 生成真實 embedding
+    （model 為 None 時使用 model_registry 共用的模型，不會重新載入權重）
     回傳 list[float]
     """
     try:
         if model is None:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+            from model_registry import get_embedding_model
+            model = get_embedding_model()
         vector = model.encode(text, show_progress_bar=False)
         return vector.tolist()
     except ImportError:
@@ -120,7 +124,7 @@ def setup_sqlite_fallback(db_path: Path):
             document_name TEXT NOT NULL,
             chunk_content TEXT NOT NULL,
             sbir_tags TEXT NOT NULL,
-            embedding TEXT NOT NULL,
+            embedding BLOB NOT NULL,  -- vector_quantization.encode_blob（舊資料為 JSON 文字）
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
@@ -160,14 +164,15 @@ def ingest_document(document_path: Path, sbir_tags: list, db_base_path: Path | N
     # 嘗試使用 ChromaDB
     chroma_collection = setup_chroma_db(db_base_path / "chroma_db")
 
+    # 整個 process 共用同一份模型（ChromaDB 與 SQLite 路徑皆同）
+    try:
+        from model_registry import get_embedding_model
+        model = get_embedding_model()
+    except ImportError:
+        model = None
+
     if chroma_collection is not None:
         # 使用 ChromaDB + 真實 embedding
-        try:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        except ImportError:
-            model = None
-
         ids = []
         embeddings = []
         documents = []
@@ -209,16 +214,18 @@ def ingest_document(document_path: Path, sbir_tags: list, db_base_path: Path | N
 
             for chunk_dict in chunk_dicts:
                 chunk_content = chunk_dict["content"]
-                embedding = get_real_embedding(chunk_content)
+                embedding = get_real_embedding(chunk_content, model)
                 cursor.execute('''
                     INSERT INTO document_chunks (document_name, chunk_content, sbir_tags, embedding)
                     VALUES (?, ?, ?, ?)
-                ''', (document_path.name, chunk_content, tags_json, json.dumps(embedding)))
+                ''', (document_path.name, chunk_content, tags_json, encode_blob(embedding, read_vector_dtype())))
 
             conn.commit()
         finally:
             conn.close()
 
+    # 知識庫內容改變，讓搜尋快取中的舊結果失效
+    bump_generation(str(db_base_path / "chroma_db"))
     return len(chunk_dicts)
 
 
@@ -241,7 +248,7 @@ async def MCP_ingest_reference_document(file_path: str, tags: list | None = None
                 f"支援格式：{', '.join(sorted(ALLOWED_EXTENSIONS))}"
             )
 
-        chunks_created = ingest_document(path_obj, tags, db_base)
+        chunks_created = await run_blocking(ingest_document, path_obj, tags, db_base)
 
         return (
             f"✅ 成功匯入 **{path_obj.name}**\n\n"
@@ -271,11 +278,12 @@ async def MCP_read_document_for_tagging(file_path: str) -> str:
                 f"支援格式：{', '.join(sorted(ALLOWED_EXTENSIONS))}"
             )
 
-        content = read_document_content(path_obj)
+        content = await run_blocking(read_document_content, path_obj)
         if not content.strip():
             return f"❌ 文件內容為空：{path_obj.name}"
 
-        chunk_dicts = semantic_chunk(
+        chunk_dicts = await run_blocking(
+            semantic_chunk,
             content=content,
             filename=path_obj.name,
             file_path=str(path_obj)
@@ -301,6 +309,72 @@ async def MCP_read_document_for_tagging(file_path: str) -> str:
         return f"❌ 操作失敗：{e} - {str(e)}"
 
 
+def store_tagged_chunks(path_obj: Path, chunk_dicts: list, tags_map: dict, db_base: Path) -> None:
+    """把帶標籤的 chunk 寫入 ChromaDB（無法使用時寫入 SQLite fallback）"""
+    chroma_collection = setup_chroma_db(db_base / "chroma_db")
+
+    # 整個 process 共用同一份模型（ChromaDB 與 SQLite 路徑皆同）
+    try:
+        from model_registry import get_embedding_model
+        model = get_embedding_model()
+    except ImportError:
+        model = None
+
+    if chroma_collection is not None:
+        ids = []
+        embeddings = []
+        documents = []
+        metadatas = []
+
+        for i, chunk_dict in enumerate(chunk_dicts):
+            chunk_content = chunk_dict["content"]
+            chunk_id = f"{path_obj.stem}_{i}"
+            ids.append(chunk_id)
+            embeddings.append(get_real_embedding(chunk_content, model))
+            documents.append(chunk_content)
+
+            meta = chunk_dict["metadata"].copy()
+            meta["document_name"] = path_obj.name
+
+            tags = tags_map.get(i, [])
+            meta["sbir_tags"] = json.dumps(tags, ensure_ascii=False)
+
+            meta = {k: v for k, v in meta.items() if v is not None}
+            metadatas.append(meta)
+
+        try:
+            existing = chroma_collection.get(where={"document_name": path_obj.name})
+            if existing["ids"]:
+                chroma_collection.delete(ids=existing["ids"])
+        except Exception:
+            pass
+
+        chroma_collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    else:
+        conn = setup_sqlite_fallback(db_base / "local_skill.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM document_chunks WHERE document_name = ?", (path_obj.name,))
+
+            for i, chunk_dict in enumerate(chunk_dicts):
+                chunk_content = chunk_dict["content"]
+                embedding = get_real_embedding(chunk_content, model)
+
+                tags = tags_map.get(i, [])
+                tags_json = json.dumps(tags, ensure_ascii=False)
+
+                cursor.execute('''
+                    INSERT INTO document_chunks (document_name, chunk_content, sbir_tags, embedding)
+                    VALUES (?, ?, ?, ?)
+                ''', (path_obj.name, chunk_content, tags_json, encode_blob(embedding, read_vector_dtype())))
+            conn.commit()
+        finally:
+            conn.close()
+
+    bump_generation(str(db_base / "chroma_db"))
+
+
 async def MCP_ingest_tagged_chunks(file_path: str, tagged_chunks: str, db_path: str | None = None) -> str:
     """
     讓 Claude 把打好標籤的 chunk_index 存入知識庫。
@@ -317,11 +391,12 @@ async def MCP_ingest_tagged_chunks(file_path: str, tagged_chunks: str, db_path:
 
         tags_map = {item.get("chunk_index"): item.get("tags", []) for item in tagged_data if "chunk_index" in item}
 
-        content = read_document_content(path_obj)
+        content = await run_blocking(read_document_content, path_obj)
         if not content.strip():
             return f"❌ 文件內容為空：{path_obj.name}"
 
-        chunk_dicts = semantic_chunk(
+        chunk_dicts = await run_blocking(
+            semantic_chunk,
             content=content,
             filename=path_obj.name,
             file_path=str(path_obj)
@@ -330,65 +405,7 @@ async def MCP_ingest_tagged_chunks(file_path: str, tagged_chunks: str, db_path:
         if not chunk_dicts:
             return f"❌ 文件切分失敗或無有效內容：{path_obj.name}"
 
-        chroma_collection = setup_chroma_db(db_base / "chroma_db")
-
-        if chroma_collection is not None:
-            try:
-                from sentence_transformers import SentenceTransformer
-                model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-            except ImportError:
-                model = None
-
-            ids = []
-            embeddings = []
-            documents = []
-            metadatas = []
-
-            for i, chunk_dict in enumerate(chunk_dicts):
-                chunk_content = chunk_dict["content"]
-                chunk_id = f"{path_obj.stem}_{i}"
-                ids.append(chunk_id)
-                embeddings.append(get_real_embedding(chunk_content, model))
-                documents.append(chunk_content)
-
-                meta = chunk_dict["metadata"].copy()
-                meta["document_name"] = path_obj.name
-
-                tags = tags_map.get(i, [])
-                meta["sbir_tags"] = json.dumps(tags, ensure_ascii=False)
-
-                meta = {k: v for k, v in meta.items() if v is not None}
-                metadatas.append(meta)
-
-            try:
-                existing = chroma_collection.get(where={"document_name": path_obj.name})
-                if existing["ids"]:
-                    chroma_collection.delete(ids=existing["ids"])
-            except Exception:
-                pass
-
-            chroma_collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
-
-        else:
-            conn = setup_sqlite_fallback(db_base / "local_skill.db")
-            try:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM document_chunks WHERE document_name = ?", (path_obj.name,))
-
-                for i, chunk_dict in enumerate(chunk_dicts):
-                    chunk_content = chunk_dict["content"]
-                    embedding = get_real_embedding(chunk_content)
-
-                    tags = tags_map.get(i, [])
-                    tags_json = json.dumps(tags, ensure_ascii=False)
-
-                    cursor.execute('''
-                        INSERT INTO document_chunks (document_name, chunk_content, sbir_tags, embedding)
-                        VALUES (?, ?, ?, ?)
-                    ''', (path_obj.name, chunk_content, tags_json, json.dumps(embedding)))
-                conn.commit()
-            finally:
-                conn.close()
+        await run_blocking(store_tagged_chunks, path_obj, chunk_dicts, tags_map, db_base)
 
         return f"✅ 成功將 **{path_obj.name}** {len(chunk_dicts)} 個帶有客製化標籤的語意段落存入知識庫。"
 
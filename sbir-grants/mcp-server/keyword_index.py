@@ -0,0 +1,427 @@
+"""
+關鍵字倒排索引 - 知識庫關鍵字搜尋核心模組
+
+由 build_index.py 預先建立 term → postings（檔案層級與 chunk 層級、分欄位詞頻），
+持久化於 chroma_db 旁。搜尋時以 BM25F 對命中的 postings 做向量化評分，
+不再逐檔 glob + 讀取。
+
+chunk 使用與 chunker.semantic_chunk 相同的 id（`path::chunk_3`），並保存內容與 metadata，
+因此關鍵字結果可與 Chroma 語意結果在同一組 chunk 上融合，rerank 也不必重新開檔。
+"""
+
+import fnmatch
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from tokenizer import tokenize, query_terms
+
+# 索引檔案（與 chroma_db 放在同一層）
+INDEX_FILENAME = "keyword_index.json"
+INDEX_VERSION = 4
+
+# 類別過濾：與 search_knowledge_base 原本的 glob pattern 對應（相對於專案根目錄）
+CATEGORY_PATTERNS = {
+    "methodology": "references/methodology_*.md",
+    "faq": "faq/*.md",
+    "checklist": "checklists/*.md",
+    "case_study": "examples/case_studies/*.md",
+    "template": "templates/*.md",
+}
+
+# 保存於 chunk 的 metadata 欄位（搜尋結果顯示用）
+CHUNK_METADATA_KEYS = ("file", "file_path", "chunk_index", "preview", "source_url", "source_title", "source_date")
+
+# BM25F 參數：欄位權重與長度正規化強度（載入時套用，調整不需重建索引）
+FIELDS = ("filename", "headings", "source_title", "body")
+FIELD_WEIGHTS = {"filename": 3.0, "headings": 2.0, "source_title": 2.0, "body": 1.0}
+FIELD_B = {"filename": 0.3, "headings": 0.5, "source_title": 0.3, "body": 0.75}
+BM25_K1 = 1.2
+
+_HEADING_PATTERN = re.compile(r'^#{1,6}\s+(.+)$', re.MULTILINE)
+
+# 懶加載的全域變數
+_keyword_index = None
+# (索引檔路徑, mtime)：換版（見 index_versions.py）或重建後重新載入
+_keyword_index_key = None
+_keyword_index_lock = threading.Lock()
+
+
+def get_category_keys(path: str) -> list[str]:
+    """根據相對路徑判斷文件屬於哪些搜尋類別（對應 CATEGORY_PATTERNS 的 key）"""
+    normalized = path.replace(os.sep, "/")
+    return [
+        key for key, pattern in CATEGORY_PATTERNS.items()
+        if fnmatch.fnmatchcase(normalized, pattern) and normalized.count("/") == pattern.count("/")
+    ]
+
+
+def split_fields(content: str, filename: str, source_title: str = "") -> dict[str, str]:
+    """將文件內容拆成 BM25F 欄位：檔名、Markdown 標題、frontmatter 來源標題、內文"""
+    headings = _HEADING_PATTERN.findall(content)
+    body = _HEADING_PATTERN.sub("", content)
+    return {
+        "filename": filename,
+        "headings": "\n".join(headings),
+        "source_title": source_title or "",
+        "body": body,
+    }
+
+
+class _FieldTable:
+    """一組索引單位（文件或 chunk）的分欄位詞頻與長度"""
+
+    def __init__(self, lengths: dict, postings: dict):
+        """
+        Args:
+            lengths: field → [每個單位的 term 數]
+            postings: field → {term: {unit_idx: tf}}
+        """
+        self.lengths = lengths
+        self.postings = postings
+        self.size = len(next(iter(lengths.values()), []))
+        self._prepare()
+
+    @classmethod
+    def build(cls, field_texts: list[dict]) -> "_FieldTable":
+        lengths: dict[str, list[int]] = {f: [] for f in FIELDS}
+        postings: dict[str, dict[str, dict[int, int]]] = {f: {} for f in FIELDS}
+        for unit_idx, texts in enumerate(field_texts):
+            for field in FIELDS:
+                terms = tokenize(texts.get(field, ""))
+                lengths[field].append(len(terms))
+                for term, tf in Counter(terms).items():
+                    postings[field].setdefault(term, {})[unit_idx] = tf
+        return cls(lengths, postings)
+
+    def to_json(self) -> dict:
+        return {
+            "lengths": self.lengths,
+            "postings": {f: {t: list(p.items()) for t, p in ps.items()} for f, ps in self.postings.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "_FieldTable":
+        postings = {
+            f: {t: {int(i): tf for i, tf in p} for t, p in ps.items()}
+            for f, ps in data["postings"].items()
+        }
+        return cls(data["lengths"], postings)
+
+    def _prepare(self) -> None:
+        """預先計算 BM25F 的加權詞頻 postings 與 IDF 表"""
+        norms = {}
+        for field in FIELDS:
+            lengths = np.asarray(self.lengths.get(field, [0] * self.size), dtype=np.float32)
+            mean = float(lengths.mean()) if self.size else 0.0
+            avg = mean if mean > 0 else 1.0
+            norms[field] = 1.0 - FIELD_B[field] + FIELD_B[field] * lengths / avg
+
+        weighted: dict[str, dict[int, float]] = {}
+        for field in FIELDS:
+            weight = FIELD_WEIGHTS[field]
+            norm = norms[field]
+            for term, p in self.postings.get(field, {}).items():
+                acc = weighted.setdefault(term, {})
+                for unit_idx, tf in p.items():
+                    acc[unit_idx] = acc.get(unit_idx, 0.0) + weight * tf / float(norm[unit_idx])
+
+        # term → (排序後的單位位置, 加權詞頻)
+        self.weighted_postings = {}
+        self.idf = {}
+        for term, acc in weighted.items():
+            units = np.fromiter(sorted(acc), dtype=np.int32, count=len(acc))
+            self.weighted_postings[term] = (units, np.array([acc[int(u)] for u in units], dtype=np.float32))
+            self.idf[term] = self.compute_idf(len(acc))
+
+    def compute_idf(self, df: int) -> float:
+        return math.log(1.0 + (self.size - df + 0.5) / (df + 0.5))
+
+    def score(self, weighted_keywords: list[tuple[str, float]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        BM25F 評分
+
+        多 term 關鍵字（見 tokenizer.query_terms）以 postings 交集為命中單位，
+        加權詞頻取各 term 最小值、IDF 以交集大小估計。
+
+        Returns:
+            (每個單位的分數, 每個單位命中的關鍵字數)
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        matched = np.zeros(self.size, dtype=np.int32)
+
+        for keyword, query_weight in weighted_keywords:
+            terms = query_terms(keyword)
+            lists = [self.weighted_postings.get(term) for term in terms]
+            if not lists or any(p is None for p in lists):
+                continue
+
+            lists.sort(key=lambda p: len(p[0]))
+            units, tfs = lists[0]
+            for other_units, other_tfs in lists[1:]:
+                units, left, right = np.intersect1d(units, other_units, assume_unique=True, return_indices=True)
+                tfs = np.minimum(tfs[left], other_tfs[right])
+                if len(units) == 0:
+                    break
+            if len(units) == 0:
+                continue
+
+            idf = self.idf[terms[0]] if len(terms) == 1 else self.compute_idf(len(units))
+            scores[units] += query_weight * idf * tfs * (BM25_K1 + 1) / (tfs + BM25_K1)
+            matched[units] += 1
+
+        return scores, matched
+
+
+class KeywordIndex:
+    """知識庫倒排索引（檔案層級與 chunk 層級，BM25F 評分）"""
+
+    def __init__(self, docs: list, chunks: list, doc_table: _FieldTable, chunk_table: _FieldTable):
+        """
+        Args:
+            docs: [{"path", "name", "categories"}, ...]，以 list 位置作為 doc id
+            chunks: [{"id", "doc", "content", "metadata"}, ...]，doc 為所屬文件的位置
+            doc_table: 文件層級的分欄位詞頻
+            chunk_table: chunk 層級的分欄位詞頻
+        """
+        self.docs = docs
+        self.chunks = chunks
+        self.doc_table = doc_table
+        self.chunk_table = chunk_table
+        self._category_masks = {
+            key: np.array([key in doc["categories"] for doc in docs], dtype=bool)
+            for key in CATEGORY_PATTERNS
+        }
+        chunk_docs = np.array([chunk["doc"] for chunk in chunks], dtype=np.int64)
+        self._chunk_category_masks = {
+            key: mask[chunk_docs] if len(chunk_docs) else np.zeros(0, dtype=bool)
+            for key, mask in self._category_masks.items()
+        }
+
+    @property
+    def postings(self) -> dict:
+        """文件層級的詞彙表（term → 加權 postings）"""
+        return self.doc_table.weighted_postings
+
+    @classmethod
+    def build(cls, documents: list, chunks: list | None = None) -> "KeywordIndex":
+        """
+        從文件（及語意 chunks）建立索引
+
+        Args:
+            documents: build_index.load_all_documents() 的輸出
+            chunks: chunker.chunk_all_documents() 的輸出（可選；未提供時每個文件視為單一 chunk `path::0`）
+        """
+        from chunker import extract_frontmatter
+
+        docs = []
+        doc_positions = {}
+        doc_fields = []
+        whole_doc_chunks = []
+
+        for doc in documents:
+            path = doc["id"]
+            name = doc.get("metadata", {}).get("filename", os.path.basename(path))
+            frontmatter, content = extract_frontmatter(doc["content"])
+            doc_positions[path] = len(docs)
+            docs.append({"path": path, "name": name, "categories": get_category_keys(path)})
+            doc_fields.append(split_fields(content, name, str(frontmatter.get("source_title") or "")))
+
+            # 與 chunker.semantic_chunk 的單一 chunk 格式一致
+            metadata = {"file": name, "file_path": path, "chunk_index": 0}
+            for key in ("source_url", "source_title", "source_date"):
+                if frontmatter.get(key):
+                    metadata[key] = str(frontmatter[key])
+            whole_doc_chunks.append({"id": f"{path}::0", "content": content.strip(), "metadata": metadata})
+
+        if chunks is None:
+            chunks = whole_doc_chunks
+
+        index_chunks = []
+        chunk_fields = []
+        for chunk in chunks:
+            metadata = chunk.get("metadata", {})
+            doc_path = metadata.get("file_path") or chunk["id"].split("::")[0]
+            if doc_path not in doc_positions:
+                continue
+            doc_idx = doc_positions[doc_path]
+            index_chunks.append({
+                "id": chunk["id"],
+                "doc": doc_idx,
+                "content": chunk["content"],
+                "metadata": {k: metadata[k] for k in CHUNK_METADATA_KEYS if metadata.get(k) is not None},
+            })
+            chunk_fields.append(split_fields(
+                chunk["content"],
+                docs[doc_idx]["name"],
+                str(metadata.get("source_title") or ""),
+            ))
+
+        return cls(docs, index_chunks, _FieldTable.build(doc_fields), _FieldTable.build(chunk_fields))
+
+    def save(self, index_path: str) -> None:
+        """寫入 JSON（先寫暫存檔再 rename，避免讀到寫一半的索引）"""
+        data = {
+            "version": INDEX_VERSION,
+            "docs": self.docs,
+            "chunks": self.chunks,
+            "doc_table": self.doc_table.to_json(),
+            "chunk_table": self.chunk_table.to_json(),
+        }
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path: str) -> "KeywordIndex":
+        """從 JSON 載入索引"""
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"關鍵字索引版本不符（{data.get('version')}），請重新執行 build_index.py")
+
+        return cls(
+            data["docs"],
+            data["chunks"],
+            _FieldTable.from_json(data["doc_table"]),
+            _FieldTable.from_json(data["chunk_table"]),
+        )
+
+    def search(self, keywords: list, category: str = "all") -> dict:
+        """
+        關鍵字搜尋（檔案層級，BM25F）
+
+        Args:
+            keywords: 關鍵字列表，或 (關鍵字, 查詢權重) 列表（見 query_expansion.get_weighted_keywords）
+            category: 類別過濾（CATEGORY_PATTERNS 的 key 或 "all"）
+
+        Returns: {
+            "references/foo.md": {"path", "name", "keyword_score", "matched_keywords"},
+            ...
+        }
+        """
+        weighted = [(kw, 1.0) if isinstance(kw, str) else (kw[0], float(kw[1])) for kw in keywords]
+        scores, matched = self.doc_table.score(weighted)
+
+        if category != "all":
+            mask = self._category_masks.get(category)
+            if mask is not None:
+                scores = np.where(mask, scores, 0.0)
+
+        results = {}
+        for doc_idx in np.flatnonzero(scores > 0):
+            doc = self.docs[doc_idx]
+            results[doc["path"]] = {
+                "path": doc["path"],
+                "name": doc["name"],
+                "keyword_score": float(scores[doc_idx]),
+                "matched_keywords": int(matched[doc_idx]),
+            }
+        return results
+
+    def search_chunks(self, keywords: list, category: str = "all", top_k: int = 30) -> list[dict]:
+        """
+        關鍵字搜尋（chunk 層級，BM25F），供混合搜尋與語意結果融合
+
+        Returns: 依分數排序的前 top_k 個 chunk：[
+            {"id": "references/foo.md::chunk_3", "path", "name", "content", "metadata",
+             "keyword_score", "matched_keywords"},
+            ...
+        ]
+        """
+        weighted = [(kw, 1.0) if isinstance(kw, str) else (kw[0], float(kw[1])) for kw in keywords]
+        scores, matched = self.chunk_table.score(weighted)
+
+        if category != "all":
+            mask = self._chunk_category_masks.get(category)
+            if mask is not None:
+                scores = np.where(mask, scores, 0.0)
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+
+        results = []
+        for chunk_idx in hits:
+            chunk = self.chunks[chunk_idx]
+            doc = self.docs[chunk["doc"]]
+            results.append({
+                "id": chunk["id"],
+                "path": doc["path"],
+                "name": doc["name"],
+                "content": chunk["content"],
+                "metadata": chunk["metadata"],
+                "keyword_score": float(scores[chunk_idx]),
+                "matched_keywords": int(matched[chunk_idx]),
+            })
+        return results
+
+
+def build_keyword_index(documents: list, chunks: list | None, persist_directory: str) -> KeywordIndex:
+    """建立並持久化關鍵字索引（build_index.py 使用）"""
+    index = KeywordIndex.build(documents, chunks)
+    index.save(os.path.join(os.path.dirname(os.path.abspath(persist_directory)), INDEX_FILENAME))
+    return index
+
+
+def get_keyword_index(persist_directory: str) -> KeywordIndex:
+    """
+    取得關鍵字索引
+
+    優先載入 build_index.py 產生的索引檔（檔案更新或索引換版時自動重新載入）；
+    若尚未建立，則從 Markdown 檔案即時建立索引並快取於記憶體
+    （chunk 取自既有的 Chroma 向量索引，沒有向量索引時每個文件視為單一 chunk）。
+    """
+    global _keyword_index, _keyword_index_key
+
+    from index_versions import resolve_persist_directory
+
+    # 索引檔在目前版本的 persist_directory 同層
+    index_path = os.path.join(os.path.dirname(os.path.abspath(resolve_persist_directory(persist_directory))), INDEX_FILENAME)
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        mtime = None
+    key = (index_path, mtime)
+
+    if _keyword_index is not None and key == _keyword_index_key:
+        return _keyword_index
+
+    # server 的 worker 執行緒可能同時要求索引，只讓一個執行緒載入或建立
+    with _keyword_index_lock:
+        if _keyword_index is not None and key == _keyword_index_key:
+            return _keyword_index
+
+        if mtime is not None:
+            try:
+                _keyword_index = KeywordIndex.load(index_path)
+                _keyword_index_key = key
+                return _keyword_index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"載入關鍵字索引失敗，改為即時建立: {e}")
+
+        from build_index import load_all_documents
+        chunks = None
+        try:
+            from vector_search import get_all_chunks, needs_reindex
+            if not needs_reindex(persist_directory):
+                chunks = get_all_chunks(persist_directory)
+        except Exception as e:
+            print(f"無法從向量索引取得 chunks，改以文件為單位: {e}")
+
+        _keyword_index = KeywordIndex.build(load_all_documents(), chunks)
+        _keyword_index_key = key
+        return _keyword_index
+
+
+def get_loaded_keyword_index() -> KeywordIndex | None:
+    """已載入的關鍵字索引（尚未載入時回傳 None，不觸發載入；供狀態查詢使用）"""
+    return _keyword_index
@@ -0,0 +1,123 @@
+"""
+多關鍵字比對模組（Aho–Corasick）
+
+計畫書檢核、品質審查、同義詞偵測、答案別名判斷都是「一段文字 × 一大串關鍵字」，
+逐一 `keyword in text` 會對同一段文字掃描數十次。這裡把關鍵字編譯成一個自動機，
+只需線性掃描文字一次，就能取得所有關鍵字的出現位置與次數。
+
+Example:
+    >>> matcher = KeywordMatcher(["TAM", "市場規模", "M1"], whole_word=True)
+    >>> matcher.found("TAM 與市場規模，M12 里程碑")
+    {"TAM", "市場規模"}
+"""
+
+from collections import Counter, deque
+from typing import Callable, Iterable, Iterator
+
+from tokenizer import normalize
+
+
+def _is_latin(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+class KeywordMatcher:
+    """編譯後的多關鍵字自動機（建立一次，可重複比對多段文字）"""
+
+    def __init__(
+        self,
+        patterns: Iterable[str],
+        normalizer: Callable[[str], str] = normalize,
+        whole_word: bool = False,
+    ):
+        """
+        Args:
+            patterns: 關鍵字列表（可重複，回傳時保留原始寫法）
+            normalizer: 關鍵字與文字比對前的正規化（預設 NFKC + 小寫）
+            whole_word: True 時英數關鍵字（全 ASCII）需落在單字邊界（"TA" 不命中 "data"）
+        """
+        self.normalizer = normalizer
+        self.whole_word = whole_word
+
+        # 正規化後的 key → 原始寫法（"Phase 1" 與 "phase 1" 共用同一個 key）
+        self.originals: dict[str, list[str]] = {}
+        for pattern in patterns:
+            key = normalizer(pattern)
+            if key:
+                self.originals.setdefault(key, [])
+                if pattern not in self.originals[key]:
+                    self.originals[key].append(pattern)
+
+        self._latin_keys = {key for key in self.originals if key.isascii()}
+        self._build(list(self.originals))
+
+    def _build(self, keys: list[str]) -> None:
+        """建立 goto / fail / output 表"""
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[str]] = [[]]
+
+        for key in keys:
+            state = 0
+            for char in key:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = nxt
+            self._output[state].append(key)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def _at_boundary(self, text: str, start: int, end: int) -> bool:
+        if start > 0 and _is_latin(text[start]) and _is_latin(text[start - 1]):
+            return False
+        if end < len(text) and _is_latin(text[end - 1]) and _is_latin(text[end]):
+            return False
+        return True
+
+    def finditer(self, text: str) -> Iterator[tuple[int, int, str]]:
+        """
+        一次掃描找出所有命中（含重疊）
+
+        Yields:
+            (start, end, key)，位置以正規化後的文字計算
+        """
+        text = self.normalizer(text or "")
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for key in output[state]:
+                start = i + 1 - len(key)
+                if self.whole_word and key in self._latin_keys and not self._at_boundary(text, start, i + 1):
+                    continue
+                yield start, i + 1, key
+
+    def counts(self, text: str) -> Counter:
+        """每個關鍵字（原始寫法）的出現次數"""
+        key_counts = Counter(key for _, _, key in self.finditer(text))
+        result: Counter = Counter()
+        for key, count in key_counts.items():
+            for pattern in self.originals[key]:
+                result[pattern] = count
+        return result
+
+    def found(self, text: str) -> set[str]:
+        """出現過的關鍵字（原始寫法）"""
+        return set(self.counts(text))
@@ -0,0 +1,217 @@
+"""
+模型註冊表 - 整個 process 共用的 Embedding / Re-ranking 模型
+
+原本 vector_search、chunker 各自懶加載一份 paraphrase-multilingual-MiniLM-L12-v2，
+ingest_reference_document 更是每次匯入文件（SQLite 路徑甚至每個 chunk）都重新建立模型。
+所有模組改由這裡取得模型：
+- 每種模型在每個 process 最多載入一次（載入期間其他執行緒等待同一份）
+- unload() 釋放模型，下次取得時重新載入
+- stats() 回報載入耗時、實際使用的推論後端與記憶體用量
+
+載入經由 onnx_backend，依 SBIR_INFERENCE_BACKEND 選擇 PyTorch 或 ONNX。
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+
+EMBEDDING = "embedding"
+RERANK = "rerank"
+
+EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+RERANK_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+MODEL_LABELS = {
+    EMBEDDING: "Embedding",
+    RERANK: "Re-ranking",
+}
+
+
+def _load_embedding(model_name: str):
+    from onnx_backend import load_embedding_model
+    return load_embedding_model(model_name)
+
+
+def _load_rerank(model_name: str):
+    from onnx_backend import load_rerank_model
+    return load_rerank_model(model_name)
+
+
+def current_rss_bytes() -> int | None:
+    """
+    目前 process 的常駐記憶體（RSS）
+
+    Linux 讀 /proc/self/statm；其他平台以 getrusage 的峰值代替，無法取得時為 None。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 單位為 bytes，其餘為 KB
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def available_memory_bytes() -> int | None:
+    """
+    目前可用的實體記憶體
+
+    Linux 讀 /proc/meminfo 的 MemAvailable；其他支援 sysconf 的平台以可用頁數計算，無法取得時為 None。
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _parameter_bytes(model) -> int | None:
+    """PyTorch 模型的權重大小（ONNX 模型沒有 torch 參數，回傳 None）"""
+    for module in (model, getattr(model, "model", None)):
+        try:
+            total = sum(p.numel() * p.element_size() for p in module.parameters())
+        except Exception:
+            continue
+        if total:
+            return total
+    return None
+
+
+class ModelRegistry:
+    """依種類（EMBEDDING / RERANK）保存已載入的模型"""
+
+    def __init__(self, specs: dict | None = None):
+        # kind → (模型名稱, 載入函式)
+        self._specs = specs or {
+            EMBEDDING: (EMBEDDING_MODEL_NAME, _load_embedding),
+            RERANK: (RERANK_MODEL_NAME, _load_rerank),
+        }
+        self._models: dict = {}
+        self._info: dict[str, dict] = {}
+        self._loads: dict[str, int] = {kind: 0 for kind in self._specs}
+        # 缺少套件（ImportError）在同一個 process 內不會改變，記住後不再重試
+        self._import_errors: dict[str, ImportError] = {}
+        # 背景預熱與 worker 執行緒可能同時觸發載入，避免同一個模型被載入兩次
+        self._lock = threading.RLock()
+
+    @property
+    def specs(self) -> dict:
+        """kind → (模型名稱, 載入函式)；子行程以相同設定建立自己的註冊表"""
+        return dict(self._specs)
+
+    def model_name(self, kind: str) -> str:
+        return self._specs[kind][0]
+
+    def get(self, kind: str):
+        """取得模型（尚未載入時載入；失敗時印出原因並往外拋，除了缺少套件之外下次呼叫會重試）"""
+        model = self._models.get(kind)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(kind)
+            if model is not None:
+                return model
+            if kind in self._import_errors:
+                raise self._import_errors[kind]
+            model_name, loader = self._specs[kind]
+            label = MODEL_LABELS.get(kind, kind)
+            print(f"正在載入 {label} 模型: {model_name}")
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+            try:
+                model = loader(model_name)
+            except Exception as e:
+                print(f"載入 {label} 模型失敗: {e}")
+                if isinstance(e, ImportError):
+                    self._import_errors[kind] = e
+                raise
+            seconds = time.perf_counter() - started
+            rss_after = current_rss_bytes()
+            self._info[kind] = {
+                "load_seconds": seconds,
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                "parameter_bytes": _parameter_bytes(model),
+            }
+            self._loads[kind] = self._loads.get(kind, 0) + 1
+            self._models[kind] = model
+            print(f"{label} 模型載入完成（{seconds:.1f} 秒）")
+            return model
+
+    def get_loaded(self, kind: str):
+        """已載入的模型（不觸發載入，未載入時為 None）"""
+        return self._models.get(kind)
+
+    def unload(self, kind: str | None = None) -> list[str]:
+        """
+        釋放模型（kind 為 None 時釋放全部）
+
+        Returns:
+            實際釋放的種類
+        """
+        with self._lock:
+            for k in ([kind] if kind is not None else list(self._import_errors)):
+                self._import_errors.pop(k, None)
+            kinds = [k for k in ([kind] if kind is not None else list(self._models)) if k in self._models]
+            for k in kinds:
+                del self._models[k]
+                self._info.pop(k, None)
+        if kinds:
+            gc.collect()
+        return kinds
+
+    def stats(self) -> dict:
+        """
+        模型狀態
+
+        Returns:
+            {"rss_bytes": process 常駐記憶體,
+             "models": {kind: {name, loaded, loads, backend, load_seconds, rss_delta_bytes, parameter_bytes}}}
+        """
+        from onnx_backend import get_active_backend
+
+        models = {}
+        for kind, (model_name, _) in self._specs.items():
+            info = self._info.get(kind, {})
+            loaded = kind in self._models
+            models[kind] = {
+                "name": model_name,
+                "loaded": loaded,
+                "loads": self._loads.get(kind, 0),
+                "backend": get_active_backend(model_name) if loaded else None,
+                "load_seconds": info.get("load_seconds"),
+                "rss_delta_bytes": info.get("rss_delta_bytes"),
+                "parameter_bytes": info.get("parameter_bytes"),
+            }
+        return {"rss_bytes": current_rss_bytes(), "models": models}
+
+
+# 全域註冊表實例
+_model_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """獲取全域模型註冊表"""
+    return _model_registry
+
+
+def get_embedding_model():
+    """共用的 Embedding 模型（paraphrase-multilingual-MiniLM-L12-v2）"""
+    return _model_registry.get(EMBEDDING)
+
+
+def get_rerank_model():
+    """共用的 Re-ranking 模型（cross-encoder/ms-marco-MiniLM-L-6-v2）"""
+    return _model_registry.get(RERANK)
@@ -0,0 +1,196 @@
+"""
+推論後端模組 - 以 ONNX Runtime 執行動態 int8 量化的 Embedding / Re-ranking 模型
+
+沒有 GPU 的筆電上，兩個 MiniLM 模型經 PyTorch 推論是建立索引與冷查詢的主要耗時。
+設定 SBIR_INFERENCE_BACKEND=onnx 後：
+- 第一次載入時把模型轉成 ONNX，並以動態 int8 量化另存一份
+  （存在 mcp-server/onnx_models/，之後直接載入，不需重新轉換）
+- 由 sentence-transformers 的 ONNX 後端（onnxruntime，CPU）推論
+
+需要 sentence-transformers>=3.2（CrossEncoder 需 >=4.1）與 optimum[onnxruntime]；
+任何一步失敗都印出原因並退回 PyTorch。
+
+不同後端的輸出只是近似，查詢向量與 rerank 分數的快取以 model_id() 區分後端。
+執行 python onnx_backend.py 可比較兩個後端的一致性與吞吐量。
+"""
+
+import os
+import platform
+import time
+
+import numpy as np
+
+BACKEND_ENV = "SBIR_INFERENCE_BACKEND"
+QUANTIZATION_ENV = "SBIR_ONNX_QUANTIZATION"
+
+INFERENCE_BACKENDS = ("torch", "onnx")
+DEFAULT_BACKEND = "torch"
+
+# optimum AutoQuantizationConfig 提供的 CPU 指令集設定
+QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+# 轉換後的 ONNX 模型存放位置
+ONNX_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+
+# 一致性檢查 / 吞吐量比較用的固定句子
+REFERENCE_SENTENCES = [
+    "SBIR 計畫的申請資格是什麼？",
+    "Phase 1 計畫書需要包含哪些章節？",
+    "如何撰寫創新技術說明與市場分析",
+    "經費編列時人事費的上限與注意事項",
+    "期末報告應檢附的成果與查核點",
+    "中小企業研發補助的審查重點",
+    "技術可行性與風險評估的寫法",
+    "What documents are required for the SBIR Phase 2 application?",
+    "How do reviewers score the commercialization plan?",
+    "研發團隊的學經歷與分工如何呈現",
+    "智慧財產權與專利布局說明",
+    "計畫執行期間變更內容需要申請嗎？",
+]
+
+# 實際使用的後端（model_name → "torch" 或 "onnx-qint8-<設定>"）
+_active_backends: dict[str, str] = {}
+
+
+def read_inference_backend() -> str:
+    """SBIR_INFERENCE_BACKEND（未設定或無效時為 torch）"""
+    backend = os.environ.get(BACKEND_ENV, DEFAULT_BACKEND).strip().lower()
+    if backend not in INFERENCE_BACKENDS:
+        print(f"未知的推論後端 {BACKEND_ENV}={backend!r}，改用 {DEFAULT_BACKEND}")
+        return DEFAULT_BACKEND
+    return backend
+
+
+def read_quantization_config() -> str:
+    """SBIR_ONNX_QUANTIZATION（未設定時依 CPU 架構：ARM 為 arm64，其餘為 avx2）"""
+    default = "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+    config = os.environ.get(QUANTIZATION_ENV, default).strip().lower()
+    if config not in QUANTIZATION_CONFIGS:
+        print(f"未知的量化設定 {QUANTIZATION_ENV}={config!r}，改用 {default}")
+        return default
+    return config
+
+
+def quantized_file_name(config: str) -> str:
+    """export_dynamic_quantized_onnx_model 產生的量化模型檔（相對於模型目錄）"""
+    return f"onnx/model_qint8_{config}.onnx"
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODELS_DIR, model_name.replace("/", "__"))
+
+
+def _load_onnx(model_cls, model_name: str, config: str):
+    """載入量化後的 ONNX 模型（第一次使用時轉換並量化）"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    save_dir = _model_dir(model_name)
+    file_name = quantized_file_name(config)
+    if not os.path.exists(os.path.join(save_dir, file_name)):
+        print(f"正在將 {model_name} 轉換為 ONNX 並量化（{config}，只需執行一次）")
+        model = model_cls(model_name, backend="onnx")
+        model.save(save_dir)
+        export_dynamic_quantized_onnx_model(model, config, save_dir)
+    return model_cls(save_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def _load(model_cls, model_name: str):
+    if read_inference_backend() == "onnx":
+        config = read_quantization_config()
+        try:
+            model = _load_onnx(model_cls, model_name, config)
+            _active_backends[model_name] = f"onnx-qint8-{config}"
+            return model
+        except Exception as e:
+            print(f"ONNX 後端無法使用（{model_name}），改用 PyTorch: {e}")
+    model = model_cls(model_name)
+    _active_backends[model_name] = "torch"
+    return model
+
+
+def load_embedding_model(model_name: str):
+    """依 SBIR_INFERENCE_BACKEND 載入 SentenceTransformer"""
+    from sentence_transformers import SentenceTransformer
+    return _load(SentenceTransformer, model_name)
+
+
+def load_rerank_model(model_name: str):
+    """依 SBIR_INFERENCE_BACKEND 載入 CrossEncoder"""
+    from sentence_transformers import CrossEncoder
+    return _load(CrossEncoder, model_name)
+
+
+def get_active_backend(model_name: str) -> str | None:
+    """模型實際使用的後端（尚未載入時為 None）"""
+    return _active_backends.get(model_name)
+
+
+def model_id(model_name: str) -> str:
+    """
+    快取 key 使用的模型識別
+
+    PyTorch 維持原本的模型名稱（既有快取照常命中）；ONNX 加上後端後綴，
+    兩個後端的查詢向量與 rerank 分數不混用。
+    """
+    backend = _active_backends.get(model_name)
+    return model_name if backend in (None, "torch") else f"{model_name}@{backend}"
+
+
+def _throughput(fn, items: list, rounds: int) -> float:
+    """每秒處理的項目數（先執行一次暖機）"""
+    fn(items)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(items)
+    return len(items) * rounds / (time.perf_counter() - started)
+
+
+def compare_backends(embedding_model_name: str, rerank_model_name: str,
+                     sentences: list[str] | None = None, rounds: int = 5) -> dict:
+    """
+    比較 PyTorch 與量化 ONNX 後端（不影響 server 使用中的模型）
+
+    Returns:
+        {"quantization": 設定,
+         "embedding": {"min_cosine", "mean_cosine", "torch_per_sec", "onnx_per_sec"},
+         "rerank": {"spearman", "max_abs_diff", "torch_per_sec", "onnx_per_sec"}}
+    """
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    sentences = sentences or REFERENCE_SENTENCES
+    config = read_quantization_config()
+    report = {"quantization": config}
+
+    torch_model = SentenceTransformer(embedding_model_name)
+    onnx_model = _load_onnx(SentenceTransformer, embedding_model_name, config)
+    a = torch_model.encode(sentences, normalize_embeddings=True, show_progress_bar=False)
+    b = onnx_model.encode(sentences, normalize_embeddings=True, show_progress_bar=False)
+    cosines = np.sum(a * b, axis=1)
+    report["embedding"] = {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "torch_per_sec": _throughput(lambda s: torch_model.encode(s, show_progress_bar=False), sentences, rounds),
+        "onnx_per_sec": _throughput(lambda s: onnx_model.encode(s, show_progress_bar=False), sentences, rounds),
+    }
+
+    torch_reranker = CrossEncoder(rerank_model_name)
+    onnx_reranker = _load_onnx(CrossEncoder, rerank_model_name, config)
+    pairs = [[sentences[0], s] for s in sentences[1:]]
+    x = np.asarray(torch_reranker.predict(pairs), dtype=np.float64)
+    y = np.asarray(onnx_reranker.predict(pairs), dtype=np.float64)
+    x_rank, y_rank = np.argsort(np.argsort(x)), np.argsort(np.argsort(y))
+    report["rerank"] = {
+        "spearman": float(np.corrcoef(x_rank, y_rank)[0, 1]),
+        "max_abs_diff": float(np.abs(x - y).max()),
+        "torch_per_sec": _throughput(torch_reranker.predict, pairs, rounds),
+        "onnx_per_sec": _throughput(onnx_reranker.predict, pairs, rounds),
+    }
+    return report
+
+
+if __name__ == "__main__":
+    import json
+
+    from vector_search import MODEL_NAME, RERANK_MODEL_NAME
+
+    print(json.dumps(compare_backends(MODEL_NAME, RERANK_MODEL_NAME), ensure_ascii=False, indent=2))
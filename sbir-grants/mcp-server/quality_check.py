@@ -8,6 +8,8 @@ import os
 import json
 from pathlib import Path
 
+from keyword_matcher import KeywordMatcher
+
 # 狀態檔案路徑（與 proposal_generator_impl.py 共用）
 STATE_FILE = os.path.expanduser("~/.sbir_proposal_state.json")
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -27,10 +29,16 @@ def load_quality_metrics() -> dict:
 # 6 個審查維度定義（從共用 JSON 載入）
 QUALITY_DIMENSIONS = load_quality_metrics()
 
+# 所有維度的關鍵詞編譯成一個自動機，全文只掃描一次（不分大小寫，子字串比對）
+_QUALITY_MATCHER = KeywordMatcher(
+    (kw for dim in QUALITY_DIMENSIONS.values() for kw in dim.get("keywords", [])),
+    normalizer=str.lower,
+)
+
 
-def _keyword_check(text: str, keywords: list, min_count: int) -> bool:
-    """簡單的關鍵詞存在性檢查"""
-    count = sum(1 for kw in keywords if kw.lower() in text.lower())
+def _keyword_check(found: set, keywords: list, min_count: int) -> bool:
+    """簡單的關鍵詞存在性檢查（found 為全文中出現過的關鍵詞）"""
+    count = sum(1 for kw in keywords if kw in found)
     return count >= min_count
 
 
@@ -41,6 +49,7 @@ def evaluate_proposal_quality(full_text: str) -> dict:
     """
     results = {}
     reasons = {}
+    found_keywords = _QUALITY_MATCHER.found(full_text)
 
     for dim_id, dim in QUALITY_DIMENSIONS.items():
         if dim_id == "ch_12":
@@ -53,14 +62,14 @@ def evaluate_proposal_quality(full_text: str) -> dict:
         else:
             keywords = dim.get("keywords", [])
             min_count = dim.get("min_related_keywords", 1)
-            passed = _keyword_check(full_text, keywords, min_count)
+            passed = _keyword_check(found_keywords, keywords, min_count)
             results[dim_id] = passed
 
-            found = [kw for kw in keywords if kw.lower() in full_text.lower()]
+            found = [kw for kw in keywords if kw in found_keywords]
             if passed:
                 reasons[dim_id] = f"包含必要關鍵詞：{', '.join(found[:3])}"
             else:
-                missing = [kw for kw in keywords if kw.lower() not in full_text.lower()][:3]
+                missing = [kw for kw in keywords if kw not in found_keywords][:3]
                 reasons[dim_id] = f"缺少關鍵要素，建議補充：{', '.join(missing)}"
 
     return {"results": results, "reasons": reasons}
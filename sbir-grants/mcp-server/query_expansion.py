@@ -9,9 +9,15 @@ from pathlib import Path
 import json
 import logging
 
+from keyword_matcher import KeywordMatcher
+from tokenizer import normalize, segment
+
 logger = logging.getLogger(__name__)
 
 
+# 同義詞展開出來的關鍵字權重（原始查詢詞為 1.0），避免同義詞與原詞等權
+SYNONYM_WEIGHT = 0.5
+
 # 根據專案結構，shared_domain 在 mcp-server 的上一層的上一層
 SHARED_DOMAIN_DIR = Path(__file__).parent.parent.parent / "shared_domain"
 
@@ -31,57 +37,54 @@ for group in _SYNONYM_GROUPS:
     for word in group:
         _WORD_TO_GROUP[word.lower()] = [w for w in group if w != word]
 
+# 同義詞偵測用的自動機（key 與 _WORD_TO_GROUP 相同，皆為小寫）
+_SYNONYM_MATCHER = KeywordMatcher(_WORD_TO_GROUP, normalizer=str.lower, whole_word=True)
+
+# 中文查詢分詞用的詞彙表（同義詞表中的詞，正規化後）
+_SEGMENT_VOCABULARY: set[str] = {normalize(word) for group in _SYNONYM_GROUPS for word in group}
+
+
+def _replace_spans(text: str, spans: list[tuple[int, int]], replacement: str) -> str:
+    """把 text 中的多個 [start, end) 區段替換成 replacement（重疊的區段只取第一個）"""
+    parts = []
+    cursor = 0
+    for start, end in spans:
+        if start < cursor:
+            continue
+        parts.append(text[cursor:start])
+        parts.append(replacement)
+        cursor = end
+    parts.append(text[cursor:])
+    return "".join(parts)
+
 
 def expand_query(query: str) -> list[str]:
     """
     擴展查詢，加入同義詞（雙向：搜尋任一詞都能展開到整個同義詞群組）
 
+    同義詞表編譯成 KeywordMatcher，查詢只掃描一次就找出所有命中的詞；
+    英文詞依單字邊界比對（避免 "ict" 命中 "picture"），被更長的同義詞包住的命中不展開。
     一個詞只用第一個匹配到的同義詞群組（避免詞在多群組造成爆炸式展開）。
     """
     expanded = [query]
     query_lower = query.lower()
-    seen_words: set[str] = set()  # 防止同一個 word 在多群組重複展開
-
-    import re
-
-    for word_lower, synonyms in _WORD_TO_GROUP.items():
-        if word_lower in seen_words:
+    # 大小寫轉換改變長度時（極少數字元），改在小寫查詢上替換
+    target = query if len(query_lower) == len(query) else query_lower
+
+    # 被更長同義詞包住的命中不展開（"Phase 2+" 內的 "2+"、"phase 2"）
+    matches = list(_SYNONYM_MATCHER.finditer(query))
+    spans: dict[str, list[tuple[int, int]]] = {}
+    for start, end, word_lower in matches:
+        if any(s <= start and end <= e and (s, e) != (start, end) for s, e, _ in matches):
             continue
+        spans.setdefault(word_lower, []).append((start, end))
 
-        # Check word boundary for English/ASCII words to prevent "ict" matching "picture"
-        is_english = bool(re.match(r'^[a-zA-Z0-9_+\-\s]+$', word_lower))
-        if is_english:
-            pattern = r'\b' + re.escape(word_lower) + r'\b'
-            if not re.search(pattern, query_lower):
-                continue
-        elif word_lower not in query_lower:
+    for word_lower, synonyms in _WORD_TO_GROUP.items():
+        if word_lower not in spans:
             continue
 
-        seen_words.add(word_lower)
-
-        # 找到匹配的原始詞（保持原始大小寫）
-        original_case = None
-        for group in _SYNONYM_GROUPS:
-            for w in group:
-                if w.lower() == word_lower:
-                    original_case = w
-                    break
-            if original_case:
-                break
-
         for syn in synonyms:
-            if is_english:
-                # Safe regex replace for english terms
-                if original_case and re.search(r'\b' + re.escape(original_case) + r'\b', query):
-                    new_query = re.sub(r'\b' + re.escape(original_case) + r'\b', syn, query)
-                else:
-                    new_query = re.sub(r'\b' + re.escape(word_lower) + r'\b', syn, query_lower)
-            else:
-                if original_case and original_case in query:
-                    new_query = query.replace(original_case, syn)
-                else:
-                    new_query = query_lower.replace(word_lower, syn)
-
+            new_query = _replace_spans(target, spans[word_lower], syn)
             if new_query not in expanded:
                 expanded.append(new_query)
 
@@ -98,6 +101,9 @@ def get_expanded_keywords(query: str) -> list[str]:
     Returns:
         擴展後的關鍵字列表
 
+    中文以 tokenizer.segment 分詞（同義詞表最長匹配），
+    「補助金額上限」會拆成「補助金額」「上限」，而不是一整串關鍵字。
+
     Example:
         >>> get_expanded_keywords("Phase 1 申請")
         ["phase", "1", "申請", "第一階段", "先期研究", "送件", "提案", ...]
@@ -106,13 +112,29 @@ def get_expanded_keywords(query: str) -> list[str]:
     keywords: list[str] = []
 
     for q in expanded_queries:
-        words = [kw.strip().lower() for kw in q.split() if kw.strip()]
-        keywords.extend(words)
+        keywords.extend(segment(q, _SEGMENT_VOCABULARY))
 
     # 去重但保持順序（Python 3.7+ dict 保證插入順序）
     return list(dict.fromkeys(keywords))
 
 
+def get_weighted_keywords(query: str) -> list[tuple[str, float]]:
+    """
+    獲取擴展後的關鍵字與查詢權重（供 BM25 評分使用）
+
+    原始查詢中的詞權重為 1.0，僅由同義詞展開而來的詞權重為 SYNONYM_WEIGHT。
+
+    Example:
+        >>> get_weighted_keywords("預算")
+        [("預算", 1.0), ("補助", 0.5), ("經費", 0.5), ...]
+    """
+    original = set(segment(query, _SEGMENT_VOCABULARY))
+    return [
+        (kw, 1.0 if kw in original else SYNONYM_WEIGHT)
+        for kw in get_expanded_keywords(query)
+    ]
+
+
 if __name__ == "__main__":
     # 測試
     test_queries = [
@@ -0,0 +1,194 @@
+"""
+Re-ranking 分數快取模組 - 已評分的 (查詢, chunk) 不再送進 Cross-Encoder
+
+rerank_results 每次搜尋要對最多 20 組 (query, content[:500]) 執行 CrossEncoder.predict，
+是冷查詢最主要的 CPU 成本；換 category 或 search_cache 過期後，
+同一查詢的候選 chunk 大多重複，分數卻全部重算。
+
+這裡以 SQLite 持久化分數，key 為（模型名稱, 查詢指紋, chunk 內容雜湊）：
+- 查詢指紋：正規化後查詢字串的 SHA-256（與查詢向量快取相同的正規化）
+- 內容雜湊：實際送進模型的 chunk 文字的 SHA-256
+
+chunk 內容一改雜湊就不同，重建索引後不會取到舊分數，不需要另外失效；
+不再出現的舊分數依最後使用時間淘汰。
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# 與 chroma_db 放在同一層
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rerank_cache.db")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """Cross-Encoder 分數快取（SQLite；worker 執行緒會同時存取，以 lock 保護）"""
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, max_rows: int = 50000):
+        """
+        初始化快取（資料庫在第一次使用時才開啟）
+
+        Args:
+            db_path: SQLite 檔案路徑
+            max_rows: 最多保留的分數筆數，超過時淘汰最久未使用的
+        """
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rerank_scores (
+                    model TEXT NOT NULL,
+                    query_hash TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (model, query_hash, content_hash)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rerank_used_at ON rerank_scores (used_at)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, model_name: str, query: str, contents: list[str]) -> list[Optional[float]]:
+        """
+        查詢已快取的分數（依序對應 contents，未命中為 None）
+
+        Args:
+            model_name: Cross-Encoder 模型名稱
+            query: 查詢字串（內部會正規化）
+            contents: 送進模型的 chunk 文字
+        """
+        query_hash = _sha256(normalize_query(query))
+        content_hashes = [_sha256(content) for content in contents]
+
+        with self._lock:
+            try:
+                conn = self._connect()
+                placeholders = ",".join("?" * len(set(content_hashes)))
+                rows = conn.execute(
+                    f'''SELECT content_hash, score FROM rerank_scores
+                        WHERE model = ? AND query_hash = ? AND content_hash IN ({placeholders})''',
+                    (model_name, query_hash, *set(content_hashes)),
+                ).fetchall()
+                found = dict(rows)
+                if found:
+                    conn.execute(
+                        f'''UPDATE rerank_scores SET used_at = ?
+                            WHERE model = ? AND query_hash = ? AND content_hash IN ({",".join("?" * len(found))})''',
+                        (time.time(), model_name, query_hash, *found),
+                    )
+                    conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"讀取 Re-ranking 分數快取失敗: {e}")
+                found = {}
+
+            scores = [found.get(h) for h in content_hashes]
+            hits = sum(score is not None for score in scores)
+            self._hits += hits
+            self._misses += len(scores) - hits
+            return scores
+
+    def store(self, model_name: str, query: str, scores: dict[str, float]) -> None:
+        """
+        寫入分數
+
+        Args:
+            model_name: Cross-Encoder 模型名稱
+            query: 查詢字串（內部會正規化）
+            scores: chunk 文字 → 分數
+        """
+        if not scores:
+            return
+        query_hash = _sha256(normalize_query(query))
+        now = time.time()
+
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.executemany(
+                    '''INSERT OR REPLACE INTO rerank_scores (model, query_hash, content_hash, score, used_at)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    [(model_name, query_hash, _sha256(content), float(score), now) for content, score in scores.items()],
+                )
+                overflow = conn.execute('SELECT COUNT(*) FROM rerank_scores').fetchone()[0] - self.max_rows
+                if overflow > 0:
+                    conn.execute(
+                        'DELETE FROM rerank_scores WHERE rowid IN '
+                        '(SELECT rowid FROM rerank_scores ORDER BY used_at LIMIT ?)',
+                        (overflow,),
+                    )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"寫入 Re-ranking 分數快取失敗: {e}")
+
+    def clear(self) -> None:
+        """清空快取"""
+        with self._lock:
+            try:
+                self._connect().execute('DELETE FROM rerank_scores')
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"清空 Re-ranking 分數快取失敗: {e}")
+            self._hits = 0
+            self._misses = 0
+
+    def close(self) -> None:
+        """關閉資料庫連線"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        """
+        獲取快取統計資訊（以 (查詢, chunk) 組數計）
+
+        Returns:
+            統計資訊字典
+        """
+        with self._lock:
+            size = 0
+            # 只查看狀態時不建立資料庫檔案
+            if self._conn is not None or os.path.exists(self.db_path):
+                try:
+                    size = self._connect().execute('SELECT COUNT(*) FROM rerank_scores').fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            total = self._hits + self._misses
+            hit_rate = self._hits / total if total > 0 else 0.0
+            return {
+                "size": size,
+                "max_size": self.max_rows,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": f"{hit_rate:.1%}",
+            }
+
+
+# 全域快取實例
+_rerank_cache = RerankScoreCache()
+
+
+def get_rerank_cache() -> RerankScoreCache:
+    """獲取全域 Re-ranking 分數快取"""
+    return _rerank_cache
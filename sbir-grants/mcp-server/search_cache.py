@@ -1,35 +1,64 @@
 """
-搜尋快取模組 - LRU 快取機制（使用 OrderedDict 實現 O(1) 操作）
+搜尋快取模組 - 兩層 LRU 快取（記憶體 + SQLite），以索引世代失效
 
-提升常見查詢的回應速度
+提升常見查詢的回應速度：
+- 記憶體層：OrderedDict 實現 O(1) 的 LRU，以位元組預算（而非筆數）限制大小
+- 磁碟層：SQLite（chroma_db 同層的 search_cache.db），server 重啟後仍可命中
+
+每筆結果標記產生時的索引世代（見 index_generation.py），
+索引重建或匯入文件後世代改變，舊結果立即失效。
 """
 
 import hashlib
 import logging
+import os
+import sqlite3
+import threading
 import time
 from collections import OrderedDict
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# 搜尋結果的輸出格式改變時遞增，讓磁碟層的舊格式結果不再命中
+RESULT_FORMAT_VERSION = 1
+
+DEFAULT_DISK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_cache.db")
+
+
+def _hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{(hits / total if total > 0 else 0.0):.1%}"
+
 
 class SearchCache:
-    """搜尋結果快取（LRU 策略，使用 OrderedDict 實現 O(1) 操作，含 TTL 支援）"""
+    """搜尋結果快取（記憶體 LRU + 選用的 SQLite 磁碟層，位元組預算，索引世代失效）"""
 
-    def __init__(self, max_size: int = 100, ttl_seconds: int = 3600):
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, disk_path: Optional[str] = None,
+                 disk_max_bytes: int = 64 * 1024 * 1024, ttl_seconds: Optional[int] = None):
         """
         初始化快取
 
         Args:
-            max_size: 最大快取數量
-            ttl_seconds: 快取存活時間（秒），預設 1 小時。Bug Z1 fix: 原本無 TTL，
-                         舊的截斷結果（100 字）會永遠被返回，即使程式碼已修復。
+            max_bytes: 記憶體層位元組預算（以 UTF-8 結果長度計）
+            disk_path: 磁碟層 SQLite 檔案路徑，None 時只使用記憶體層
+            disk_max_bytes: 磁碟層位元組預算
+            ttl_seconds: 選用的存活時間（秒）。Bug Z1 原本以 1 小時 TTL 避免舊結果永遠被返回，
+                         現在由索引世代與 RESULT_FORMAT_VERSION 精確失效，預設不再過期。
         """
-        self.cache: OrderedDict[str, tuple[str, float]] = OrderedDict()  # value: (result, timestamp)
-        self.max_size = max_size
+        self.cache: OrderedDict[str, tuple[str, float, str, int]] = OrderedDict()  # value: (result, timestamp, generation, bytes)
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
         self.ttl_seconds = ttl_seconds
+        self._bytes = 0
         self._hits = 0
         self._misses = 0
+        self._disk_hits = 0
+        self._disk_misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_generation: Optional[str] = None
+        self._lock = threading.Lock()
 
     def _hash_query(self, query: str, category: str) -> str:
         """
@@ -42,81 +71,231 @@ class SearchCache:
         Returns:
             SHA-256 雜湊值（前 16 字元）
         """
-        key = f"{query}:{category}"
+        key = f"{RESULT_FORMAT_VERSION}:{query}:{category}"
         return hashlib.sha256(key.encode()).hexdigest()[:16]
 
-    def get(self, query: str, category: str = "all") -> Optional[str]:
+    def _expired(self, timestamp: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - timestamp > self.ttl_seconds
+
+    # ===== 記憶體層 =====
+
+    def _memory_remove(self, key: str) -> None:
+        _, _, _, size = self.cache.pop(key)
+        self._bytes -= size
+
+    def _memory_put(self, key: str, result: str, timestamp: float, generation: str) -> None:
+        if key in self.cache:
+            self._memory_remove(key)
+        size = len(result.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        while self.cache and self._bytes + size > self.max_bytes:
+            self._memory_remove(next(iter(self.cache)))  # O(1) — 移除最舊項目（最少使用端）
+        self.cache[key] = (result, timestamp, generation, size)
+        self._bytes += size
+
+    # ===== 磁碟層 =====
+
+    def _disk(self, generation: Optional[str] = None) -> Optional[sqlite3.Connection]:
+        """開啟磁碟層（未設定或無法使用時回傳 None）；世代改變時清掉舊世代的結果"""
+        if self.disk_path is None:
+            return None
+        try:
+            if self._conn is None:
+                conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS search_results (
+                        key TEXT PRIMARY KEY,
+                        generation TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        used_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_search_used_at ON search_results (used_at)')
+                conn.commit()
+                self._conn = conn
+            if generation is not None and generation != self._disk_generation:
+                self._conn.execute('DELETE FROM search_results WHERE generation != ?', (generation,))
+                self._conn.commit()
+                self._disk_generation = generation
+        except sqlite3.Error as e:
+            logger.warning(f"搜尋快取磁碟層無法使用，改為只用記憶體: {e}")
+            self.disk_path = None
+            self._conn = None
+        return self._conn
+
+    def _disk_get(self, key: str, generation: str) -> Optional[tuple[str, float]]:
+        conn = self._disk(generation)
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                'SELECT result, created_at FROM search_results WHERE key = ? AND generation = ?',
+                (key, generation),
+            ).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1]):
+                conn.execute('DELETE FROM search_results WHERE key = ?', (key,))
+                conn.commit()
+                return None
+            conn.execute('UPDATE search_results SET used_at = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+            return row[0], row[1]
+        except sqlite3.Error as e:
+            logger.warning(f"讀取搜尋快取磁碟層失敗: {e}")
+            return None
+
+    def _disk_put(self, key: str, result: str, timestamp: float, generation: str) -> None:
+        conn = self._disk(generation)
+        if conn is None:
+            return
+        size = len(result.encode("utf-8"))
+        if size > self.disk_max_bytes:
+            return
+        try:
+            conn.execute(
+                '''INSERT OR REPLACE INTO search_results (key, generation, result, size, created_at, used_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (key, generation, result, size, timestamp, timestamp),
+            )
+            overflow = conn.execute('SELECT COALESCE(SUM(size), 0) FROM search_results').fetchone()[0] - self.disk_max_bytes
+            if overflow > 0:
+                evict = []
+                for rowid, row_size in conn.execute('SELECT rowid, size FROM search_results ORDER BY used_at'):
+                    if overflow <= 0:
+                        break
+                    evict.append((rowid,))
+                    overflow -= row_size
+                conn.executemany('DELETE FROM search_results WHERE rowid = ?', evict)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"寫入搜尋快取磁碟層失敗: {e}")
+
+    # ===== 公開介面 =====
+
+    def get(self, query: str, category: str = "all", generation: str = "") -> Optional[str]:
         """
-        獲取快取結果。命中時將項目移至尾端（最近使用）。
-        若已過期則視為未命中（Bug Z1 fix）。
+        獲取快取結果。依序查詢記憶體層、磁碟層（磁碟層命中時放回記憶體層）。
+        不同索引世代（或超過選用 TTL）的結果視為未命中。
 
         Args:
             query: 查詢字串
             category: 分類
+            generation: 目前的索引世代 id
 
         Returns:
-            快取的結果，如果不存在或已過期則返回 None
+            快取的結果，如果不存在或已失效則返回 None
         """
         key = self._hash_query(query, category)
 
-        if key in self.cache:
-            result, timestamp = self.cache[key]
-            # Bug Z1 fix: check TTL before serving cached result
-            if time.time() - timestamp > self.ttl_seconds:
-                del self.cache[key]  # Evict stale entry
-                self._misses += 1
+        with self._lock:
+            if key in self.cache:
+                result, timestamp, entry_generation, _ = self.cache[key]
+                if entry_generation == generation and not self._expired(timestamp):
+                    self.cache.move_to_end(key)  # O(1) — 移至最近使用端
+                    self._hits += 1
+                    return result
+                self._memory_remove(key)  # 舊世代或過期
+            self._misses += 1
+
+            disk_entry = self._disk_get(key, generation)
+            if disk_entry is None:
+                if self.disk_path is not None:
+                    self._disk_misses += 1
                 return None
-            self.cache.move_to_end(key)  # O(1) — 移至最近使用端
-            self._hits += 1
+            self._disk_hits += 1
+            result, timestamp = disk_entry
+            self._memory_put(key, result, timestamp, generation)
             return result
 
-        self._misses += 1
-        return None
-
-    def set(self, query: str, category: str, results: str) -> None:
+    def set(self, query: str, category: str, results: str, generation: str = "") -> None:
         """
-        設定快取。若已存在則更新並移至尾端；若超過容量則淘汰最舊項目。
+        設定快取（同時寫入兩層）。超過位元組預算時淘汰最久未使用的項目。
 
         Args:
             query: 查詢字串
             category: 分類
             results: 搜尋結果
+            generation: 產生結果時的索引世代 id
         """
         key = self._hash_query(query, category)
+        timestamp = time.time()
 
-        if key in self.cache:
-            self.cache.move_to_end(key)  # O(1)
-        elif len(self.cache) >= self.max_size:
-            self.cache.popitem(last=False)  # O(1) — 移除最舊項目（最少使用端）
-
-        self.cache[key] = (results, time.time())  # Store result with timestamp
+        with self._lock:
+            self._memory_put(key, results, timestamp, generation)
+            self._disk_put(key, results, timestamp, generation)
 
     def clear(self) -> None:
-        """清空快取"""
-        self.cache.clear()
-        self._hits = 0
-        self._misses = 0
+        """清空快取（兩層）"""
+        with self._lock:
+            self.cache.clear()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+            self._disk_hits = 0
+            self._disk_misses = 0
+            conn = self._disk()
+            if conn is not None:
+                try:
+                    conn.execute('DELETE FROM search_results')
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"清空搜尋快取磁碟層失敗: {e}")
+
+    def close(self) -> None:
+        """關閉磁碟層連線"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._disk_generation = None
 
     def stats(self) -> dict:
         """
         獲取快取統計資訊
 
         Returns:
-            統計資訊字典
+            統計資訊字典（記憶體層；磁碟層在 "disk"，未啟用時為 None）
         """
-        total = self._hits + self._misses
-        hit_rate = self._hits / total if total > 0 else 0.0
-        return {
-            "size": len(self.cache),
-            "max_size": self.max_size,
-            "hits": self._hits,
-            "misses": self._misses,
-            "hit_rate": f"{hit_rate:.1%}",
-        }
+        with self._lock:
+            disk_stats = None
+            # 只查看狀態時不建立資料庫檔案
+            if self.disk_path is not None:
+                size, total_bytes = 0, 0
+                if self._conn is not None or os.path.exists(self.disk_path):
+                    conn = self._disk()
+                    if conn is not None:
+                        try:
+                            size, total_bytes = conn.execute(
+                                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_results'
+                            ).fetchone()
+                        except sqlite3.Error:
+                            pass
+                disk_stats = {
+                    "size": size,
+                    "bytes": total_bytes,
+                    "max_bytes": self.disk_max_bytes,
+                    "hits": self._disk_hits,
+                    "misses": self._disk_misses,
+                    "hit_rate": _hit_rate(self._disk_hits, self._disk_misses),
+                }
+
+            return {
+                "size": len(self.cache),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": _hit_rate(self._hits, self._misses),
+                "disk": disk_stats,
+            }
 
 
 # 全域快取實例
-_search_cache = SearchCache(max_size=100)
+_search_cache = SearchCache(disk_path=DEFAULT_DISK_PATH)
 
 
 def get_cache() -> SearchCache:
@@ -125,22 +304,24 @@ def get_cache() -> SearchCache:
 
 
 if __name__ == "__main__":
-    # 測試
-    cache = SearchCache(max_size=3)
+    # 測試（只用記憶體層，預算約兩筆結果）
+    cache = SearchCache(max_bytes=len("結果1".encode("utf-8")) * 2)
 
     print("快取測試\n" + "=" * 50)
 
-    cache.set("Phase 1", "all", "結果1")
-    cache.set("Phase 2", "all", "結果2")
-    cache.set("補助金額", "all", "結果3")
+    cache.set("Phase 1", "all", "結果1", generation="g1")
+    cache.set("Phase 2", "all", "結果2", generation="g1")
 
-    print(f"快取大小: {cache.stats()['size']}/3")
-    print(f"獲取 'Phase 1': {cache.get('Phase 1', 'all')}")
+    print(f"快取大小: {cache.stats()['bytes']}/{cache.max_bytes} bytes")
+    print(f"獲取 'Phase 1': {cache.get('Phase 1', 'all', generation='g1')}")
 
     # 測試 LRU 淘汰
-    cache.set("創新性", "all", "結果4")  # 應該淘汰最舊的 Phase 2
-    print(f"\n加入新項目後快取大小: {cache.stats()['size']}/3")
-    print(f"獲取 'Phase 2' (應該被淘汰): {cache.get('Phase 2', 'all')}")
-    print(f"獲取 '補助金額' (應該還在): {cache.get('補助金額', 'all')}")
+    cache.set("創新性", "all", "結果3", generation="g1")  # 應該淘汰最舊的 Phase 2
+    print(f"\n加入新項目後快取大小: {cache.stats()['bytes']}/{cache.max_bytes} bytes")
+    print(f"獲取 'Phase 2' (應該被淘汰): {cache.get('Phase 2', 'all', generation='g1')}")
+    print(f"獲取 'Phase 1' (應該還在): {cache.get('Phase 1', 'all', generation='g1')}")
+
+    # 測試索引世代失效
+    print(f"\n索引重建後獲取 'Phase 1' (應該失效): {cache.get('Phase 1', 'all', generation='g2')}")
 
     print(f"\n快取統計: {cache.stats()}")
@@ -0,0 +1,37 @@
+"""
+搜尋結果融合模組 - Reciprocal Rank Fusion
+
+關鍵字（BM25F）與語意（cosine similarity）的分數尺度不同，直接加權相加容易被其中一方主導。
+RRF 只看各路結果中的名次：score = Σ weight / (k + rank)，
+兩路都排在前面的 chunk 會得到最高分。
+"""
+
+# RRF 平滑常數（常用值 60：名次差距在前段影響較大、後段趨於平緩）
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: list[tuple[list[str], float]], k: int = RRF_K) -> dict[str, float]:
+    """
+    融合多路排序結果
+
+    Args:
+        rankings: [(依分數排序的 id 列表, 權重), ...]
+        k: RRF 平滑常數
+
+    Returns:
+        {id: 融合分數}，已正規化到 0-1（所有路都排第一名 = 1.0）
+
+    Example:
+        >>> reciprocal_rank_fusion([(["a", "b"], 0.4), (["b", "c"], 0.6)])
+        {"a": 0.4, "b": 0.99..., "c": 0.59...}
+    """
+    best = sum(weight for _, weight in rankings) / (k + 1)
+    if best <= 0:
+        return {}
+
+    fused: dict[str, float] = {}
+    for ids, weight in rankings:
+        for rank, item_id in enumerate(ids, 1):
+            fused[item_id] = fused.get(item_id, 0.0) + weight / (k + rank)
+
+    return {item_id: score / best for item_id, score in fused.items()}
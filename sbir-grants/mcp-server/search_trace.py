@@ -0,0 +1,243 @@
+"""
+搜尋追蹤模組 - 記錄混合搜尋各階段的耗時與候選數
+
+search_knowledge_base 的每次呼叫建立一個 SearchTrace，以單調時鐘記錄每個階段
+（快取查詢、同義詞擴展、關鍵字、語意、融合、rerank、時間加權、MMR、建議、格式化）
+的耗時、輸入 / 輸出候選數與錯誤：
+
+- 呼叫時帶 debug=true，追蹤結果附在搜尋結果後面
+- 每次呼叫都累計到 SearchMetrics 的耗時分布（histogram），以 get_search_metrics tool 查看
+
+用來判斷最佳化該花在哪個階段。
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# histogram 的桶上界（毫秒），最後一桶為無上限
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+STAGE_LABELS = {
+    "total": "整體",
+    "cache_lookup": "結果快取查詢",
+    "semantic_cache": "語意近似快取",
+    "synonym_expansion": "同義詞擴展",
+    "keyword_scan": "關鍵字搜尋",
+    "semantic_query": "語意搜尋",
+    "fusion": "RRF 融合",
+    "rerank": "Re-ranking",
+    "time_weighting": "時間加權",
+    "mmr": "MMR 多樣性",
+    "suggestions": "搜尋建議",
+    "formatting": "格式化",
+}
+
+OUTCOME_LABELS = {
+    "cache_hit": "結果快取命中",
+    "semantic_cache_hit": "語意快取命中",
+    "full": "完整搜尋",
+    "degraded": "預熱中降級搜尋",
+}
+
+
+class Stage:
+    """單一階段的紀錄（in / out 為候選數，由呼叫端填入）"""
+
+    def __init__(self, name: str, items_in: Optional[int] = None):
+        self.name = name
+        self.items_in = items_in
+        self.items_out: Optional[int] = None
+        self.seconds = 0.0
+        self.skipped = False
+        self.error: Optional[str] = None
+        self.note = ""
+        self._started = time.perf_counter()
+
+    def end(self, items_out: Optional[int] = None, note: str = "") -> None:
+        """結束計時（以 begin() 開始的階段）"""
+        self.seconds = time.perf_counter() - self._started
+        if items_out is not None:
+            self.items_out = items_out
+        if note:
+            self.note = note
+
+
+class SearchTrace:
+    """一次搜尋的追蹤紀錄"""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.stages: list[Stage] = []
+        self.total_seconds: Optional[float] = None
+        self.outcome = "full"
+
+    @contextmanager
+    def stage(self, name: str, items_in: Optional[int] = None):
+        """
+        量測一個階段；區塊內的例外會記錄後往外拋
+
+        Example:
+            >>> with trace.stage("keyword_scan") as stage:
+            ...     hits = search(...)
+            ...     stage.items_out = len(hits)
+        """
+        record = self.begin(name, items_in)
+        try:
+            yield record
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            record.end()
+
+    def begin(self, name: str, items_in: Optional[int] = None) -> Stage:
+        """開始一個階段，結束時呼叫 Stage.end()（階段跨越多段程式碼時使用）"""
+        record = Stage(name, items_in)
+        self.stages.append(record)
+        return record
+
+    def skip(self, name: str, note: str) -> None:
+        """記錄一個被略過的階段"""
+        record = Stage(name)
+        record.skipped = True
+        record.note = note
+        self.stages.append(record)
+
+    def fail(self, name: str, error: Exception) -> None:
+        """記錄階段內已處理（降級）的錯誤"""
+        for record in reversed(self.stages):
+            if record.name == name:
+                record.error = str(error)
+                return
+        record = Stage(name)
+        record.error = str(error)
+        self.stages.append(record)
+
+    def finish(self, outcome: Optional[str] = None) -> "SearchTrace":
+        if outcome is not None:
+            self.outcome = outcome
+        self.total_seconds = time.perf_counter() - self._started
+        return self
+
+    def to_markdown(self) -> str:
+        """debug 輸出"""
+        total = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._started
+        lines = [
+            "",
+            "---",
+            f"🔬 **搜尋追蹤**（{OUTCOME_LABELS.get(self.outcome, self.outcome)}，共 {total * 1000:.1f} ms）",
+            "",
+            "| 階段 | 耗時 (ms) | 候選數 in → out | 備註 |",
+            "|------|-----------|------------------|------|",
+        ]
+        for record in self.stages:
+            label = STAGE_LABELS.get(record.name, record.name)
+            if record.skipped:
+                lines.append(f"| {label} | - | - | 略過：{record.note} |")
+                continue
+            counts = f"{'-' if record.items_in is None else record.items_in} → {'-' if record.items_out is None else record.items_out}"
+            note = f"❌ {record.error}" if record.error else record.note
+            lines.append(f"| {label} | {record.seconds * 1000:.1f} | {counts} | {note} |")
+        return "\n".join(lines) + "\n"
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.counted = 0
+
+    def add(self, ms: float) -> None:
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q 分位數所在桶的上界（毫秒；落在最後一桶時回傳 max）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.buckets):
+            cumulative += n
+            if cumulative >= rank:
+                return float(BUCKET_BOUNDS_MS[i]) if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+
+class SearchMetrics:
+    """累計所有搜尋的各階段耗時分布（只在 event loop 上存取）"""
+
+    def __init__(self):
+        self.stages: dict[str, _Histogram] = {}
+        self.outcomes: dict[str, int] = {}
+        self.skipped: dict[str, int] = {}
+
+    def record(self, trace: SearchTrace) -> None:
+        self.outcomes[trace.outcome] = self.outcomes.get(trace.outcome, 0) + 1
+        if trace.total_seconds is not None:
+            self.stages.setdefault("total", _Histogram()).add(trace.total_seconds * 1000)
+        for record in trace.stages:
+            if record.skipped:
+                self.skipped[record.name] = self.skipped.get(record.name, 0) + 1
+                continue
+            histogram = self.stages.setdefault(record.name, _Histogram())
+            histogram.add(record.seconds * 1000)
+            if record.error:
+                histogram.errors += 1
+            if record.items_in is not None and record.items_out is not None:
+                histogram.items_in += record.items_in
+                histogram.items_out += record.items_out
+                histogram.counted += 1
+
+    def reset(self) -> None:
+        self.stages.clear()
+        self.outcomes.clear()
+        self.skipped.clear()
+
+    def snapshot(self) -> dict:
+        """
+        各階段統計
+
+        Returns:
+            {"outcomes": {...}, "stages": {name: {count, avg_ms, p50_ms, p95_ms, p99_ms, max_ms,
+             errors, skipped, avg_in, avg_out, buckets}}}
+        """
+        stages = {}
+        for name in list(STAGE_LABELS) + sorted(set(self.stages) - set(STAGE_LABELS)):
+            histogram = self.stages.get(name)
+            if histogram is None:
+                if name not in self.skipped:
+                    continue
+                histogram = _Histogram()  # 每次都被略過的階段
+            stages[name] = {
+                "count": histogram.count,
+                "avg_ms": histogram.total_ms / histogram.count if histogram.count else None,
+                "p50_ms": histogram.percentile(0.50),
+                "p95_ms": histogram.percentile(0.95),
+                "p99_ms": histogram.percentile(0.99),
+                "max_ms": histogram.max_ms if histogram.count else None,
+                "errors": histogram.errors,
+                "skipped": self.skipped.get(name, 0),
+                "avg_in": histogram.items_in / histogram.counted if histogram.counted else None,
+                "avg_out": histogram.items_out / histogram.counted if histogram.counted else None,
+                "buckets": dict(zip([f"≤{b}" for b in BUCKET_BOUNDS_MS] + ["inf"], histogram.buckets)),
+            }
+        return {"outcomes": dict(self.outcomes), "stages": stages}
+
+
+# 全域統計實例
+_search_metrics = SearchMetrics()
+
+
+def get_metrics() -> SearchMetrics:
+    """獲取全域搜尋統計"""
+    return _search_metrics
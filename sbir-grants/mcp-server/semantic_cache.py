@@ -0,0 +1,256 @@
+"""
+語意近似查詢快取模組 - 換句話說的查詢也能命中快取
+
+使用者常以不同說法問同一件事（「Phase 1 補助上限」、「第一階段補助金額上限是多少」），
+search_cache 只在 query:category 完全相同時命中。這裡把查詢向量與結果一起存下，
+新查詢的向量與同 category、同索引世代的既有查詢 cosine 相似度達門檻時，直接回傳該結果。
+
+預設關閉，以環境變數設定：
+- SBIR_SEMANTIC_CACHE：cosine 門檻（如 0.92），未設定或 0 時停用
+- SBIR_SEMANTIC_CACHE_SHADOW=1：影子模式，只比對不回傳快取。
+  照常搜尋後比較快取結果與實際結果的前幾名 chunk，統計誤判（false hit），用來調整門檻
+
+用查詢紀錄調整門檻（影子模式重播，每行一個查詢，可用「category<TAB>查詢」）：
+    python semantic_cache.py queries.txt
+"""
+
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_ENV = "SBIR_SEMANTIC_CACHE"
+SHADOW_ENV = "SBIR_SEMANTIC_CACHE_SHADOW"
+
+# 比對快取結果與實際結果時看的前幾名 chunk
+VERIFY_TOP_N = 3
+
+# threshold_report 預設評估的門檻
+REPORT_THRESHOLDS = (0.80, 0.85, 0.88, 0.90, 0.92, 0.94, 0.96, 0.98)
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def read_threshold() -> Optional[float]:
+    """讀取 cosine 門檻（未設定、0 或無效值時回傳 None，即停用）"""
+    value = os.environ.get(THRESHOLD_ENV, "").strip()
+    if not value:
+        return None
+    try:
+        threshold = float(value)
+    except ValueError:
+        logger.warning(f"{THRESHOLD_ENV}={value!r} 不是有效的數字，語意快取停用")
+        return None
+    return threshold if 0 < threshold <= 1 else None
+
+
+class SemanticQueryCache:
+    """語意近似查詢快取（LRU；只在 event loop 上存取）"""
+
+    def __init__(self, threshold: Optional[float] = None, shadow: bool = False,
+                 max_entries: int = 256, max_samples: int = 1000):
+        """
+        初始化快取
+
+        Args:
+            threshold: cosine 門檻，None 時停用
+            shadow: 影子模式，只比對與統計，不回傳快取結果
+            max_entries: 最大快取查詢數
+            max_samples: 保留的比對樣本數（調整門檻用）
+        """
+        self.threshold = threshold
+        self.shadow = shadow
+        self.max_entries = max_entries
+        self.max_samples = max_samples
+        # key: (category, generation, query) → {"query", "embedding", "result", "top_ids"}
+        self.entries: OrderedDict[tuple[str, str, str], dict] = OrderedDict()
+        self._generation: Optional[str] = None
+        self._hits = 0
+        self._misses = 0
+        self._false_hits = 0
+        # 影子模式的比對樣本：(相似度, 快取結果與實際結果是否一致)
+        self.samples: list[tuple[float, bool]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None
+
+    def _switch_generation(self, generation: str) -> None:
+        """索引世代改變時清掉舊世代的查詢"""
+        if generation != self._generation:
+            self.entries.clear()
+            self._generation = generation
+
+    def lookup(self, embedding, category: str, generation: str) -> Optional[dict]:
+        """
+        找出同 category、同世代中最相近且達門檻的查詢
+
+        Returns:
+            {"query", "result", "top_ids", "similarity"}，沒有時返回 None
+        """
+        if not self.enabled:
+            return None
+        self._switch_generation(generation)
+
+        keys = [key for key in self.entries if key[0] == category]
+        if keys:
+            matrix = np.stack([self.entries[key]["embedding"] for key in keys])
+            similarities = matrix @ _unit(embedding)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= self.threshold:
+                self.entries.move_to_end(keys[best])
+                self._hits += 1
+                entry = self.entries[keys[best]]
+                return {
+                    "query": entry["query"],
+                    "result": entry["result"],
+                    "top_ids": entry["top_ids"],
+                    "similarity": similarity,
+                }
+
+        self._misses += 1
+        return None
+
+    def add(self, query: str, embedding, category: str, generation: str, result: str, top_ids: list[str]) -> None:
+        """存入查詢向量與結果（top_ids 為結果的前幾名 chunk id，供影子模式比對）"""
+        if not self.enabled:
+            return
+        self._switch_generation(generation)
+
+        key = (category, generation, query)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        elif len(self.entries) >= self.max_entries:
+            self.entries.popitem(last=False)
+        self.entries[key] = {
+            "query": query,
+            "embedding": _unit(embedding),
+            "result": result,
+            "top_ids": list(top_ids[:VERIFY_TOP_N]),
+        }
+
+    def verify(self, candidate: dict, fresh_top_ids: list[str]) -> bool:
+        """
+        影子模式：比較快取候選與實際搜尋的前幾名 chunk，記錄是否為誤判
+
+        Returns:
+            快取結果是否與實際結果一致
+        """
+        same = set(candidate["top_ids"]) == set(fresh_top_ids[:VERIFY_TOP_N])
+        if not same:
+            self._false_hits += 1
+            logger.info(f"語意快取誤判（相似度 {candidate['similarity']:.3f}）: {candidate['query']!r}")
+        self.samples.append((candidate["similarity"], same))
+        del self.samples[:-self.max_samples]
+        return same
+
+    def threshold_report(self, thresholds: tuple = REPORT_THRESHOLDS) -> list[dict]:
+        """
+        依影子模式樣本，估計各門檻下的命中數與誤判率
+
+        只有相似度達目前門檻的查詢會被比對，因此低於目前門檻的估計需以較低門檻蒐集樣本。
+        """
+        report = []
+        for threshold in thresholds:
+            matched = [same for similarity, same in self.samples if similarity >= threshold]
+            false_hits = matched.count(False)
+            report.append({
+                "threshold": threshold,
+                "hits": len(matched),
+                "false_hits": false_hits,
+                "false_hit_rate": f"{(false_hits / len(matched) if matched else 0.0):.1%}",
+            })
+        return report
+
+    def clear(self) -> None:
+        """清空快取與統計"""
+        self.entries.clear()
+        self.samples.clear()
+        self._hits = 0
+        self._misses = 0
+        self._false_hits = 0
+
+    def stats(self) -> dict:
+        """
+        獲取快取統計資訊
+
+        Returns:
+            統計資訊字典（false_hits 只在影子模式下統計）
+        """
+        total = self._hits + self._misses
+        hit_rate = self._hits / total if total > 0 else 0.0
+        verified = len(self.samples)
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "shadow": self.shadow,
+            "size": len(self.entries),
+            "max_size": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": f"{hit_rate:.1%}",
+            "verified": verified,
+            "false_hits": self._false_hits,
+            "false_hit_rate": f"{(self._false_hits / verified if verified else 0.0):.1%}",
+        }
+
+
+# 全域快取實例（設定取自環境變數）
+_semantic_cache = SemanticQueryCache(
+    threshold=read_threshold(),
+    shadow=os.environ.get(SHADOW_ENV, "").strip().lower() in ("1", "true", "yes", "on"),
+)
+
+
+def get_semantic_cache() -> SemanticQueryCache:
+    """獲取全域語意快取實例"""
+    return _semantic_cache
+
+
+async def replay_query_log(path: str, collect_threshold: float = min(REPORT_THRESHOLDS)) -> list[dict]:
+    """
+    以影子模式重播查詢紀錄，回傳各門檻下的命中數與誤判率
+
+    Args:
+        path: 查詢紀錄檔（每行一個查詢，或「category<TAB>查詢」）
+        collect_threshold: 蒐集樣本用的門檻（應不高於要評估的最低門檻）
+    """
+    global _semantic_cache
+    import search_cache
+    import server
+
+    original, original_results = _semantic_cache, search_cache._search_cache
+    _semantic_cache = SemanticQueryCache(threshold=collect_threshold, shadow=True, max_samples=10 ** 6)
+    # 不使用本機既有的結果快取，重播的重複查詢仍只在記憶體層命中
+    search_cache._search_cache = search_cache.SearchCache()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                category, _, query = line.rstrip("\n").rpartition("\t")
+                if query.strip():
+                    await server.search_knowledge_base(query.strip(), category.strip() or "all")
+        return _semantic_cache.threshold_report()
+    finally:
+        _semantic_cache, search_cache._search_cache = original, original_results
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    if len(sys.argv) != 2:
+        print("用法: python semantic_cache.py <查詢紀錄檔>")
+        sys.exit(1)
+
+    print(f"{'門檻':>6} {'命中':>6} {'誤判':>6} {'誤判率':>8}")
+    for row in asyncio.run(replay_query_log(sys.argv[1])):
+        print(f"{row['threshold']:>6.2f} {row['hits']:>6} {row['false_hits']:>6} {row['false_hit_rate']:>8}")
@@ -18,10 +18,10 @@ from enrich_answer import MCP_enrich_answer
 from ingest_reference_document import MCP_ingest_reference_document, MCP_read_document_for_tagging, MCP_ingest_tagged_chunks, MCP_retrieve_reference_chunks
 from section_generation_prompt import MCP_get_section_generation_prompt
 from ai_draft_review import MCP_get_ai_draft_review_prompt
+from keyword_matcher import KeywordMatcher
+import asyncio
 import os
-import glob
 import re
-import time
 import math
 import subprocess
 import logging
@@ -225,6 +225,11 @@ async def list_tools() -> list[Tool]:
                         "description": "文件類別（可選）",
                         "enum": ["methodology", "faq", "checklist", "case_study", "template", "all"],
                         "default": "all"
+                    },
+                    "debug": {
+                        "type": "boolean",
+                        "description": "附上各搜尋階段的耗時與候選數（除錯用）",
+                        "default": False
                     }
                 },
                 "required": ["query"]
@@ -535,6 +540,30 @@ async def list_tools() -> list[Tool]:
                 },
                 "required": ["section_index"]
             }
+        ),
+        Tool(
+            name="get_server_status",
+            description="查看 MCP server 狀態：索引與模型是否已載入（預熱進度）、索引大小、載入耗時、搜尋快取統計。搜尋結果顯示「模型載入中」時可用來確認進度。",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        ),
+        Tool(
+            name="get_search_metrics",
+            description="查看搜尋效能統計：自 server 啟動以來各搜尋階段（快取、關鍵字、語意、rerank、MMR 等）的耗時分布（平均、p50、p95、p99）、候選數與錯誤次數，以及快取命中比例。",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "reset": {
+                        "type": "boolean",
+                        "description": "讀取後清空統計",
+                        "default": False
+                    }
+                },
+                "required": []
+            }
         )
     ]
 
@@ -543,9 +572,34 @@ async def list_tools() -> list[Tool]:
 # ============================================
 
 
+# 冪等（不寫入狀態）且耗時的 tool：相同參數的呼叫同時進行時只執行一次（見 single_flight.py）
+COALESCED_TOOLS = frozenset({
+    "search_knowledge_base",
+    "read_document",
+    "read_document_for_tagging",
+    "retrieve_reference_chunks",
+    "verify_company_eligibility_by_g0v",
+    "query_moea_statistics",
+    "search_moea_website",
+    "check_proposal",
+    "check_proposal_quality",
+})
+
+
 @app.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     """執行工具"""
+    if name in COALESCED_TOOLS:
+        from single_flight import canonical_arguments, get_single_flight
+        return await get_single_flight().run(
+            (name, canonical_arguments(arguments)),
+            lambda: dispatch_tool(name, arguments)
+        )
+    return await dispatch_tool(name, arguments)
+
+
+async def dispatch_tool(name: str, arguments: Any) -> list[TextContent]:
+    """依名稱呼叫對應的工具實作"""
     if name == "save_extracted_answers":
         res = await MCP_save_extracted_answers(arguments["project_id"], arguments["section_id"], arguments["answers"])
         return [TextContent(type="text", text=res)]
@@ -594,7 +648,8 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     elif name == "search_knowledge_base":
         res = await search_knowledge_base(
             arguments["query"],
-            arguments.get("category", "all")
+            arguments.get("category", "all"),
+            arguments.get("debug", False)
         )
         return [TextContent(type="text", text=str(res))] if not isinstance(res, list) else res
     elif name == "read_document":
@@ -653,6 +708,10 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     elif name == "get_ai_draft_review_prompt":
         res = await MCP_get_ai_draft_review_prompt(arguments["section_index"])
         return [TextContent(type="text", text=res)]
+    elif name == "get_server_status":
+        return await get_server_status()
+    elif name == "get_search_metrics":
+        return await get_search_metrics(arguments.get("reset", False))
     else:
         raise ValueError(f"Unknown tool: {name}")
 
@@ -663,248 +722,191 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
 # 取得專案根目錄（server.py 的上一層）
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# 版本檢查（每天最多檢查一次）
-LAST_VERSION_CHECK = 0.0
-VERSION_CHECK_INTERVAL = 86400  # 24 小時
-
+# 索引目錄（向量索引與關鍵字倒排索引）
+PERSIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_db")
 
-def check_for_updates() -> str | None:
-    """
-    檢查是否有新版本可用
-    返回更新提醒訊息，如果已是最新則返回 None
-    """
-    global LAST_VERSION_CHECK
-
-    current_time = time.time()
-
-    # 每 24 小時只檢查一次
-    if current_time - LAST_VERSION_CHECK < VERSION_CHECK_INTERVAL:
-        return None
-
-    LAST_VERSION_CHECK = current_time
-
-    try:
-        # 取得本地最新 commit
-        local_result = subprocess.run(
-            ["git", "rev-parse", "HEAD"],
-            cwd=PROJECT_ROOT,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if local_result.returncode != 0:
-            return None
-        local_commit = local_result.stdout.strip()[:7]
-
-        # 取得遠端最新 commit
-        subprocess.run(
-            ["git", "fetch", "--quiet"],
-            cwd=PROJECT_ROOT,
-            capture_output=True,
-            timeout=10
-        )
-
-        remote_result = subprocess.run(
-            ["git", "rev-parse", "origin/main"],
-            cwd=PROJECT_ROOT,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if remote_result.returncode != 0:
-            return None
-        remote_commit = remote_result.stdout.strip()[:7]
-
-        # 比較版本
-        if local_commit != remote_commit:
-            return f"\n\n---\n💡 **有新版本可用！** 您的版本：`{local_commit}`，最新版本：`{remote_commit}`\n請說「**更新知識庫**」來獲得最新內容。"
-
-        return None
-
-    except Exception:
-        # 任何錯誤都靜默忽略
-        return None
-
-
-async def search_knowledge_base(query: str, category: str = "all") -> str:
+async def search_knowledge_base(query: str, category: str = "all", debug: bool = False) -> str:
     """
     搜尋知識庫
     混合搜尋：關鍵字 + RAG 語意搜尋
-    """
 
-    # ===== 0. 檢查快取 =====
-    from search_cache import get_cache
-    cache = get_cache()
-    cached_result = cache.get(query, category)
-    if cached_result:
-        return cached_result + "\n\n💡 *此結果來自快取，回應速度更快*"
-
-    # 定義搜尋目錄
-    search_dirs = {
-        "methodology": "references/methodology_*.md",
-        "faq": "faq/*.md",
-        "checklist": "checklists/*.md",
-        "case_study": "examples/case_studies/*.md",
-        "template": "templates/*.md",
-        "all": "**/*.md"
-    }
+    每個階段的耗時與候選數記錄在 SearchTrace 並累計到搜尋統計（見 search_trace.py），
+    debug=True 時附在結果後面。
+    """
+    from search_trace import SearchTrace, get_metrics
 
-    pattern = search_dirs.get(category, "**/*.md")
-    search_path = os.path.join(PROJECT_ROOT, pattern)
+    trace = SearchTrace()
+    result = await _search_knowledge_base(query, category, trace)
+    get_metrics().record(trace.finish())
+    if debug:
+        result += trace.to_markdown()
+    return result
 
-    # 搜尋檔案
-    files = glob.glob(search_path, recursive=True)
 
-    # ===== 1. 關鍵字搜尋（含同義詞擴展）=====
-    from query_expansion import get_expanded_keywords
-    keywords = get_expanded_keywords(query)
-    keyword_results = {}  # path -> score
+async def rank_chunks(query: str, category: str, trace, mode: str = "hybrid") -> tuple[list, bool, bool]:
+    """
+    檢索並排序 chunk（搜尋流程中快取與格式化以外的部分）
 
-    for file_path in files:
-        file_name = os.path.basename(file_path).lower()
-        relative_path = os.path.relpath(file_path, PROJECT_ROOT)
+    Args:
+        query: 查詢字串
+        category: 文件類別
+        trace: SearchTrace
+        mode: "hybrid"（完整流程）、"keyword"（只用 BM25F）或 "semantic"（只用向量搜尋，
+              不 rerank、不做 MMR）；後兩者供 benchmark.py 比較各檢索方式
 
+    Returns:
+        (排序後的 chunk 資訊, 語意搜尋是否可用, 是否因模型預熱而略過階段)
+    """
+    # 阻塞的索引查詢與模型推論都交給 worker_pool，event loop 可同時處理其他 tool 呼叫
+    from worker_pool import run_blocking
+    import warmup
+
+    # 背景預熱尚未完成的模型不等待，該階段直接略過（結果不寫入快取）
+    warming_up = False
+
+    # ===== 1. 關鍵字搜尋（含同義詞擴展，預建倒排索引 + BM25F，chunk 層級）=====
+    from query_expansion import get_weighted_keywords
+    from keyword_index import get_keyword_index, get_category_keys
+    with trace.stage("synonym_expansion") as stage:
+        weighted_keywords = get_weighted_keywords(query)
+        stage.items_out = len(weighted_keywords)
+    keywords = [kw for kw, _ in weighted_keywords]
+
+    async def keyword_stage() -> list:
+        """依 BM25F 分數排序的 chunk"""
+        if mode == "semantic":
+            return []
+        stage = trace.begin("keyword_scan", items_in=len(weighted_keywords))
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read().lower()
-
-            score = 0
-            matched_keywords = []
-
-            for keyword in keywords:
-                if keyword in file_name:
-                    score += 3
-                    matched_keywords.append(keyword)
-                elif keyword in content:
-                    count = min(content.count(keyword), 5)
-                    score += count
-                    matched_keywords.append(keyword)
-
-            if score > 0:
-                keyword_results[relative_path] = {
-                    "path": relative_path,
-                    "name": os.path.basename(file_path),
-                    "category": get_category_from_path(relative_path),
-                    "keyword_score": score,
-                    "matched_keywords": len(set(matched_keywords)),
-                    "total_keywords": len(keywords)
-                }
-        except (OSError, UnicodeDecodeError) as e:
-            logger.debug(f"無法讀取檔案 {file_path}: {e}")
-            continue
+            hits = await run_blocking(
+                lambda: get_keyword_index(PERSIST_DIR).search_chunks(weighted_keywords, category, top_k=30)
+            )
+        except Exception as e:
+            logger.warning(f"關鍵字索引不可用: {e}")
+            trace.fail("keyword_scan", e)
+            hits = []
+        stage.end(items_out=len(hits))
+        return hits
 
     # ===== 2. 語意搜尋 (RAG) =====
-    semantic_results = {}  # path -> {similarity, content, metadata}
-    semantic_available = False
-
-    try:
-        from vector_search import semantic_search, needs_reindex, rerank_results, mmr_sort
-
-        persist_dir = os.path.join(os.path.dirname(__file__), "chroma_db")
-
-        if not needs_reindex(persist_dir):
-            semantic_available = True
-            results = semantic_search(query, persist_dir, n_results=15)
-
-            for result in results:
-                semantic_results[result["id"]] = {
-                    "similarity": result["similarity"],
-                    "content": result.get("content", ""),
-                    "metadata": result.get("metadata", {})
-                }
-    except Exception as e:
-        # 語意搜尋不可用，僅使用關鍵字搜尋
-        logger.warning(f"語意搜尋不可用: {e}")
-
-    # ===== 3. 混合排序 =====
+    async def semantic_stage() -> tuple[bool, list]:
+        """(語意搜尋是否可用, 依相似度排序的 chunk)"""
+        nonlocal warming_up
+        if mode == "keyword":
+            return False, []
+        if warmup.is_loading("vector_index") or warmup.is_loading("embedding_model"):
+            warming_up = True
+            trace.skip("semantic_query", "模型預熱中")
+            return False, []
+
+        stage = trace.begin("semantic_query")
+        try:
+            from vector_search import semantic_search, needs_reindex
+
+            if await run_blocking(needs_reindex, PERSIST_DIR):
+                stage.end(note="尚未建立向量索引")
+                return False, []
+            hits = await run_blocking(semantic_search, query, PERSIST_DIR, n_results=15)
+            filtered = [
+                hit for hit in hits
+                if category == "all"
+                or category in get_category_keys(hit.get("metadata", {}).get("file_path") or hit["id"].split("::")[0])
+            ]
+            stage.items_in = len(hits)
+            stage.end(items_out=len(filtered))
+            return True, filtered
+        except Exception as e:
+            # 語意搜尋不可用，僅使用關鍵字搜尋
+            logger.warning(f"語意搜尋不可用: {e}")
+            trace.fail("semantic_query", e)
+            stage.end()
+            return False, []
+
+    # 兩個階段互不相依，同時執行
+    keyword_hits, (semantic_available, semantic_hits) = await asyncio.gather(keyword_stage(), semantic_stage())
+
+    # ===== 3. 混合排序（chunk 層級 Reciprocal Rank Fusion）=====
+    from search_fusion import reciprocal_rank_fusion
+    stage = trace.begin("fusion", items_in=len(keyword_hits) + len(semantic_hits))
     KEYWORD_WEIGHT = 0.4
     SEMANTIC_WEIGHT = 0.6
 
-    all_paths = set(keyword_results.keys()) | set(semantic_results.keys())
+    fused_scores = reciprocal_rank_fusion([
+        ([hit["id"] for hit in keyword_hits], KEYWORD_WEIGHT),
+        ([hit["id"] for hit in semantic_hits], SEMANTIC_WEIGHT if semantic_available else 0.0),
+    ])
 
-    # 正規化關鍵字分數
-    max_keyword_score = max([float(str(r["keyword_score"])) for r in keyword_results.values()], default=1.0)
+    keyword_by_id = {hit["id"]: hit for hit in keyword_hits}
+    semantic_by_id = {hit["id"]: hit for hit in semantic_hits}
 
     final_scores = []
-    for path in all_paths:
-        # 關鍵字分數（正規化到 0-1）
-        kw_info = keyword_results.get(path, {})
-        kw_score = float(str(kw_info.get("keyword_score", 0))) / max_keyword_score if max_keyword_score > 0 else 0
-
-        # 語意分數（已經是 0-1）
-        sem_info = semantic_results.get(path, {})
-        sem_score = float(str(sem_info.get("similarity", 0))) if isinstance(sem_info, dict) else 0.0
-
-        # 加權總分
-        if semantic_available:
-            final_score = kw_score * KEYWORD_WEIGHT + sem_score * SEMANTIC_WEIGHT
-        else:
-            final_score = kw_score  # 只有關鍵字
-
-        # 取得文件資訊
-        if path in keyword_results:
-            info = keyword_results[path].copy()
-        else:
-            # 從語意結果取得 metadata
-            sem_metadata = sem_info.get("metadata", {}) if isinstance(sem_info, dict) else {}
-            info = {
-                "path": sem_metadata.get("file_path", path),
-                "name": sem_metadata.get("file", os.path.basename(path)),
-                "category": get_category_from_path(path),
-                "matched_keywords": 0,
-                "total_keywords": len(keywords)
-            }
-
-        info["final_score"] = final_score
-        info["semantic_score"] = sem_score
-
-        # 從語意結果取得內容預覽
-        if isinstance(sem_info, dict):
-            content = sem_info.get("content", "")
-            metadata = sem_info.get("metadata", {})
+    for chunk_id, final_score in fused_scores.items():
+        kw_hit = keyword_by_id.get(chunk_id, {})
+        sem_hit = semantic_by_id.get(chunk_id, {})
+        metadata = sem_hit.get("metadata") or kw_hit.get("metadata", {})
+        path = kw_hit.get("path") or metadata.get("file_path") or chunk_id.split("::")[0]
+        content = kw_hit.get("content") or sem_hit.get("content", "")
+
+        info = {
+            "id": chunk_id,
+            "path": path,
+            "name": kw_hit.get("name") or metadata.get("file", os.path.basename(path)),
+            "category": get_category_from_path(path),
+            "matched_keywords": kw_hit.get("matched_keywords", 0),
+            "total_keywords": len(keywords),
+            "keyword_score": kw_hit.get("keyword_score", 0.0),
+            "semantic_score": float(sem_hit.get("similarity", 0.0)),
+            "final_score": final_score,
+            # rerank 直接使用 chunk 內容（關鍵字索引已保存內容，不需重新開檔）
+            "content": content,
+        }
 
-            if metadata.get("preview"):
-                info["preview"] = metadata.get("preview")
+        if metadata.get("preview"):
+            info["preview"] = metadata.get("preview")
 
-            if content:
-                # Bug Y1 fix: was 100 chars (barely one sentence). Increased to 1000 to give Claude
-                # meaningful context from each search result rather than a fragment.
-                info["content_snippet"] = content[:1000].replace('\n', ' ').strip()
+        if content:
+            # Bug Y1 fix: was 100 chars (barely one sentence). Increased to 1000 to give Claude
+            # meaningful context from each search result rather than a fragment.
+            info["content_snippet"] = content[:1000].replace('\n', ' ').strip()
 
-            # 提取來源資訊
-            if metadata.get("source_url"):
-                info["source_url"] = metadata.get("source_url")
-            if metadata.get("source_title"):
-                info["source_title"] = metadata.get("source_title")
-            if metadata.get("source_date"):
-                info["source_date"] = metadata.get("source_date")
+        # 提取來源資訊
+        if metadata.get("source_url"):
+            info["source_url"] = metadata.get("source_url")
+        if metadata.get("source_title"):
+            info["source_title"] = metadata.get("source_title")
+        if metadata.get("source_date"):
+            info["source_date"] = metadata.get("source_date")
 
         final_scores.append(info)
 
+    final_scores.sort(key=lambda x: x["final_score"], reverse=True)
+    stage.end(items_out=len(final_scores))
+
     # ===== 3.5. 先進行 Re-ranking (對前 20 名) =====
     # 只有當 semantic_available 為真時才進行，因為需要模型
-    if semantic_available and len(final_scores) > 0:
+    if mode != "hybrid":
+        trace.skip("rerank", f"{mode} 模式")
+    elif semantic_available and len(final_scores) > 0 and warmup.is_loading("rerank_model"):
+        warming_up = True
+        trace.skip("rerank", "模型預熱中")
+    elif semantic_available and len(final_scores) > 0:
         # 取前 20 名進行重排序
         top_candidates = final_scores[:20]
         remaining = final_scores[20:]
 
-        # 準備 Re-ranking 需要的格式 (需有 content)
-        # 注意：keyword search 結果可能沒有 content，需要處理
-        for cand in top_candidates:
-            if "content" not in cand:
-                # 嘗試讀取部分內容
-                try:
-                    with open(os.path.join(str(PROJECT_ROOT), str(cand["path"])), 'r', encoding='utf-8') as f:
-                        cand["content"] = f.read(1000)  # 只讀前 1000 字
-                except (OSError, UnicodeDecodeError):
-                    cand["content"] = cand["name"]  # 降級使用檔名
-
         # 執行 Re-ranking
+        stage = trace.begin("rerank", items_in=len(top_candidates))
         try:
-            reranked = rerank_results(query, top_candidates, top_k=20)
+            from vector_search import rerank_results
+            reranked = await run_blocking(rerank_results, query, top_candidates, top_k=20)
             final_scores = reranked + remaining
+            stage.end(items_out=len(reranked))
         except Exception as e:
-            print(f"Re-ranking 步驟錯誤: {e}")
+            logger.warning(f"Re-ranking 步驟錯誤: {e}")
+            trace.fail("rerank", e)
+            stage.end()
+    else:
+        trace.skip("rerank", "沒有候選" if semantic_available else "語意搜尋不可用")
 
     # ===== 3.6. 時間加權 =====
 
@@ -936,25 +938,98 @@ async def search_knowledge_base(query: str, category: str = "all") -> str:
             return score
 
     # 應用時間加權
+    stage = trace.begin("time_weighting", items_in=len(final_scores))
+    weighted = 0
     for info in final_scores:
         if source_date := info.get("source_date"):
             # 優先使用 rerank_score，如果沒有則使用 final_score
             target_score_key = "rerank_score" if "rerank_score" in info else "final_score"
             info[target_score_key] = apply_time_weight(float(str(info[target_score_key])), str(source_date))
+            weighted += 1
+    stage.end(items_out=len(final_scores), note=f"{weighted} 筆依發布日期加權")
 
     # ===== 3.7. MMR 多樣性排序 =====
-    if semantic_available and len(final_scores) > 0:
+    stage = trace.begin("mmr", items_in=len(final_scores))
+    if mode == "hybrid" and semantic_available and len(final_scores) > 0:
         try:
-            final_scores = mmr_sort(final_scores, lambda_param=0.7)
+            from vector_search import cosine_kernel, get_chunk_embeddings, mmr_sort
+
+            # 候選都有 embedding 時以 cosine 相似度衡量重複，否則退回「同檔案即重複」
+            similarity, redundancy = None, "sum"
+            try:
+                embeddings = await run_blocking(get_chunk_embeddings, [info["id"] for info in final_scores], PERSIST_DIR)
+                if all(info["id"] in embeddings for info in final_scores):
+                    similarity = cosine_kernel([embeddings[info["id"]] for info in final_scores])
+                    redundancy = "max"
+            except Exception as e:
+                logger.warning(f"取得 chunk embeddings 失敗，MMR 改以檔案判斷重複: {e}")
+
+            # 只有前 10 筆會顯示，選滿即停；其餘維持原順序接在後面
+            diversified = mmr_sort(final_scores, lambda_param=0.7, top_k=10,
+                                   similarity=similarity, redundancy=redundancy)
+            picked = {id(info) for info in diversified}
+            final_scores = diversified + [info for info in final_scores if id(info) not in picked]
+            stage.note = "embedding cosine" if similarity is not None else "同檔案判斷"
         except Exception as e:
-            print(f"MMR 步驟錯誤: {e}")
+            logger.warning(f"MMR 步驟錯誤: {e}")
+            trace.fail("mmr", e)
             # 降級：按分數排序
             final_scores.sort(key=lambda x: float(str(x.get("rerank_score", x.get("final_score", 0)))), reverse=True)
     else:
         # 僅按分數排序
         final_scores.sort(key=lambda x: float(str(x.get("rerank_score", x.get("final_score", 0)))), reverse=True)
+        stage.note = "僅依分數排序"
+    stage.end(items_out=len(final_scores))
+
+    return final_scores, semantic_available, warming_up
+
+
+async def _search_knowledge_base(query: str, category: str, trace) -> str:
+    """混合搜尋流程（各階段記錄於 trace）"""
+
+    # ===== 0. 檢查快取 =====
+    from index_generation import get_generation
+    from search_cache import get_cache
+    with trace.stage("cache_lookup"):
+        cache = get_cache()
+        generation = get_generation(PERSIST_DIR)
+        cached_result = cache.get(query, category, generation=generation)
+    if cached_result:
+        trace.outcome = "cache_hit"
+        return cached_result + "\n\n💡 *此結果來自快取，回應速度更快*"
+
+    # 阻塞的索引查詢與模型推論都交給 worker_pool，event loop 可同時處理其他 tool 呼叫
+    from worker_pool import run_blocking
+    import warmup
+
+    # ===== 0.5. 語意近似查詢快取（選用）=====
+    from semantic_cache import get_semantic_cache
+    semantic_cache = get_semantic_cache()
+    semantic_candidate = None
+    query_embedding = None
+    if semantic_cache.enabled and not warmup.is_loading("embedding_model"):
+        with trace.stage("semantic_cache") as stage:
+            try:
+                from vector_search import encode_query
+                query_embedding = await run_blocking(encode_query, query)
+                semantic_candidate = semantic_cache.lookup(query_embedding, category, generation)
+            except Exception as e:
+                logger.warning(f"語意快取不可用: {e}")
+                trace.fail("semantic_cache", e)
+            if semantic_candidate is not None:
+                stage.note = f"相近查詢「{semantic_candidate['query']}」（相似度 {semantic_candidate['similarity']:.2f}）"
+        if semantic_candidate is not None and not semantic_cache.shadow:
+            trace.outcome = "semantic_cache_hit"
+            return (
+                semantic_candidate["result"]
+                + f"\n\n💡 *此結果來自相近查詢「{semantic_candidate['query']}」的快取"
+                + f"（相似度 {semantic_candidate['similarity']:.2f}）*"
+            )
+
+    final_scores, semantic_available, warming_up = await rank_chunks(query, category, trace)
 
     # ===== 4. 格式化結果 =====
+    formatting = trace.begin("formatting", items_in=len(final_scores))
     if not final_scores:
         result = f"""
 ## 搜尋結果
@@ -1016,9 +1091,11 @@ async def search_knowledge_base(query: str, category: str = "all") -> str:
             result += f"\n（還有 {len(final_scores) - 10} 個相關段落未顯示）\n"
 
         # ===== 5. 搜尋建議 =====
+        stage = trace.begin("suggestions", items_in=len(final_scores))
         try:
             from search_suggestions import generate_suggestions
             suggestions = generate_suggestions(query, final_scores)
+            stage.items_out = len(suggestions)
 
             if suggestions:
                 result += "\n💡 **您可能也想了解**：\n"
@@ -1028,9 +1105,13 @@ async def search_knowledge_base(query: str, category: str = "all") -> str:
                     # 但 Claude 不一定支援 command link，直接列出文字即可
                     result += f"- {sugg}\n"
         except Exception as e:
-            print(f"搜尋建議生成失敗: {e}")
+            logger.warning(f"搜尋建議生成失敗: {e}")
+            trace.fail("suggestions", e)
+        stage.end()
 
-        if not semantic_available:
+        if warming_up:
+            result += "\n⏳ **提示**：AI 語意模型仍在背景載入中，本次結果未經完整語意排序，稍後再查詢即可使用完整的混合搜尋（可用 `get_server_status` 查看進度）。\n"
+        elif not semantic_available:
             result += "\n💡 **提示**：執行 `python mcp-server/build_index.py` 可啟用 AI 語意搜尋，提升搜尋準確度。\n"
 
         # 加入引用說明
@@ -1040,17 +1121,190 @@ async def search_knowledge_base(query: str, category: str = "all") -> str:
         result += "- 答案會包含具體的來源引用\n"
         result += "- 如需查證，可使用 `read_document` 工具閱讀完整文件\n"
 
-    # 寫回快取
-    cache.set(query, category, result)
+    formatting.end(items_out=min(len(final_scores), 10))
 
-    # 檢查是否有新版本
-    update_notice = check_for_updates()
+    # 寫回快取（預熱期間的降級結果不快取）
+    if warming_up:
+        trace.outcome = "degraded"
+    else:
+        cache.set(query, category, result, generation=generation)
+        top_ids = [info["id"] for info in final_scores]
+        if semantic_candidate is not None:  # 影子模式：比對快取候選與實際結果
+            semantic_cache.verify(semantic_candidate, top_ids)
+        if query_embedding is not None:
+            semantic_cache.add(query, query_embedding, category, generation, result, top_ids)
+
+    # 背景版本檢查的結果（搜尋本身不執行 git）
+    import update_check
+    update_notice = update_check.take_notice()
     if update_notice:
         result += update_notice
 
     return result
 
 
+async def get_server_status() -> list[TextContent]:
+    """
+    Server 狀態：預熱進度、索引大小、載入耗時、快取統計
+    （只讀取已載入的狀態，不會觸發模型載入）
+    """
+    import warmup
+    from embedding_cache import get_embedding_cache
+    from keyword_index import get_loaded_keyword_index
+    from model_registry import MODEL_LABELS, get_model_registry
+    from onnx_backend import read_inference_backend
+    from rerank_cache import get_rerank_cache
+    from search_cache import get_cache
+    from semantic_cache import get_semantic_cache
+    from single_flight import get_single_flight
+    from worker_pool import get_worker_count
+    import update_check
+
+    status = warmup.get_status()
+    state_labels = {
+        "cold": "⚪ 未載入",
+        "loading": "⏳ 載入中",
+        "warm": "✅ 已就緒",
+        "skipped": "⏭️ 略過",
+        "failed": "❌ 失敗",
+    }
+
+    if not status["enabled"]:
+        warmup_desc = f"已關閉（{warmup.PREWARM_ENV}=0，第一次搜尋時才載入）"
+    elif status["done"]:
+        warmup_desc = "已完成"
+    elif status["started"]:
+        warmup_desc = "進行中（搜尋暫以關鍵字為主）"
+    else:
+        warmup_desc = "尚未開始"
+
+    output = f"""# 🩺 SBIR MCP Server 狀態
+
+**背景預熱**：{warmup_desc}
+
+| 元件 | 狀態 | 載入耗時 | 說明 |
+|------|------|----------|------|
+"""
+    for name, info in status["components"].items():
+        seconds = f"{info['seconds']:.2f} 秒" if "seconds" in info else "-"
+        output += f"| {warmup.COMPONENT_LABELS[name]} | {state_labels.get(info['state'], info['state'])} | {seconds} | {info.get('error', '')} |\n"
+
+    output += "\n## 索引大小\n\n"
+    keyword_index = get_loaded_keyword_index()
+    if keyword_index is not None:
+        output += f"- 關鍵字索引：{len(keyword_index.docs)} 個文件、{len(keyword_index.chunks)} 個 chunks、{len(keyword_index.postings)} 個詞彙\n"
+    else:
+        output += "- 關鍵字索引：尚未載入\n"
+
+    if status["components"]["vector_index"]["state"] == "warm":
+        from vector_search import get_index_count, get_vector_backend
+        from worker_pool import run_blocking
+        output += f"- 向量索引（{get_vector_backend()}）：{await run_blocking(get_index_count, PERSIST_DIR)} 個 chunks\n"
+    else:
+        output += "- 向量索引：尚未載入或無法使用\n"
+    from index_versions import current_version
+    output += f"- 索引版本：{current_version(PERSIST_DIR) or '未版本化（chroma_db/）'}\n"
+
+    update_status = update_check.get_status()
+    if update_status["offline"]:
+        update_desc = f"離線模式（{update_check.OFFLINE_ENV}=1，不檢查）"
+    elif update_status["last_check"] is not None:
+        update_desc = f"上次檢查於 {datetime.fromtimestamp(update_status['last_check']):%Y-%m-%d %H:%M}（背景每 24 小時檢查一次）"
+    elif update_status["running"]:
+        update_desc = "已排程，尚未檢查"
+    else:
+        update_desc = "未啟動"
+
+    cache_stats = get_cache().stats()
+    flight_stats = get_single_flight().stats()
+    semantic_stats = get_semantic_cache().stats()
+    if not semantic_stats["enabled"]:
+        semantic_desc = "未啟用"
+    else:
+        semantic_desc = (
+            f"門檻 {semantic_stats['threshold']}{'（影子模式）' if semantic_stats['shadow'] else ''}，"
+            f"{semantic_stats['size']}/{semantic_stats['max_size']} 筆，命中率 {semantic_stats['hit_rate']}，"
+            f"已比對 {semantic_stats['verified']} 次、誤判率 {semantic_stats['false_hit_rate']}"
+        )
+    disk_stats = cache_stats["disk"]
+    if disk_stats is None:
+        disk_desc = "未啟用"
+    else:
+        disk_desc = (
+            f"{disk_stats['size']} 筆、{disk_stats['bytes'] / 1024:.0f}/{disk_stats['max_bytes'] / 1024:.0f} KB，"
+            f"命中 {disk_stats['hits']} / 未命中 {disk_stats['misses']}（命中率 {disk_stats['hit_rate']}）"
+        )
+    embedding_stats = get_embedding_cache().stats()
+    rerank_stats = get_rerank_cache().stats()
+    model_stats = get_model_registry().stats()
+    model_lines = ""
+    for kind, info in model_stats["models"].items():
+        if not info["loaded"]:
+            desc = "尚未載入"
+        else:
+            memory = info["parameter_bytes"] or info["rss_delta_bytes"]
+            desc = f"{info['backend']}，載入 {info['load_seconds']:.1f} 秒"
+            if memory:
+                desc += f"，約 {memory / 1024 / 1024:.0f} MB"
+        model_lines += f"- {MODEL_LABELS.get(kind, kind)} 模型（{info['name']}）：{desc}\n"
+    rss = model_stats["rss_bytes"]
+    output += f"""
+## 執行環境
+
+- 背景執行緒數：{get_worker_count()}
+- 推論後端設定：{read_inference_backend()}
+- 常駐記憶體：{f"{rss / 1024 / 1024:.0f} MB" if rss is not None else "無法取得"}
+{model_lines}- 新版本檢查：{update_desc}
+- 搜尋快取（記憶體）：{cache_stats['size']} 筆、{cache_stats['bytes'] / 1024:.0f}/{cache_stats['max_bytes'] / 1024:.0f} KB，命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}（命中率 {cache_stats['hit_rate']}）
+- 搜尋快取（磁碟）：{disk_desc}
+- 語意近似快取：{semantic_desc}
+- 合併的重複呼叫：{flight_stats['coalesced']}/{flight_stats['calls']} 次（目前執行中 {flight_stats['in_flight']} 個）
+- 查詢向量快取：{embedding_stats['size']}/{embedding_stats['max_size']} 筆，命中 {embedding_stats['hits']} / 未命中 {embedding_stats['misses']}（命中率 {embedding_stats['hit_rate']}）
+- Re-ranking 分數快取：{rerank_stats['size']}/{rerank_stats['max_size']} 組，本次啟動命中 {rerank_stats['hits']} / 未命中 {rerank_stats['misses']}（命中率 {rerank_stats['hit_rate']}）
+"""
+    return [TextContent(type="text", text=output)]
+
+
+async def get_search_metrics(reset: bool = False) -> list[TextContent]:
+    """
+    搜尋效能統計：各階段耗時分布、候選數與錯誤次數（見 search_trace.py）
+    """
+    from search_trace import OUTCOME_LABELS, STAGE_LABELS, get_metrics
+
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+    if reset:
+        metrics.reset()
+
+    total_searches = sum(snapshot["outcomes"].values())
+    if not total_searches:
+        return [TextContent(type="text", text="# 📊 搜尋效能統計\n\n自 server 啟動（或上次清空）以來尚無搜尋紀錄。")]
+
+    def ms(value) -> str:
+        return "-" if value is None else f"{value:.1f}"
+
+    output = f"# 📊 搜尋效能統計\n\n共 {total_searches} 次搜尋："
+    output += "、".join(
+        f"{OUTCOME_LABELS.get(outcome, outcome)} {count} 次（{count / total_searches:.0%}）"
+        for outcome, count in snapshot["outcomes"].items()
+    )
+    output += """
+
+| 階段 | 次數 | 平均 (ms) | p50 (ms) | p95 (ms) | p99 (ms) | 最大 (ms) | 平均候選數 in → out | 錯誤 | 略過 |
+|------|------|-----------|----------|----------|----------|-----------|----------------------|------|------|
+"""
+    for name, stat in snapshot["stages"].items():
+        counts = "-" if stat["avg_in"] is None else f"{stat['avg_in']:.1f} → {stat['avg_out']:.1f}"
+        output += (
+            f"| {STAGE_LABELS.get(name, name)} | {stat['count']} | {ms(stat['avg_ms'])} | {ms(stat['p50_ms'])} | "
+            f"{ms(stat['p95_ms'])} | {ms(stat['p99_ms'])} | {ms(stat['max_ms'])} | {counts} | {stat['errors']} | {stat['skipped']} |\n"
+        )
+    output += "\n💡 p50 / p95 / p99 為耗時分布所在區間的上界；搜尋時帶 `debug: true` 可看單次搜尋的各階段明細。\n"
+    if reset:
+        output += "\n（統計已清空）\n"
+    return [TextContent(type="text", text=output)]
+
+
 async def read_document(file_path: str) -> list[TextContent]:
     """
     讀取指定的文件內容
@@ -1238,8 +1492,10 @@ async def update_knowledge_base() -> list[TextContent]:
     從 GitHub 拉取最新版本的知識庫
     """
     try:
-        # 執行 git pull
-        result = subprocess.run(
+        # 執行 git pull（在 worker_pool 中執行，不阻塞其他 tool 呼叫）
+        from worker_pool import run_blocking
+        result = await run_blocking(
+            subprocess.run,
             ["git", "pull"],
             cwd=PROJECT_ROOT,
             capture_output=True,
@@ -1255,9 +1511,12 @@ async def update_knowledge_base() -> list[TextContent]:
                     text="✅ **知識庫已是最新版本！**\n\n您的 SBIR Skill 知識庫已經是最新的了，無需更新。"
                 )]
             else:
+                # 文件已更新，搜尋快取中的舊結果失效
+                from index_generation import bump_generation
+                bump_generation(PERSIST_DIR)
                 return [TextContent(
                     type="text",
-                    text=f"✅ **知識庫更新成功！**\n\n已從 GitHub 拉取最新版本。\n\n更新內容：\n```\n{output}\n```\n\n請重新啟動 Claude Desktop 以載入新內容。"
+                    text=f"✅ **知識庫更新成功！**\n\n已從 GitHub 拉取最新版本。\n\n更新內容：\n```\n{output}\n```\n\n若已建立語意索引，請執行 `python mcp-server/build_index.py --incremental`（只重建有變動的文件），再重新啟動 Claude Desktop 以載入新內容。"
                 )]
         else:
             error_msg = result.stderr.strip() or result.stdout.strip()
@@ -1564,87 +1823,94 @@ async def export_proposal_word(
 # ============================================
 
 
+# Phase 1 計畫書完整度檢核項目
+PHASE1_CHECKS = [
+    {
+        "category": "基本資訊",
+        "items": [
+            {"name": "公司名稱", "keywords": ["公司", "股份有限", "有限公司"]},
+            {"name": "計畫名稱", "keywords": ["計畫名稱", "計畫題目"]},
+            {"name": "計畫期程", "keywords": ["期程", "月", "年"]},
+        ]
+    },
+    {
+        "category": "問題陳述",
+        "items": [
+            {"name": "產業痛點描述", "keywords": ["痛點", "問題", "挑戰", "困難", "需求"]},
+            {"name": "現況說明", "keywords": ["現況", "目前", "現有", "傳統"]},
+            {"name": "問題量化數據", "keywords": ["億", "萬", "%", "比例", "統計"]},
+        ]
+    },
+    {
+        "category": "創新內容",
+        "items": [
+            {"name": "創新點描述", "keywords": ["創新", "突破", "獨創", "首創", "原創"]},
+            {"name": "與現有技術差異", "keywords": ["差異", "不同", "優於", "相較", "比較"]},
+            {"name": "技術優勢說明", "keywords": ["優勢", "優點", "特色", "領先"]},
+        ]
+    },
+    {
+        "category": "市場分析",
+        "items": [
+            {"name": "目標市場描述", "keywords": ["目標市場", "客戶", "TA", "使用者"]},
+            {"name": "市場規模（TAM/SAM/SOM）", "keywords": ["TAM", "SAM", "SOM", "市場規模", "產值"]},
+            {"name": "商業模式", "keywords": ["商業模式", "獲利", "營收", "收費"]},
+        ]
+    },
+    {
+        "category": "技術可行性",
+        "items": [
+            {"name": "技術方案說明", "keywords": ["技術", "方法", "架構", "系統"]},
+            {"name": "前期驗證成果", "keywords": ["驗證", "測試", "實驗", "前期", "雛型"]},
+            {"name": "風險評估", "keywords": ["風險", "挑戰", "困難"]},
+        ]
+    },
+    {
+        "category": "團隊介紹",
+        "items": [
+            {"name": "團隊成員", "keywords": ["團隊", "成員", "人員"]},
+            {"name": "相關經驗", "keywords": ["經驗", "經歷", "背景", "專長"]},
+            {"name": "分工規劃", "keywords": ["分工", "負責", "職責"]},
+        ]
+    },
+    {
+        "category": "執行計畫",
+        "items": [
+            {"name": "工作項目", "keywords": ["工作", "項目", "任務"]},
+            {"name": "時程規劃", "keywords": ["時程", "進度", "甘特", "月"]},
+            {"name": "查核點", "keywords": ["查核", "里程碑", "KPI", "指標"]},
+        ]
+    },
+    {
+        "category": "經費規劃",
+        "items": [
+            {"name": "人事費", "keywords": ["人事費", "薪資", "人力"]},
+            {"name": "材料費/設備費", "keywords": ["材料", "設備", "器材", "耗材"]},
+            {"name": "其他費用", "keywords": ["委託", "差旅", "管理費"]},
+        ]
+    },
+]
+
+# 所有檢核關鍵字編譯成一個自動機，計畫書全文只掃描一次（英文關鍵字依單字邊界比對）
+PHASE1_CHECK_MATCHER = KeywordMatcher(
+    (keyword for category in PHASE1_CHECKS for item in category["items"] for keyword in item["keywords"]),  # type: ignore
+    whole_word=True,
+)
+
+
 async def check_proposal(proposal_content: str, phase: str = "phase1") -> list[TextContent]:
     """
     檢核 SBIR 計畫書完整度
     這是「自我檢查工具」，不是「評審結果預測」
     """
 
-    # 定義 Phase 1 檢核項目
-    phase1_checks = [
-        {
-            "category": "基本資訊",
-            "items": [
-                {"name": "公司名稱", "keywords": ["公司", "股份有限", "有限公司"]},
-                {"name": "計畫名稱", "keywords": ["計畫名稱", "計畫題目"]},
-                {"name": "計畫期程", "keywords": ["期程", "月", "年"]},
-            ]
-        },
-        {
-            "category": "問題陳述",
-            "items": [
-                {"name": "產業痛點描述", "keywords": ["痛點", "問題", "挑戰", "困難", "需求"]},
-                {"name": "現況說明", "keywords": ["現況", "目前", "現有", "傳統"]},
-                {"name": "問題量化數據", "keywords": ["億", "萬", "%", "比例", "統計"]},
-            ]
-        },
-        {
-            "category": "創新內容",
-            "items": [
-                {"name": "創新點描述", "keywords": ["創新", "突破", "獨創", "首創", "原創"]},
-                {"name": "與現有技術差異", "keywords": ["差異", "不同", "優於", "相較", "比較"]},
-                {"name": "技術優勢說明", "keywords": ["優勢", "優點", "特色", "領先"]},
-            ]
-        },
-        {
-            "category": "市場分析",
-            "items": [
-                {"name": "目標市場描述", "keywords": ["目標市場", "客戶", "TA", "使用者"]},
-                {"name": "市場規模（TAM/SAM/SOM）", "keywords": ["TAM", "SAM", "SOM", "市場規模", "產值"]},
-                {"name": "商業模式", "keywords": ["商業模式", "獲利", "營收", "收費"]},
-            ]
-        },
-        {
-            "category": "技術可行性",
-            "items": [
-                {"name": "技術方案說明", "keywords": ["技術", "方法", "架構", "系統"]},
-                {"name": "前期驗證成果", "keywords": ["驗證", "測試", "實驗", "前期", "雛型"]},
-                {"name": "風險評估", "keywords": ["風險", "挑戰", "困難"]},
-            ]
-        },
-        {
-            "category": "團隊介紹",
-            "items": [
-                {"name": "團隊成員", "keywords": ["團隊", "成員", "人員"]},
-                {"name": "相關經驗", "keywords": ["經驗", "經歷", "背景", "專長"]},
-                {"name": "分工規劃", "keywords": ["分工", "負責", "職責"]},
-            ]
-        },
-        {
-            "category": "執行計畫",
-            "items": [
-                {"name": "工作項目", "keywords": ["工作", "項目", "任務"]},
-                {"name": "時程規劃", "keywords": ["時程", "進度", "甘特", "月"]},
-                {"name": "查核點", "keywords": ["查核", "里程碑", "KPI", "指標"]},
-            ]
-        },
-        {
-            "category": "經費規劃",
-            "items": [
-                {"name": "人事費", "keywords": ["人事費", "薪資", "人力"]},
-                {"name": "材料費/設備費", "keywords": ["材料", "設備", "器材", "耗材"]},
-                {"name": "其他費用", "keywords": ["委託", "差旅", "管理費"]},
-            ]
-        },
-    ]
-
-    # 執行檢核
-    content_lower = proposal_content.lower()
+    # 執行檢核（一次掃描取得所有出現過的關鍵字）
+    found_keywords = PHASE1_CHECK_MATCHER.found(proposal_content)
     results = []
     total_items = 0
     passed_items = 0
 
-    for category in phase1_checks:
+    for category in PHASE1_CHECKS:
         category_results = {
             "name": category["category"],
             "items": []
@@ -1653,7 +1919,7 @@ async def check_proposal(proposal_content: str, phase: str = "phase1") -> list[T
         for item in category["items"]:  # type: ignore
             total_items += 1
             # 檢查是否包含關鍵字（不區分大小寫）
-            found = any(keyword.lower() in content_lower for keyword in item["keywords"])  # type: ignore
+            found = any(keyword in found_keywords for keyword in item["keywords"])  # type: ignore
             if found:
                 passed_items += 1
                 status = "✅"
@@ -1810,13 +2076,24 @@ async def main():
     """啟動 MCP Server"""
     from mcp.server.stdio import stdio_server
 
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            app.create_initialization_options()
-        )
+    from worker_pool import shutdown
+    import update_check
+    import warmup
+
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            # 模型在背景預熱，不延遲 MCP handshake
+            warmup.start(PERSIST_DIR)
+            # 版本檢查也在背景定期執行，不在搜尋中跑 git fetch
+            update_check.start(PROJECT_ROOT)
+            await app.run(
+                read_stream,
+                write_stream,
+                app.create_initialization_options()
+            )
+    finally:
+        update_check.stop()
+        shutdown()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
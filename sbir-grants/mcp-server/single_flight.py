@@ -0,0 +1,73 @@
+"""
+請求合併模組（single-flight）- 相同的 tool 呼叫同時進行時只執行一次
+
+client 重試或兩個對話同時問同一件事時，search_knowledge_base 這類耗時的 tool
+會同時跑兩次完整流程（快取要到最後才寫入）。同一個 tool、正規化後參數相同的呼叫
+若已在執行中，後到的呼叫直接等待同一個結果。
+
+只適用於冪等（不寫入狀態）的 tool，由 server.py 的 COALESCED_TOOLS 登記。
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable
+
+
+def canonical_arguments(arguments: Any) -> str:
+    """正規化參數（key 排序的 JSON），作為合併的 key"""
+    return json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class SingleFlight:
+    """合併進行中的相同呼叫（只在 event loop 上使用）"""
+
+    def __init__(self):
+        self._in_flight: dict[tuple, asyncio.Task] = {}
+        self._calls = 0
+        self._coalesced = 0
+
+    async def run(self, key: tuple, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        執行 func()；相同 key 的呼叫已在執行中時，改為等待它的結果
+
+        共用的 task 以 asyncio.shield 等待：其中一個呼叫端被取消時，
+        其他呼叫端仍會拿到結果。例外會傳給所有等待中的呼叫端。
+        """
+        self._calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self._coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: tuple, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # 所有呼叫端都已取消時，避免「exception was never retrieved」警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """
+        獲取統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self._calls,
+            "coalesced": self._coalesced,
+        }
+
+
+# 全域實例
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """獲取全域請求合併實例"""
+    return _single_flight
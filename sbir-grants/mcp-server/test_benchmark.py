@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+檢索 benchmark 測試
+
+確認：
+1. recall@k、MRR、nDCG 的計算（檔案層級的相關項目只計一次）
+2. 以本機文件執行 keyword 模式，報告格式完整，且與自身比較沒有回歸
+3. 指標下降超過容許值、或查詢集版本不同時，compare_reports 回報回歸
+"""
+
+import asyncio
+import copy
+import math
+
+import benchmark
+import warmup
+import worker_pool
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_metrics():
+    ranked = ["a.md::0", "b.md::2", "a.md::1", "c.md::0"]
+    relevant = ["a.md", "c.md::0"]
+
+    assert_true(benchmark.recall_at_k(ranked, relevant, 1) == 0.5, "recall@1 should find a.md only")
+    assert_true(benchmark.recall_at_k(ranked, relevant, 4) == 1.0, "recall@4 should find both")
+    assert_true(benchmark.reciprocal_rank(ranked, relevant) == 1.0, "first result is relevant")
+    assert_true(benchmark.reciprocal_rank(["x.md::0", "c.md::0"], relevant) == 0.5, "MRR should use first relevant rank")
+    assert_true(benchmark.reciprocal_rank(["c.md::1"], relevant) == 0.0, "chunk ids must match exactly")
+
+    # a.md 的第二個 chunk 不重複得分
+    expected = (1 + 1 / math.log2(5)) / (1 + 1 / math.log2(3))
+    assert_true(abs(benchmark.ndcg_at_k(ranked, relevant, 10) - expected) < 1e-9, "nDCG should credit each item once")
+    assert_true(benchmark.ndcg_at_k(["a.md::0", "c.md::0"], relevant, 10) == 1.0, "ideal ranking should score 1")
+
+    assert_true(benchmark.percentile([5, 1, 3, 2, 4], 0.5) == 3, "p50 should be the median")
+    assert_true(benchmark.percentile(list(range(1, 101)), 0.95) == 95, "p95 should use nearest rank")
+
+
+def test_keyword_benchmark_and_regression_gate():
+    try:
+        report = asyncio.run(benchmark.run_benchmark(modes=("keyword",)))
+    finally:
+        worker_pool.shutdown()
+        warmup._warmup_task = None
+        warmup._status = {name: {"state": "cold"} for name in warmup.COMPONENTS}
+
+    keyword = report["modes"]["keyword"]
+    query_count = report["query_set"]["queries"]
+    assert_true(keyword["available"], "keyword mode needs no models")
+    assert_true(len(keyword["queries"]) == query_count, "every query should be evaluated")
+    assert_true({"all", "methodology", "faq", "checklist", "case_study", "template"} <= set(keyword["by_category"]),
+                "query set should cover every category")
+    assert_true(keyword["metrics"]["recall@10"] > 0.5, f"keyword search should find most documents: {keyword['metrics']}")
+    for run in ("cold", "warm"):
+        latency = keyword["latency"][run]
+        assert_true(latency["p50_ms"] <= latency["p95_ms"] <= latency["p99_ms"] <= latency["max_ms"], f"bad {run} latency")
+
+    assert_true(benchmark.compare_reports(report, report) == [], "a report should not regress against itself")
+
+    worse = copy.deepcopy(report)
+    worse["modes"]["keyword"]["metrics"]["mrr"] -= 0.1
+    regressions = benchmark.compare_reports(worse, report, tolerance=0.02)
+    assert_true(len(regressions) == 1 and "mrr" in regressions[0], f"MRR drop should be reported: {regressions}")
+
+    worse["query_set"]["version"] += 1
+    assert_true("版本" in benchmark.compare_reports(worse, report)[0], "different query set versions must not be compared")
+
+
+if __name__ == "__main__":
+    test_metrics()
+    test_keyword_benchmark_and_regression_gate()
+    print("benchmark: PASS")
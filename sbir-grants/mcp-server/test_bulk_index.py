@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+大量寫入索引測試（flat 向量庫 + 假模型，不需要下載模型）
+
+1. encode 批次大小依可用記憶體調整，並限制在 ENCODE_BATCH_RANGE 內
+2. 每個寫入批次只呼叫一次 upsert
+3. 寫入中斷後再次執行從檢查點繼續，只 encode 尚未寫入的 chunks；完成後刪除檢查點
+4. --json 模式的 stdout 只有 JSON 事件，其他輸出（包含直接寫入 fd 1 的內容）改到 stderr
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import model_registry
+import vector_search
+from build_index import json_output, parse_args
+from model_registry import EMBEDDING, ModelRegistry
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class RecordingModel:
+    """以字元碼產生固定向量，並記錄 encode 過的文字與批次大小"""
+
+    def __init__(self):
+        self.texts = []
+        self.batch_sizes = []
+
+    def encode(self, texts, show_progress_bar=False, batch_size=32, **kwargs):
+        self.texts.extend(texts)
+        self.batch_sizes.append(batch_size)
+        vectors = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for ch in text:
+                vectors[row, ord(ch) % 8] += 1.0
+        return vectors
+
+
+class CountingFlatStore(vector_search.FlatVectorStore):
+    """記錄 upsert 次數；fail_after 次之後的寫入拋出例外（模擬中斷）"""
+
+    def __init__(self, persist_directory: str, fail_after: int | None = None):
+        super().__init__(persist_directory)
+        self.upserts = []
+        self.fail_after = fail_after
+
+    def upsert(self, ids, embeddings, contents, metadatas):
+        if self.fail_after is not None and len(self.upserts) >= self.fail_after:
+            raise KeyboardInterrupt("simulated interruption")
+        self.upserts.append(len(ids))
+        super().upsert(ids, embeddings, contents, metadatas)
+
+
+def make_chunks(count: int) -> list[dict]:
+    return [{"id": f"references/a.md::chunk_{i}", "content": f"第 {i} 段：SBIR 計畫書撰寫說明。", "metadata": {}}
+            for i in range(count)]
+
+
+def with_flat_store(fn):
+    originals = (model_registry._model_registry, vector_search._vector_store,
+                 vector_search.WRITE_BATCH_SIZE, os.environ.get(vector_search.VECTOR_BACKEND_ENV))
+    os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+    vector_search.WRITE_BATCH_SIZE = 4
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return fn(tmp)
+    finally:
+        model_registry._model_registry, vector_search._vector_store, vector_search.WRITE_BATCH_SIZE, backend = originals
+        if backend is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = backend
+
+
+def use(model, store) -> None:
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("fake-embedding", lambda name: model)})
+    vector_search._vector_store = store
+
+
+def test_encode_batch_size():
+    original = model_registry.available_memory_bytes
+    low, high = vector_search.ENCODE_BATCH_RANGE
+    try:
+        model_registry.available_memory_bytes = lambda: None
+        assert_true(vector_search.auto_encode_batch_size() == vector_search.DEFAULT_ENCODE_BATCH, "unknown memory uses the default")
+        model_registry.available_memory_bytes = lambda: 64 * 1024 ** 2
+        assert_true(vector_search.auto_encode_batch_size() == low, "low memory should clamp to the minimum")
+        model_registry.available_memory_bytes = lambda: 64 * 1024 ** 3
+        assert_true(vector_search.auto_encode_batch_size() == high, "large memory should clamp to the maximum")
+        model_registry.available_memory_bytes = lambda: 4 * 1024 ** 3
+        assert_true(low < vector_search.auto_encode_batch_size() < high, "batch size should scale with memory")
+    finally:
+        model_registry.available_memory_bytes = original
+    assert_true(original() is None or original() > 0, "available memory should be positive when known")
+
+
+def test_single_upsert_per_batch():
+    def run(tmp):
+        model, store = RecordingModel(), CountingFlatStore(tmp)
+        use(model, store)
+        progress = []
+        written = vector_search.index_documents(make_chunks(10), tmp, batch_size=3,
+                                                progress=lambda done, total: progress.append((done, total)))
+        assert_true(written == 10 and store.upserts == [4, 4, 2], f"each write batch should be one upsert: {store.upserts}")
+        assert_true(set(model.batch_sizes) == {3}, "explicit batch size should reach the model")
+        assert_true(progress == [(4, 10), (8, 10), (10, 10)], f"progress should follow each batch: {progress}")
+        assert_true(vector_search.get_index_count(tmp) == 10, "all chunks should be indexed")
+    with_flat_store(run)
+
+
+def test_resume_from_checkpoint():
+    def run(tmp):
+        chunks = make_chunks(10)
+        model, store = RecordingModel(), CountingFlatStore(tmp, fail_after=1)
+        use(model, store)
+        try:
+            vector_search.index_documents(chunks, tmp, checkpoint=True)
+            raise AssertionError("second batch should be interrupted")
+        except KeyboardInterrupt:
+            pass
+        saved = vector_search.read_checkpoint(tmp)
+        assert_true(saved and saved["done"] == 4 and saved["total"] == 10, f"checkpoint should record the first batch: {saved}")
+
+        model = RecordingModel()
+        use(model, CountingFlatStore(tmp))
+        written = vector_search.index_documents(chunks, tmp, checkpoint=True)
+        assert_true(written == 6 and model.texts == [c["content"] for c in chunks[4:]],
+                    f"resumed build should only encode the remaining chunks: {model.texts}")
+        assert_true(vector_search.get_index_count(tmp) == 10, "index should be complete after resuming")
+        assert_true(vector_search.read_checkpoint(tmp) is None, "checkpoint should be removed when done")
+
+        # 文件內容改變時檢查點不適用，從頭寫入
+        use(RecordingModel(), CountingFlatStore(tmp, fail_after=1))
+        try:
+            vector_search.index_documents(chunks, tmp, checkpoint=True)
+        except KeyboardInterrupt:
+            pass
+        model = RecordingModel()
+        use(model, CountingFlatStore(tmp))
+        changed = chunks[:9]
+        vector_search.index_documents(changed, tmp, checkpoint=True)
+        assert_true(len(model.texts) == 9, "a stale checkpoint should not be used")
+        assert_true(vector_search.delete_stale_chunks([c["id"] for c in changed], tmp) == 1,
+                    "chunks missing from the rebuild should be pruned")
+    with_flat_store(run)
+
+
+def test_json_output():
+    with tempfile.TemporaryFile("w+") as stdout_file, tempfile.TemporaryFile("w+") as stderr_file:
+        saved_out, saved_err = os.dup(1), os.dup(2)
+        saved_stderr = sys.stderr
+        os.dup2(stdout_file.fileno(), 1)
+        os.dup2(stderr_file.fileno(), 2)
+        # 測試執行器可能已替換 sys.stderr，這裡讓它寫入同一個檔案
+        sys.stderr = stderr_file
+        try:
+            with json_output() as emit:
+                print("步驟 1/4: 載入知識庫文件...")
+                os.write(1, "子行程輸出\n".encode("utf-8"))
+                emit({"event": "progress", "done": 4, "total": 10})
+        finally:
+            sys.stderr = saved_stderr
+            os.dup2(saved_out, 1)
+            os.dup2(saved_err, 2)
+            os.close(saved_out)
+            os.close(saved_err)
+        stdout_file.seek(0)
+        stderr_file.seek(0)
+        emit_lines = stdout_file.read().splitlines()
+        errors = stderr_file.read()
+    assert_true([json.loads(line) for line in emit_lines] == [{"event": "progress", "done": 4, "total": 10}],
+                f"stdout should only carry JSON events: {emit_lines}")
+    assert_true("步驟 1/4" in errors and "子行程輸出" in errors, "other output should go to stderr")
+
+    args = parse_args(["--force", "--json", "--batch-size", "64", "--workers", "2"])
+    assert_true(args.force and args.json and args.batch_size == 64 and args.workers == 2 and not args.incremental,
+                "CLI options should be parsed")
+
+
+if __name__ == "__main__":
+    test_encode_batch_size()
+    print("test_encode_batch_size: PASS")
+    test_single_upsert_per_batch()
+    print("test_single_upsert_per_batch: PASS")
+    test_resume_from_checkpoint()
+    print("test_resume_from_checkpoint: PASS")
+    test_json_output()
+    print("test_json_output: PASS")
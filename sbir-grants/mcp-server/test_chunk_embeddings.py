@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+分段時的句子向量沿用測試
+
+1. semantic_chunk_with_embeddings 回傳的句子 embeddings 與各 chunk 的句子一一對應
+2. encode 模式只沿用單句 chunk，pooled 模式以平均句子向量取代全部 encode
+3. index_documents 只 encode 沒有已知向量的 chunk
+4. benchmark.evaluate_chunk_embeddings 比較兩種方式（假模型，只檢查報告結構）
+"""
+
+import os
+import tempfile
+import zlib
+
+import numpy as np
+
+import model_registry
+import vector_search
+from chunker import chunk_embeddings_from_sentences, semantic_chunk, semantic_chunk_with_embeddings
+from model_registry import EMBEDDING, ModelRegistry
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class HashModel:
+    """每個句子依 crc32 產生固定向量，並記錄 encode 過的文字"""
+
+    def __init__(self):
+        self.texts = []
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.texts.extend(texts)
+        vectors = np.asarray([np.random.default_rng(zlib.crc32(t.encode())).normal(size=16) for t in texts])
+        return vectors[0] if single else vectors
+
+
+CONTENT = "# 計畫書撰寫\n\n" + "\n".join(
+    f"{topic}：第 {i} 項說明，請依規定準備相關文件與資料。"
+    for i, topic in enumerate(["申請資格", "經費編列", "審查重點", "期末報告", "智慧財產權"] * 6)
+) + "\n" + "結語：請再次確認計畫書的完整性。"
+
+
+def with_model(model, fn):
+    original = model_registry._model_registry
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("hash-model", lambda name: model)})
+    try:
+        return fn()
+    finally:
+        model_registry._model_registry = original
+
+
+def test_sentence_embeddings_align_with_chunks():
+    model = HashModel()
+    chunks, embeddings = with_model(model, lambda: semantic_chunk_with_embeddings(CONTENT, "plan.md", "references/plan.md"))
+    assert_true(len(chunks) > 1 and len(embeddings) == len(chunks), "every chunk should have its sentence embeddings")
+    for chunk, members in zip(chunks, embeddings):
+        expected = model.encode(chunk["content"].split("\n"))
+        assert_true(members.shape == expected.shape and np.allclose(members, expected), f"embeddings should match {chunk['id']}")
+    assert_true(with_model(HashModel(), lambda: semantic_chunk(CONTENT, "plan.md", "references/plan.md")) == chunks,
+                "semantic_chunk should return the same chunks")
+
+    short, short_embeddings = with_model(HashModel(), lambda: semantic_chunk_with_embeddings("太短", "a.md", "a.md"))
+    assert_true(len(short) == 1 and short_embeddings == [None], "short documents have no sentence embeddings")
+
+
+def test_modes():
+    single = np.ones((1, 4), dtype=np.float32)
+    multi = np.asarray([[3.0, 0, 0, 0], [0, 1.0, 0, 0]], dtype=np.float32)
+    encode = chunk_embeddings_from_sentences([None, single, multi], "encode")
+    assert_true(encode[0] is None and np.allclose(encode[1], single[0]) and encode[2] is None,
+                "encode mode should only reuse single-sentence chunks")
+    pooled = chunk_embeddings_from_sentences([None, single, multi], "pooled")
+    assert_true(pooled[0] is None and np.allclose(pooled[2], [2 ** -0.5, 2 ** -0.5, 0, 0]),
+                "pooled mode should average normalized sentence vectors")
+
+
+def test_index_documents_skips_known_vectors():
+    model = HashModel()
+    original_store, backend = vector_search._vector_store, os.environ.get(vector_search.VECTOR_BACKEND_ENV)
+    os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            documents = [{"id": f"d.md::chunk_{i}", "content": f"內容 {i}", "metadata": {}} for i in range(12)]
+            known = [np.full(16, i + 1.0) if i % 3 else None for i in range(12)]
+            with_model(model, lambda: vector_search.index_documents(documents, tmp, known))
+            assert_true(model.texts == [f"內容 {i}" for i in range(0, 12, 3)], f"only unknown chunks should be encoded: {model.texts}")
+            stored = vector_search.get_chunk_embeddings(["d.md::chunk_1", "d.md::chunk_3"], tmp)
+            assert_true(np.allclose(stored["d.md::chunk_1"], np.full(16, 0.25)), "known vector should be stored as given")
+            assert_true(np.allclose(stored["d.md::chunk_3"], model.encode("內容 3") / np.linalg.norm(model.encode("內容 3"))),
+                        "unknown vector should be encoded")
+    finally:
+        vector_search._vector_store = original_store
+        if backend is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = backend
+
+
+def test_benchmark_comparison():
+    import benchmark
+    from embedding_cache import get_embedding_cache
+
+    try:
+        report = with_model(HashModel(), benchmark.evaluate_chunk_embeddings)
+    finally:
+        # 假模型的查詢向量不可留在共用快取中
+        get_embedding_cache().clear()
+    assert_true(set(report) == {"encode", "pooled"}, "both variants should be reported")
+    assert_true(report["encode"]["overlap@10"] == 1.0 and all(v == 0 for v in report["encode"]["delta"].values()),
+                "encode is the reference")
+    assert_true(0 < report["pooled"]["reused"] <= 1 and "recall@10" in report["pooled"]["metrics"], "pooled report should be complete")
+
+
+if __name__ == "__main__":
+    test_sentence_embeddings_align_with_chunks()
+    print("test_sentence_embeddings_align_with_chunks: PASS")
+    test_modes()
+    print("test_modes: PASS")
+    test_index_documents_skips_known_vectors()
+    print("test_index_documents_skips_known_vectors: PASS")
+    test_benchmark_comparison()
+    print("test_benchmark_comparison: PASS")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+並行 tool 呼叫測試
+
+模擬耗時的語意搜尋與 rerank（以 time.sleep 代表模型推論），
+同時送出多個輕量 tool 呼叫，確認輕量呼叫不會排在搜尋後面。
+"""
+
+import asyncio
+import time
+
+import search_cache
+import server
+import vector_search
+import worker_pool
+from search_cache import SearchCache
+
+SLOW_SECONDS = 0.6
+
+
+def slow_semantic_search(query: str, persist_directory: str, n_results: int = 10) -> list:
+    time.sleep(SLOW_SECONDS)
+    return []
+
+
+def slow_rerank(query: str, results: list, top_k: int = 5) -> list:
+    time.sleep(SLOW_SECONDS)
+    return results[:top_k]
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+async def run_mixed_calls() -> dict:
+    started = time.perf_counter()
+    finished: dict[str, float] = {}
+
+    async def timed(label: str, name: str, arguments: dict) -> None:
+        await server.call_tool(name, arguments)
+        finished[label] = time.perf_counter() - started
+
+    calls = [
+        timed(f"search_{i}", "search_knowledge_base", {"query": f"並行測試 創新 {i}"})
+        for i in range(3)
+    ]
+    calls += [
+        timed("budget", "calculate_budget", {"total_budget": 100}),
+        timed("roi", "calculate_roi", {"subsidy_amount": 100}),
+        timed("check", "check_proposal", {"proposal_content": "本公司 TAM 市場規模 團隊經驗 人事費"}),
+    ]
+    await asyncio.gather(*calls)
+    return finished
+
+
+def test_cheap_calls_not_blocked_by_search():
+    originals = (vector_search.needs_reindex, vector_search.semantic_search, vector_search.rerank_results)
+    vector_search.needs_reindex = lambda persist_directory: False
+    vector_search.semantic_search = slow_semantic_search
+    vector_search.rerank_results = slow_rerank
+    original_cache = search_cache._search_cache
+    search_cache._search_cache = SearchCache()  # 只用記憶體層，避免命中先前執行留下的磁碟快取
+
+    try:
+        finished = asyncio.run(run_mixed_calls())
+    finally:
+        vector_search.needs_reindex, vector_search.semantic_search, vector_search.rerank_results = originals
+        search_cache._search_cache = original_cache
+        worker_pool.shutdown()
+
+    slowest_cheap = max(finished[label] for label in ("budget", "roi", "check"))
+    fastest_search = min(finished[label] for label in finished if label.startswith("search_"))
+    assert_true(fastest_search >= SLOW_SECONDS, f"searches should take at least {SLOW_SECONDS}s: {finished}")
+    assert_true(slowest_cheap < SLOW_SECONDS / 2, f"cheap calls were blocked behind searches: {finished}")
+
+
+if __name__ == "__main__":
+    test_cheap_calls_not_blocked_by_search()
+    print("concurrency: PASS")
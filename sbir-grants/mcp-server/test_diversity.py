@@ -1,4 +1,8 @@
-from vector_search import mmr_sort
+import random
+
+import numpy as np
+
+from vector_search import cosine_kernel, mmr_sort
 
 # 模擬搜尋結果（故意製造來自同一份文件的重複結果）
 mock_results = [
@@ -57,3 +61,96 @@ for i, r in enumerate(mmr_results[:3], 1):
     print(f"{i}. [{r['final_score']}] {r['path']} - {r['name']}")
 
 print("\n💡 觀察：MMR 應該會把 faq.md 提上來，即便它的原始分數較低，因為 guide.md 已經出現過了。")
+
+
+def reference_mmr_sort(results: list, lambda_param: float = 0.7) -> list:
+    """原本的逐一比對路徑版本，作為 file_kernel 排序結果的基準"""
+    selected: list[dict] = []
+    candidates = results.copy()
+
+    while len(selected) < len(results):
+        best_score = -float('inf')
+        best_idx = -1
+
+        for i, candidate in enumerate(candidates):
+            if 'rerank_score' in candidate:
+                relevance = candidate['rerank_score']
+            elif 'similarity' in candidate:
+                relevance = candidate['similarity'] * 10
+            else:
+                relevance = candidate.get('final_score', 0) * 10
+
+            diversity_penalty = 0
+            if selected:
+                candidate_path = candidate.get('metadata', {}).get('file_path') or candidate.get('path')
+                for sel in selected:
+                    sel_path = sel.get('metadata', {}).get('file_path') or sel.get('path')
+                    if candidate_path and sel_path and candidate_path == sel_path:
+                        diversity_penalty += 1
+
+            mmr_score = relevance - (diversity_penalty * (1 - lambda_param) * 5)
+
+            if mmr_score > best_score:
+                best_score = mmr_score
+                best_idx = i
+
+        selected.append(candidates.pop(best_idx))
+
+    return selected
+
+
+def random_results(rng: random.Random, n: int) -> list:
+    results = []
+    for i in range(n):
+        result = {"name": f"Chunk {i}", "final_score": round(rng.random(), 2)}
+        kind = rng.choice(["rerank", "similarity", "final"])
+        if kind == "rerank":
+            result["rerank_score"] = round(rng.uniform(-5, 5), 1)
+        elif kind == "similarity":
+            result["similarity"] = round(rng.random(), 2)
+        path = rng.choice(["a.md", "b.md", "c.md", None])
+        if rng.random() < 0.5:
+            result["metadata"] = {"file_path": path}
+        else:
+            result["path"] = path
+        results.append(result)
+    return results
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_file_kernel_matches_reference():
+    rng = random.Random(42)
+    for _ in range(300):
+        results = random_results(rng, rng.randint(1, 25))
+        lambda_param = rng.choice([0.0, 0.3, 0.6, 0.7, 1.0])
+        expected = [r["name"] for r in reference_mmr_sort(results, lambda_param)]
+        actual = [r["name"] for r in mmr_sort(results, lambda_param)]
+        assert_true(actual == expected, f"ordering differs from reference: {actual} != {expected}")
+
+        top_k = rng.randint(0, len(results))
+        prefix = [r["name"] for r in mmr_sort(results, lambda_param, top_k=top_k)]
+        assert_true(prefix == expected[:top_k], "top_k should stop after k picks of the same ordering")
+
+    demo = [r["path"] for r in mmr_sort(mock_results, lambda_param=0.6)[:3]]
+    assert_true(demo == ["docs/guide.md", "docs/faq.md", "docs/case_study.md"], f"sources should be diversified: {demo}")
+
+
+def test_cosine_kernel_penalizes_near_duplicates():
+    results = [
+        {"name": "A", "rerank_score": 5.0},
+        {"name": "A'", "rerank_score": 4.9},
+        {"name": "B", "rerank_score": 4.5},
+    ]
+    embeddings = np.array([[1.0, 0.0], [0.99, 0.05], [0.0, 1.0]])
+    ordered = mmr_sort(results, lambda_param=0.7, similarity=cosine_kernel(embeddings), redundancy="max")
+    assert_true([r["name"] for r in ordered] == ["A", "B", "A'"], "near-duplicate chunk should be demoted")
+
+
+if __name__ == "__main__":
+    test_file_kernel_matches_reference()
+    test_cosine_kernel_penalizes_near_duplicates()
+    print("diversity: PASS")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+查詢向量快取測試
+
+以計數用的假模型取代 Embedding 模型，確認：
+1. 同一查詢（含全形 / 空白差異）只 encode 一次
+2. 一次多個查詢時，未命中的查詢合併成一次 encode
+3. LRU 淘汰與命中統計
+"""
+
+import numpy as np
+
+import vector_search
+from embedding_cache import QueryEmbeddingCache, get_embedding_cache, normalize_query
+
+
+class CountingModel:
+    """記錄 encode 呼叫的假模型（向量為字串長度）"""
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def encode(self, sentences: list[str], show_progress_bar: bool = False):
+        self.calls.append(list(sentences))
+        return np.array([[float(len(s)), 1.0] for s in sentences])
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_repeated_queries_encode_once():
+    model = CountingModel()
+    original = vector_search.get_embedding_model
+    vector_search.get_embedding_model = lambda: model
+    get_embedding_cache().clear()
+
+    try:
+        first = vector_search.encode_query("Phase 1 創新性")
+        again = vector_search.encode_query("  Ｐｈａｓｅ　1   創新性 ")
+        batch = vector_search.encode_queries(["Phase 1 創新性", "補助金額", "市場規模", "補助金額"])
+        stats = get_embedding_cache().stats()
+    finally:
+        vector_search.get_embedding_model = original
+        get_embedding_cache().clear()
+
+    assert_true(first == again == batch[0], "normalized queries should share one embedding")
+    assert_true(batch[1] == batch[3], "duplicate queries in one batch should share one embedding")
+    assert_true(model.calls == [["Phase 1 創新性"], ["補助金額", "市場規模"]], f"unexpected encode calls: {model.calls}")
+    assert_true(stats["hits"] == 2 and stats["misses"] == 4, f"unexpected stats: {stats}")
+
+
+def test_lru_eviction_and_model_key():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.set("model-a", "q1", [1.0])
+    cache.set("model-a", "q2", [2.0])
+    assert_true(cache.get("model-a", "q1") == [1.0], "q1 should be cached")
+    cache.set("model-a", "q3", [3.0])  # 淘汰最少使用的 q2
+
+    assert_true(cache.get("model-a", "q2") is None, "least recently used entry should be evicted")
+    assert_true(cache.get("model-a", "q1") == [1.0] and cache.get("model-a", "q3") == [3.0], "recent entries should stay")
+    assert_true(cache.get("model-b", "q1") is None, "embeddings from another model must not be reused")
+    assert_true(normalize_query(" Ａ　b ") == "A b", "normalization should fold width and whitespace only")
+
+
+if __name__ == "__main__":
+    test_repeated_queries_encode_once()
+    test_lru_eviction_and_model_key()
+    print("embedding-cache: PASS")
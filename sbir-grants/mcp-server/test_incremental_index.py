@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+增量建立索引測試（flat 向量庫 + 假模型，不需要下載模型）
+
+1. 完整建立後寫入 manifest（每個文件的內容雜湊與 chunk 數）
+2. 修改、新增、刪除文件後增量更新：只 encode 變動的文件，刪除舊 chunks，關鍵字索引同步
+3. 沒有變動時不 encode 任何內容；分段規則、模型或向量庫改變時 manifest 失效
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import model_registry
+import vector_search
+from build_index import get_category_from_path, plan_incremental_update, rebuild_index, update_index_incrementally
+from index_manifest import content_hash, current_settings, incompatibility, load_manifest
+from keyword_index import INDEX_FILENAME, KeywordIndex
+from model_registry import EMBEDDING, ModelRegistry
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class RecordingModel:
+    """以字元碼產生固定向量，並記錄 encode 過的文字"""
+
+    def __init__(self):
+        self.texts = []
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.texts.extend(texts)
+        vectors = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for ch in text:
+                vectors[row, ord(ch) % 8] += 1.0
+        return vectors[0] if single else vectors
+
+
+def make_document(path: str, marker: str) -> dict:
+    content = f"# {marker} 文件\n\n" + "\n".join(f"{marker} 第 {i} 點：SBIR 計畫書撰寫說明。" for i in range(3))
+    return {
+        "id": path,
+        "content": content,
+        "metadata": {"category": get_category_from_path(path), "filename": os.path.basename(path), "path": path},
+    }
+
+
+def indexed_files(persist_directory: str) -> set:
+    return {chunk_id.split("::")[0] for chunk_id in vector_search.get_vector_store(persist_directory).ids()}
+
+
+def test_incremental_update():
+    model = RecordingModel()
+    originals = (model_registry._model_registry, vector_search._vector_store, os.environ.get(vector_search.VECTOR_BACKEND_ENV))
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("fake-embedding", lambda name: model)})
+    os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            persist = os.path.join(tmp, "chroma_db")
+            documents = [make_document(f"references/{name}.md", name.upper()) for name in ("a", "b", "c")]
+            result = rebuild_index(documents, persist)
+            manifest = load_manifest(persist)
+            assert_true(set(manifest["files"]) == {doc["id"] for doc in documents}, "manifest should list every document")
+            assert_true(sum(info["chunks"] for info in manifest["files"].values()) == result["chunks"], "chunk counts should add up")
+            a_ids = sorted(i for i in vector_search.get_vector_store(persist).ids() if i.startswith("references/a.md::"))
+
+            documents = [
+                documents[0],
+                make_document("references/b.md", "B2"),
+                make_document("references/d.md", "D"),
+            ]
+            diff, reason = plan_incremental_update(documents, persist)
+            assert_true(reason is None, f"manifest should be usable: {reason}")
+            assert_true([doc["id"] for doc in diff["added"]] == ["references/d.md"], "new file should be added")
+            assert_true([doc["id"] for doc in diff["changed"]] == ["references/b.md"], "edited file should be changed")
+            assert_true(diff["removed"] == ["references/c.md"] and diff["unchanged"] == ["references/a.md"], "diff should be exact")
+
+            model.texts.clear()
+            result = update_index_incrementally(documents, persist, diff)
+            assert_true(model.texts and all("B2" in text or "D" in text for text in model.texts),
+                        f"only changed files should be encoded: {model.texts}")
+            assert_true(indexed_files(persist) == {"references/a.md", "references/b.md", "references/d.md"},
+                        "removed file's chunks should be deleted")
+            assert_true(sorted(i for i in vector_search.get_vector_store(persist).ids() if i.startswith("references/a.md::")) == a_ids,
+                        "unchanged file should keep its chunks")
+            assert_true(all("B2" in chunk["content"] for chunk in vector_search.get_all_chunks(persist)
+                            if chunk["id"].startswith("references/b.md::")), "changed file should have new content only")
+
+            keyword_index = KeywordIndex.load(os.path.join(tmp, INDEX_FILENAME))
+            assert_true({doc["path"] for doc in keyword_index.docs} == indexed_files(persist), "keyword index should follow the update")
+            assert_true(len(keyword_index.chunks) == vector_search.get_index_count(persist), "keyword index should cover all chunks")
+
+            manifest = load_manifest(persist)
+            assert_true({path: info["hash"] for path, info in manifest["files"].items()}
+                        == {doc["id"]: content_hash(doc["content"]) for doc in documents}, "manifest should be updated")
+
+            model.texts.clear()
+            diff, _ = plan_incremental_update(documents, persist)
+            result = update_index_incrementally(documents, persist, diff)
+            assert_true(result["chunks"] == 0 and result["deleted"] == 0 and not model.texts, "no-op update should not encode")
+
+            settings = current_settings()
+            assert_true(incompatibility(manifest, settings) is None, "current settings should match")
+            assert_true("Embedding" in incompatibility(manifest, {**settings, "model": "other"}), "model change should invalidate")
+            assert_true(incompatibility(None, settings) is not None, "missing manifest should require a full build")
+    finally:
+        model_registry._model_registry, vector_search._vector_store, backend = originals
+        if backend is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = backend
+
+
+if __name__ == "__main__":
+    test_incremental_update()
+    print("test_incremental_update: PASS")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+索引版本切換測試（flat 向量庫 + 假模型，不需要下載模型）
+
+1. 完整建立寫入新版本目錄，驗證後切換 current；server 端以同一個 chroma_db 路徑查詢時自動改用新版本
+2. 切換前取得的舊向量庫仍可查詢（寬限期內不刪除），關鍵字索引與世代隨切換更新
+3. 增量更新在目前版本的副本上進行；驗證失敗時不切換並刪除新版本
+4. 超過寬限期的舊版本被回收，留有檢查點的未完成版本保留供繼續建立
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import model_registry
+import vector_search
+from build_index import build_version, get_category_from_path, plan_incremental_update
+from index_generation import get_generation
+from index_versions import (RETIRED_FILENAME, collect_garbage, create_version, current_version, find_resumable_version,
+                            get_versions_root, list_versions, resolve_persist_directory, validate_version)
+from keyword_index import get_keyword_index
+from model_registry import EMBEDDING, ModelRegistry
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class CharModel:
+    """以字元碼產生固定向量"""
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.zeros((len(texts), 16), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for ch in text:
+                vectors[row, ord(ch) % 16] += 1.0
+        return vectors[0] if single else vectors
+
+
+def make_document(path: str, marker: str) -> dict:
+    content = f"# {marker} 文件\n\n" + "\n".join(f"{marker} 第 {i} 點：SBIR 計畫書撰寫說明。" for i in range(3))
+    return {
+        "id": path,
+        "content": content,
+        "metadata": {"category": get_category_from_path(path), "filename": os.path.basename(path), "path": path},
+    }
+
+
+def indexed_files(store) -> set:
+    return {chunk_id.split("::")[0] for chunk_id in store.ids()}
+
+
+def test_build_and_swap():
+    from embedding_cache import get_embedding_cache
+
+    originals = (model_registry._model_registry, vector_search._vector_store, os.environ.get(vector_search.VECTOR_BACKEND_ENV))
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("char-model", lambda name: CharModel())})
+    os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            persist = os.path.join(tmp, "chroma_db")
+            assert_true(resolve_persist_directory(persist) == persist, "without versions the legacy directory is used")
+
+            documents = [make_document(f"references/{name}.md", name.upper()) for name in ("a", "b")]
+            first = build_version(documents, persist)
+            assert_true(current_version(persist) == first["version"], "first build should become current")
+            old_store = vector_search.get_vector_store(persist)
+            assert_true(old_store.persist_directory == resolve_persist_directory(persist) != persist,
+                        "server path should resolve to the version directory")
+            assert_true(indexed_files(old_store) == {"references/a.md", "references/b.md"}, "first version content")
+            generation = get_generation(persist)
+
+            documents = [documents[0], make_document("references/c.md", "C")]
+            second = build_version(documents, persist)
+            new_store = vector_search.get_vector_store(persist)
+            assert_true(new_store is not old_store and indexed_files(new_store) == {"references/a.md", "references/c.md"},
+                        "the same persist path should serve the new version without a restart")
+            assert_true(indexed_files(old_store) == {"references/a.md", "references/b.md"},
+                        "in-flight readers keep the old version during the grace period")
+            assert_true(get_generation(persist) != generation, "switching should bump the generation")
+            assert_true({doc["path"] for doc in get_keyword_index(persist).docs} == {"references/a.md", "references/c.md"},
+                        "keyword index should follow the switch")
+            assert_true(first["version"] in list_versions(persist), "retired version should wait for the grace period")
+
+            diff, reason = plan_incremental_update(documents + [make_document("references/d.md", "D")],
+                                                   resolve_persist_directory(persist))
+            assert_true(reason is None, f"manifest should be copied into the version: {reason}")
+            third = build_version(documents + [make_document("references/d.md", "D")], persist, diff)
+            assert_true(indexed_files(vector_search.get_vector_store(persist)) == {"references/a.md", "references/c.md", "references/d.md"},
+                        "incremental update should build on a copy of the current version")
+            assert_true(indexed_files(new_store) == {"references/a.md", "references/c.md"}, "the copied version is left untouched")
+
+            try:
+                validate_version(resolve_persist_directory(persist), 999)
+                raise AssertionError("wrong chunk count should fail validation")
+            except RuntimeError:
+                pass
+
+            pending, pending_dir = create_version(persist)
+            with open(os.path.join(pending_dir, vector_search.CHECKPOINT_FILENAME), "w") as f:
+                f.write("{}")
+            assert_true(find_resumable_version(persist) == (pending, pending_dir), "interrupted build should be resumable")
+            removed = collect_garbage(persist, grace_seconds=0)
+            assert_true(set(removed) == {first["version"], second["version"]}, f"retired versions should be collected: {removed}")
+            assert_true(set(list_versions(persist)) == {third["version"], pending}, "current and resumable versions are kept")
+
+            retired_path = os.path.join(get_versions_root(persist), pending, RETIRED_FILENAME)
+            with open(retired_path, "w") as f:
+                f.write(str(time.time()))
+            assert_true(collect_garbage(persist, grace_seconds=3600) == [], "versions inside the grace period are kept")
+    finally:
+        model_registry._model_registry, vector_search._vector_store, backend = originals
+        # 假模型的查詢向量不可留在共用快取中
+        get_embedding_cache().clear()
+        if backend is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = backend
+
+
+def test_failed_validation_keeps_current():
+    import build_index
+    from embedding_cache import get_embedding_cache
+
+    def failing(directory, expected_chunks):
+        raise RuntimeError("simulated validation failure")
+
+    originals = (model_registry._model_registry, vector_search._vector_store, build_index.validate_version,
+                 os.environ.get(vector_search.VECTOR_BACKEND_ENV))
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("char-model", lambda name: CharModel())})
+    os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            persist = os.path.join(tmp, "chroma_db")
+            first = build_version([make_document("references/a.md", "A")], persist)
+            generation = get_generation(persist)
+
+            build_index.validate_version = failing
+            try:
+                build_version([make_document("references/b.md", "B")], persist)
+                raise AssertionError("failed validation should raise")
+            except RuntimeError:
+                pass
+            assert_true(current_version(persist) == first["version"] and get_generation(persist) == generation,
+                        "current version should not change")
+            assert_true(list_versions(persist) == [first["version"]], "the failed version should be discarded")
+            assert_true(indexed_files(vector_search.get_vector_store(persist)) == {"references/a.md"},
+                        "the old version keeps serving")
+    finally:
+        model_registry._model_registry, vector_search._vector_store, build_index.validate_version, backend = originals
+        get_embedding_cache().clear()
+        if backend is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = backend
+
+
+if __name__ == "__main__":
+    test_build_and_swap()
+    print("test_build_and_swap: PASS")
+    test_failed_validation_keeps_current()
+    print("test_failed_validation_keeps_current: PASS")
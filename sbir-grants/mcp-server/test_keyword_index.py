@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+關鍵字倒排索引測試
+"""
+
+import os
+import tempfile
+
+from keyword_index import KeywordIndex, get_category_keys
+
+
+DOCUMENTS = [
+    {
+        "id": os.path.join("references", "methodology_market_analysis.md"),
+        "content": "# 市場分析\n\n使用 TAM / SAM / SOM 估算市場規模。市場規模要有數據來源。",
+        "metadata": {"filename": "methodology_market_analysis.md"},
+    },
+    {
+        "id": os.path.join("faq", "faq_eligibility.md"),
+        "content": "# 申請資格\n\nPhase 1 申請資格：實收資本額一億元以下。",
+        "metadata": {"filename": "faq_eligibility.md"},
+    },
+    {
+        "id": os.path.join("templates", "budget_template.md"),
+        "content": "# 經費範本\n\n人事費、材料費與補助金額編列。",
+        "metadata": {"filename": "budget_template.md"},
+    },
+]
+
+CHUNKS = [
+    {
+        "id": f"{DOCUMENTS[0]['id']}::chunk_0",
+        "content": "使用 TAM / SAM / SOM 估算市場規模。",
+        "metadata": {"file_path": DOCUMENTS[0]["id"]},
+    },
+    {
+        "id": f"{DOCUMENTS[1]['id']}::0",
+        "content": "Phase 1 申請資格：實收資本額一億元以下。",
+        "metadata": {"file_path": DOCUMENTS[1]["id"]},
+    },
+]
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_category_keys():
+    assert_true(get_category_keys(os.path.join("references", "methodology_innovation.md")) == ["methodology"], "methodology pattern")
+    assert_true(get_category_keys(os.path.join("examples", "case_studies", "case_study_ict.md")) == ["case_study"], "case_study pattern")
+    assert_true(get_category_keys(os.path.join("faq", "nested", "x.md")) == [], "patterns must not cross directories")
+
+
+def test_search_scores_and_filters():
+    index = KeywordIndex.build(DOCUMENTS, CHUNKS)
+
+    results = index.search(["市場規模", "tam"])
+    path = DOCUMENTS[0]["id"]
+    assert_true(list(results) == [path], "only the market analysis doc should match")
+    assert_true(results[path]["matched_keywords"] == 2, "both keywords matched")
+    assert_true(results[path]["keyword_score"] > 0, "BM25F score should be positive")
+
+    # 類別過濾由索引 metadata 判斷
+    assert_true(index.search(["申請資格"], "faq") != {}, "faq category should match faq doc")
+    assert_true(index.search(["申請資格"], "methodology") == {}, "methodology category should filter out faq doc")
+
+
+def test_bm25f_field_and_query_weights():
+    index = KeywordIndex.build(DOCUMENTS, CHUNKS)
+
+    # 標題命中的權重高於只在內文出現
+    results = index.search(["經費", "補助"])
+    budget_path = DOCUMENTS[2]["id"]
+    assert_true(set(results) == {budget_path}, "budget template should match")
+
+    heading_only = index.search([("經費", 1.0)])[budget_path]["keyword_score"]
+    body_only = index.search([("補助", 1.0)])[budget_path]["keyword_score"]
+    assert_true(heading_only > body_only, "heading hit should outweigh a body-only hit")
+
+    # 同義詞權重較低
+    full = index.search([("補助", 1.0)])[budget_path]["keyword_score"]
+    synonym = index.search([("補助", 0.5)])[budget_path]["keyword_score"]
+    assert_true(abs(synonym - full * 0.5) < 1e-5, "query weight should scale the score linearly")
+
+
+def test_chunk_search_uses_chunk_ids():
+    index = KeywordIndex.build(DOCUMENTS, CHUNKS)
+    hits = index.search_chunks(["tam", "市場規模"])
+    assert_true([hit["id"] for hit in hits] == [CHUNKS[0]["id"]], "chunk ids must match chunker ids")
+    assert_true(hits[0]["content"] == CHUNKS[0]["content"], "chunk content is stored for reranking")
+    assert_true(hits[0]["path"] == DOCUMENTS[0]["id"], "chunk hit carries its document path")
+    assert_true(index.search_chunks(["tam"], "faq") == [], "category filter applies to chunks")
+
+    # 沒有 chunks 時，每個文件視為單一 chunk（與 semantic_chunk 的短文件 id 相同）
+    whole = KeywordIndex.build(DOCUMENTS)
+    assert_true([hit["id"] for hit in whole.search_chunks(["經費"])] == [f"{DOCUMENTS[2]['id']}::0"], "whole-document chunk id")
+
+    ranked = whole.search_chunks(["市場", "申請", "經費"], top_k=2)
+    assert_true(len(ranked) == 2, "top_k limits chunk hits")
+    assert_true(ranked[0]["keyword_score"] >= ranked[1]["keyword_score"], "chunk hits are sorted by score")
+
+
+def test_save_and_load_roundtrip():
+    index = KeywordIndex.build(DOCUMENTS, CHUNKS)
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "keyword_index.json")
+        index.save(index_path)
+        loaded = KeywordIndex.load(index_path)
+
+    assert_true(loaded.search(["phase", "1"]) == index.search(["phase", "1"]), "loaded index must score identically")
+    assert_true(len(loaded.chunks) == 2, "chunk postings should be persisted")
+    assert_true(loaded.search_chunks(["phase"]) == index.search_chunks(["phase"]), "chunk hits survive reload")
+
+
+if __name__ == "__main__":
+    test_category_keys()
+    test_search_scores_and_filters()
+    test_bm25f_field_and_query_weights()
+    test_chunk_search_uses_chunk_ids()
+    test_save_and_load_roundtrip()
+    print("keyword-index: PASS")
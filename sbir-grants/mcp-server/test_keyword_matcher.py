@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+多關鍵字比對（Aho–Corasick）測試
+"""
+
+import random
+
+from keyword_matcher import KeywordMatcher
+from quality_check import evaluate_proposal_quality
+from enrich_answer import infer_choice_option
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_counts_match_naive_scan():
+    # 隨機文字與重疊關鍵字，結果需與逐一 count 的重疊計數一致
+    rng = random.Random(7)
+    alphabet = "ab市場規模"
+    patterns = ["a", "ab", "aba", "b", "市場", "場規", "市場規模", "模a"]
+    matcher = KeywordMatcher(patterns, normalizer=str.lower)
+
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        counts = matcher.counts(text)
+        for pattern in patterns:
+            naive = sum(1 for i in range(len(text)) if text.startswith(pattern, i))
+            assert_true(counts.get(pattern, 0) == naive, f"{pattern!r} in {text!r}: {counts.get(pattern, 0)} != {naive}")
+
+
+def test_whole_word_and_normalization():
+    matcher = KeywordMatcher(["TA", "TAM", "M1", "data", "%", "毛利"], whole_word=True)
+    found = matcher.found("Big Data 平台，ＴＡＭ 估算，M12 查核，毛利率 30%")
+    assert_true(found == {"data", "TAM", "%", "毛利"}, f"unexpected matches: {found}")
+    assert_true(matcher.found("TA需求與M1") == {"TA", "M1"}, "latin keyword next to han text should match")
+
+    # 不同寫法正規化後相同時，都回報原始寫法
+    matcher = KeywordMatcher(["Phase 1", "phase 1"], whole_word=True)
+    assert_true(matcher.found("PHASE 1 申請") == {"Phase 1", "phase 1"}, "all original spellings reported")
+
+
+def test_rule_checks_use_single_scan():
+    text = "本計畫 TAM 約 50 億元，SAM 為 10 億元。M1 完成雛型，M2 查核點。資料來源：IDC。" * 20
+    results = evaluate_proposal_quality(text)["results"]
+    assert_true(results["ch_8"] and results["ch_10"] and results["ch_11"], f"unexpected quality results: {results}")
+
+    assert_true(infer_choice_option("industry", "我們做 SaaS 平台") == "J 出版影音及資通訊業", "industry alias")
+    assert_true(infer_choice_option("business_model", "每次提案收費") == "一次性銷售（賣斷）", "fee + one-off tokens")
+
+
+if __name__ == "__main__":
+    test_counts_match_naive_scan()
+    test_whole_word_and_normalization()
+    test_rule_checks_use_single_scan()
+    print("keyword-matcher: PASS")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+模型註冊表測試
+
+1. 多個執行緒同時取得同一種模型只載入一次；unload 後重新載入
+2. 缺少套件（ImportError）只嘗試一次，其他錯誤下次呼叫會重試
+3. 匯入兩份文件（語意切塊 + SQLite 寫入）共用同一份 Embedding 模型，不重新載入
+"""
+
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import model_registry
+from model_registry import EMBEDDING, RERANK, ModelRegistry
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class FakeModel:
+    """以文字的 crc32 產生固定向量"""
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        rows = [np.random.default_rng(zlib.crc32(t.encode())).normal(size=8) for t in ([texts] if single else texts)]
+        return rows[0] if single else np.asarray(rows)
+
+
+def counting_loader(calls: list, delay: float = 0.0):
+    def load(model_name):
+        calls.append(model_name)
+        time.sleep(delay)
+        return FakeModel()
+    return load
+
+
+def test_load_once_and_unload():
+    calls = []
+    registry = ModelRegistry({EMBEDDING: ("fake-embedding", counting_loader(calls, delay=0.05))})
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get(EMBEDDING))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert_true(len(calls) == 1, f"model should load once, loaded {len(calls)} times")
+    assert_true(all(model is results[0] for model in results), "all callers should share one instance")
+
+    stats = registry.stats()["models"][EMBEDDING]
+    assert_true(stats["loaded"] and stats["loads"] == 1 and stats["load_seconds"] >= 0.05, "load should be recorded")
+
+    assert_true(registry.unload() == [EMBEDDING], "unload should report released models")
+    assert_true(registry.get_loaded(EMBEDDING) is None, "unloaded model should not be resident")
+    assert_true(not registry.stats()["models"][EMBEDDING]["loaded"], "stats should show the model as unloaded")
+    assert_true(registry.get(EMBEDDING) is not results[0] and len(calls) == 2, "model should reload after unload")
+
+
+def test_failures():
+    attempts = {"import": 0, "runtime": 0}
+
+    def missing(model_name):
+        attempts["import"] += 1
+        raise ImportError("No module named 'sentence_transformers'")
+
+    def flaky(model_name):
+        attempts["runtime"] += 1
+        if attempts["runtime"] == 1:
+            raise RuntimeError("download interrupted")
+        return FakeModel()
+
+    registry = ModelRegistry({EMBEDDING: ("missing", missing), RERANK: ("flaky", flaky)})
+    for _ in range(3):
+        try:
+            registry.get(EMBEDDING)
+            raise AssertionError("missing dependency should raise")
+        except ImportError:
+            pass
+    assert_true(attempts["import"] == 1, "missing dependency should not be retried")
+
+    try:
+        registry.get(RERANK)
+        raise AssertionError("first load should fail")
+    except RuntimeError:
+        pass
+    assert_true(isinstance(registry.get(RERANK), FakeModel) and attempts["runtime"] == 2, "other failures should be retried")
+
+
+def test_ingest_reuses_model():
+    from ingest_reference_document import ingest_document, setup_chroma_db
+
+    calls = []
+    original = model_registry._model_registry
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("fake-embedding", counting_loader(calls))})
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            if setup_chroma_db(base / "chroma_db") is not None:
+                print("test_ingest_reuses_model: SKIP（已安裝 ChromaDB，此測試針對 SQLite 路徑）")
+                return
+            for name in ("a.md", "b.md"):
+                doc = base / name
+                doc.write_text("\n".join(f"第 {i} 段：SBIR 計畫書的撰寫重點與審查標準說明。" for i in range(12)), encoding="utf-8")
+                assert_true(ingest_document(doc, ["測試"], base) > 0, "document should be ingested")
+        assert_true(len(calls) == 1, f"ingesting should reuse the shared model, loaded {len(calls)} times")
+    finally:
+        model_registry._model_registry = original
+
+
+if __name__ == "__main__":
+    test_load_once_and_unload()
+    print("test_load_once_and_unload: PASS")
+    test_failures()
+    print("test_failures: PASS")
+    test_ingest_reuses_model()
+    print("test_ingest_reuses_model: PASS")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+ONNX 推論後端測試
+
+1. SBIR_INFERENCE_BACKEND / SBIR_ONNX_QUANTIZATION 的解析與預設值
+2. ONNX 無法使用時退回 PyTorch，快取用的 model_id 依實際後端區分
+3. 一致性：固定句子集上量化 ONNX 與 PyTorch 的 embedding cosine、rerank 排序
+   （需要 sentence-transformers、optimum[onnxruntime] 與已下載的模型，缺少時略過）
+"""
+
+import importlib.util
+import os
+
+import onnx_backend
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class FakeModel:
+    """只支援 PyTorch 的模型類別（backend="onnx" 時失敗）"""
+
+    def __init__(self, name: str, backend: str | None = None, **kwargs):
+        if backend is not None:
+            raise RuntimeError("onnx not supported")
+        self.name = name
+
+
+def with_env(values: dict, fn):
+    saved = {key: os.environ.get(key) for key in values}
+    try:
+        for key, value in values.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        return fn()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def test_config_parsing():
+    env = onnx_backend.BACKEND_ENV
+    assert_true(with_env({env: None}, onnx_backend.read_inference_backend) == "torch", "default backend should be torch")
+    assert_true(with_env({env: " ONNX "}, onnx_backend.read_inference_backend) == "onnx", "backend should be normalized")
+    assert_true(with_env({env: "tensorrt"}, onnx_backend.read_inference_backend) == "torch", "unknown backend should fall back")
+
+    env = onnx_backend.QUANTIZATION_ENV
+    default = with_env({env: None}, onnx_backend.read_quantization_config)
+    assert_true(default in ("arm64", "avx2"), "default quantization should follow the CPU architecture")
+    assert_true(with_env({env: "avx512_vnni"}, onnx_backend.read_quantization_config) == "avx512_vnni", "explicit config should be used")
+    assert_true(with_env({env: "sse2"}, onnx_backend.read_quantization_config) == default, "unknown config should fall back")
+    assert_true(onnx_backend.quantized_file_name("avx2") == "onnx/model_qint8_avx2.onnx", "quantized file name should match the export")
+
+
+def test_fallback_and_model_id():
+    saved = dict(onnx_backend._active_backends)
+    try:
+        onnx_backend._active_backends.clear()
+        assert_true(onnx_backend.model_id("m") == "m", "unloaded model should keep its name")
+
+        model = with_env({onnx_backend.BACKEND_ENV: "onnx"}, lambda: onnx_backend._load(FakeModel, "m"))
+        assert_true(isinstance(model, FakeModel) and model.name == "m", "should fall back to the PyTorch model")
+        assert_true(onnx_backend.get_active_backend("m") == "torch", "fallback should be recorded")
+        assert_true(onnx_backend.model_id("m") == "m", "PyTorch keeps existing cache keys")
+
+        onnx_backend._active_backends["m"] = "onnx-qint8-avx2"
+        assert_true(onnx_backend.model_id("m") == "m@onnx-qint8-avx2", "ONNX scores should not share cache keys")
+    finally:
+        onnx_backend._active_backends.clear()
+        onnx_backend._active_backends.update(saved)
+
+
+def test_onnx_matches_torch():
+    missing = [name for name in ("sentence_transformers", "optimum", "onnxruntime") if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"test_onnx_matches_torch: SKIP（未安裝 {', '.join(missing)}）")
+        return
+
+    from vector_search import MODEL_NAME, RERANK_MODEL_NAME
+
+    report = onnx_backend.compare_backends(MODEL_NAME, RERANK_MODEL_NAME, rounds=3)
+    print(f"onnx vs torch: {report}")
+    assert_true(report["embedding"]["min_cosine"] >= 0.98, "quantized embeddings should agree with PyTorch")
+    assert_true(report["rerank"]["spearman"] >= 0.9, "quantized reranker should preserve the ranking")
+
+
+if __name__ == "__main__":
+    test_config_parsing()
+    print("test_config_parsing: PASS")
+    test_fallback_and_model_id()
+    print("test_fallback_and_model_id: PASS")
+    test_onnx_matches_torch()
+    print("test_onnx_matches_torch: PASS")
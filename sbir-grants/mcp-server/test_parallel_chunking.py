@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+平行語意分段測試
+
+以 2 個行程分段的輸出（內容、metadata、順序）與依序分段逐 byte 相同；
+子行程以主行程註冊表的載入函式建立自己的模型。
+"""
+
+import json
+import os
+import zlib
+
+import numpy as np
+
+import model_registry
+from chunker import CHUNK_WORKERS_ENV, chunk_all_documents, count_sentences, read_chunk_workers
+from model_registry import EMBEDDING, ModelRegistry
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+class HashModel:
+    """每個句子依 crc32 產生固定向量（與批次組成無關）"""
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        return np.asarray([np.random.default_rng(zlib.crc32(t.encode())).normal(size=16) for t in texts])
+
+
+def load_hash_model(model_name: str) -> HashModel:
+    # 模組層級函式：spawn 的子行程可以 pickle 參照
+    return HashModel()
+
+
+def make_documents() -> list[dict]:
+    topics = ["申請資格", "計畫書撰寫", "經費編列", "審查重點", "期末報告", "智慧財產權"]
+    documents = []
+    for d in range(8):
+        lines = [f"# 文件 {d}"]
+        for i in range(20 + d * 3):
+            lines.append(f"{topics[(i // 4 + d) % len(topics)]}：第 {d}-{i} 項說明，請依規定準備相關文件與資料。")
+        documents.append({
+            "id": f"references/doc{d}.md",
+            "content": "\n".join(lines),
+            "metadata": {"filename": f"doc{d}.md"},
+        })
+    return documents
+
+
+def test_parallel_output_matches_sequential():
+    original = model_registry._model_registry
+    model_registry._model_registry = ModelRegistry({EMBEDDING: ("hash-model", load_hash_model)})
+    try:
+        documents = make_documents()
+        sequential = chunk_all_documents(documents, workers=1)
+        parallel = chunk_all_documents(documents, workers=2)
+        assert_true(len(sequential) > len(documents), "documents should be split into several chunks")
+        assert_true(json.dumps(parallel, ensure_ascii=False) == json.dumps(sequential, ensure_ascii=False),
+                    "parallel chunking should be byte-identical to sequential")
+        assert_true(count_sentences(documents[0]["content"]) == 20, "short heading should not count as a sentence")
+    finally:
+        model_registry._model_registry = original
+
+
+def test_worker_setting():
+    saved = os.environ.get(CHUNK_WORKERS_ENV)
+    try:
+        os.environ.pop(CHUNK_WORKERS_ENV, None)
+        assert_true(read_chunk_workers() == 1, "default should be sequential")
+        os.environ[CHUNK_WORKERS_ENV] = "3"
+        assert_true(read_chunk_workers() == 3, "explicit worker count should be used")
+        os.environ[CHUNK_WORKERS_ENV] = "many"
+        assert_true(read_chunk_workers() == 1, "invalid value should fall back to sequential")
+    finally:
+        if saved is None:
+            os.environ.pop(CHUNK_WORKERS_ENV, None)
+        else:
+            os.environ[CHUNK_WORKERS_ENV] = saved
+
+
+if __name__ == "__main__":
+    test_parallel_output_matches_sequential()
+    print("test_parallel_output_matches_sequential: PASS")
+    test_worker_setting()
+    print("test_worker_setting: PASS")
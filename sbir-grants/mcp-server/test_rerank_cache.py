@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Re-ranking 分數快取測試
+
+以計數用的假 Cross-Encoder 確認：
+1. 候選 chunk 重疊的搜尋只對新的 (查詢, chunk) 呼叫 predict
+2. chunk 內容改變（重建索引）後重新評分，不取用舊分數
+3. 分數寫入 SQLite，重新開啟（server 重啟）後仍可命中
+"""
+
+import os
+import tempfile
+
+import rerank_cache
+import vector_search
+from rerank_cache import RerankScoreCache
+
+
+class CountingCrossEncoder:
+    """記錄 predict 呼叫的假模型（分數為 chunk 長度）"""
+
+    def __init__(self):
+        self.pairs: list[list[str]] = []
+
+    def predict(self, pairs: list[list[str]]) -> list[float]:
+        self.pairs.extend(pairs)
+        return [float(len(content)) for _, content in pairs]
+
+
+def candidates(*contents: str) -> list[dict]:
+    return [{"id": f"doc.md::chunk_{i}", "content": content} for i, content in enumerate(contents)]
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_only_uncached_pairs_are_scored():
+    model = CountingCrossEncoder()
+    originals = (vector_search.get_rerank_model, rerank_cache._rerank_cache)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "rerank_cache.db")
+        vector_search.get_rerank_model = lambda: model
+        rerank_cache._rerank_cache = RerankScoreCache(db_path)
+        try:
+            first = vector_search.rerank_results("Phase 1 補助", candidates("一二三", "一二", "一"), top_k=3)
+            # 換 category：候選部分重疊，查詢只差在空白
+            second = vector_search.rerank_results(" Phase 1  補助", candidates("一二", "一二三四"), top_k=2)
+            pairs_after_overlap = len(model.pairs)
+            # 重建索引後 chunk 內容改變
+            vector_search.rerank_results("Phase 1 補助", candidates("一二三（修訂）"), top_k=1)
+            stats = rerank_cache.get_rerank_cache().stats()
+            rerank_cache.get_rerank_cache().close()
+
+            # server 重啟：新的快取實例讀同一個檔案
+            rerank_cache._rerank_cache = RerankScoreCache(db_path)
+            model.pairs.clear()
+            vector_search.rerank_results("Phase 1 補助", candidates("一", "一二三"), top_k=2)
+            rerank_cache.get_rerank_cache().close()
+        finally:
+            vector_search.get_rerank_model, rerank_cache._rerank_cache = originals
+
+    assert_true([r["content"] for r in first] == ["一二三", "一二", "一"], "results should be sorted by rerank score")
+    assert_true([r["content"] for r in second] == ["一二三四", "一二"], "cached and new scores should be merged")
+    assert_true(pairs_after_overlap == 4, f"overlapping candidate should not be re-scored ({pairs_after_overlap} pairs)")
+    assert_true(stats["hits"] == 1 and stats["misses"] == 5, f"changed chunk content should miss: {stats}")
+    assert_true(model.pairs == [], f"scores should persist across restarts: {model.pairs}")
+
+
+if __name__ == "__main__":
+    test_only_uncached_pairs_are_scored()
+    print("rerank-cache: PASS")
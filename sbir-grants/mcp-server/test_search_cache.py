@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+兩層搜尋快取測試
+
+確認：
+1. 記憶體層依位元組預算淘汰最久未使用的結果
+2. 磁碟層在重新建立快取（server 重啟）後仍可命中，並放回記憶體層
+3. 索引世代改變後，兩層的舊結果都不再被取用
+"""
+
+import os
+import tempfile
+
+from index_generation import INITIAL_GENERATION, bump_generation, get_generation
+from search_cache import SearchCache
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_memory_tier_byte_budget():
+    result = "結果" * 10  # 60 bytes
+    cache = SearchCache(max_bytes=150)
+    cache.set("q1", "all", result, generation="g1")
+    cache.set("q2", "all", result, generation="g1")
+    assert_true(cache.get("q1", "all", generation="g1") == result, "q1 should be cached")
+    cache.set("q3", "all", result, generation="g1")  # 超過 150 bytes，淘汰最久未使用的 q2
+
+    assert_true(cache.get("q2", "all", generation="g1") is None, "least recently used entry should be evicted")
+    assert_true(cache.get("q1", "all", generation="g1") == result, "recently used entry should stay")
+    cache.set("huge", "all", "x" * 151, generation="g1")
+    assert_true(cache.get("huge", "all", generation="g1") is None, "entries over the budget should not be cached")
+
+    stats = cache.stats()
+    assert_true(stats["bytes"] == 120 and stats["size"] == 2, f"unexpected memory usage: {stats}")
+    assert_true(stats["disk"] is None, "memory-only cache should not report a disk tier")
+
+
+def test_disk_tier_survives_restart_and_follows_generation():
+    with tempfile.TemporaryDirectory() as tmp:
+        persist_dir = os.path.join(tmp, "chroma_db")
+        disk_path = os.path.join(tmp, "search_cache.db")
+        first_generation = get_generation(persist_dir)
+
+        cache = SearchCache(disk_path=disk_path)
+        cache.set("Phase 1 補助", "all", "舊索引的結果", generation=first_generation)
+        cache.close()
+
+        restarted = SearchCache(disk_path=disk_path)
+        survived = restarted.get("Phase 1 補助", "all", generation=first_generation)
+        promoted = restarted.stats()["size"]
+
+        new_generation = bump_generation(persist_dir)
+        after_rebuild = restarted.get("Phase 1 補助", "all", generation=get_generation(persist_dir))
+        disk_stats = restarted.stats()["disk"]
+        restarted.close()
+
+    assert_true(first_generation == INITIAL_GENERATION, "generation should start at the initial value")
+    assert_true(survived == "舊索引的結果" and promoted == 1, "disk hit should be served and promoted to memory")
+    assert_true(new_generation != first_generation, "bump should create a new generation")
+    assert_true(after_rebuild is None, "results from an old index generation must not be served")
+    assert_true(disk_stats["size"] == 0, f"old generation should be purged from disk: {disk_stats}")
+    assert_true(disk_stats["hits"] == 1 and disk_stats["misses"] == 1, f"unexpected disk stats: {disk_stats}")
+
+
+if __name__ == "__main__":
+    test_memory_tier_byte_budget()
+    test_disk_tier_survives_restart_and_follows_generation()
+    print("search-cache: PASS")
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Reciprocal Rank Fusion 測試
+"""
+
+from search_fusion import reciprocal_rank_fusion
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_rrf_prefers_agreement():
+    fused = reciprocal_rank_fusion([
+        (["a.md::0", "b.md::chunk_1", "c.md::0"], 0.4),
+        (["b.md::chunk_1", "d.md::chunk_2"], 0.6),
+    ])
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    assert_true(ranked[0] == "b.md::chunk_1", f"chunk found by both lists should rank first: {ranked}")
+    assert_true(all(0 < score <= 1 for score in fused.values()), "scores are normalized to (0, 1]")
+
+
+def test_rrf_single_list_and_zero_weight():
+    fused = reciprocal_rank_fusion([(["a", "b"], 0.4), (["c"], 0.0)])
+    assert_true(abs(fused["a"] - 1.0) < 1e-9, "top of the only weighted list scores 1.0")
+    assert_true(fused["c"] == 0.0, "zero-weight list contributes nothing")
+    assert_true(reciprocal_rank_fusion([([], 0.0)]) == {}, "no weight, no scores")
+
+
+if __name__ == "__main__":
+    test_rrf_prefers_agreement()
+    test_rrf_single_list_and_zero_weight()
+    print("search-fusion: PASS")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+搜尋追蹤測試
+
+確認：
+1. 各階段的耗時、候選數、略過與錯誤都記錄在 trace，並累計到 histogram
+2. search_knowledge_base 帶 debug=true 時附上各階段明細，get_search_metrics 回報統計
+"""
+
+import asyncio
+import time
+
+import search_cache
+import search_trace
+import server
+import vector_search
+import worker_pool
+from search_cache import SearchCache
+from search_trace import SearchMetrics, SearchTrace
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_trace_and_histograms():
+    metrics = SearchMetrics()
+    for sleep_ms in (3, 30):
+        trace = SearchTrace()
+        with trace.stage("keyword_scan", items_in=4) as stage:
+            time.sleep(sleep_ms / 1000)
+            stage.items_out = 20
+        stage = trace.begin("rerank", items_in=20)
+        trace.fail("rerank", RuntimeError("model error"))
+        stage.end(items_out=20)
+        trace.skip("mmr", "語意搜尋不可用")
+        metrics.record(trace.finish())
+
+    snapshot = metrics.snapshot()
+    keyword = snapshot["stages"]["keyword_scan"]
+    assert_true(keyword["count"] == 2 and keyword["avg_in"] == 4 and keyword["avg_out"] == 20, f"unexpected counts: {keyword}")
+    # sleep 只保證下限，負載高時可能落在更高的桶
+    assert_true(keyword["p50_ms"] >= 5 and keyword["p95_ms"] >= 50, f"durations should land in their buckets: {keyword}")
+    assert_true(keyword["max_ms"] >= 30, "max should be exact")
+    assert_true(snapshot["stages"]["rerank"]["errors"] == 2, "handled errors should be counted")
+    assert_true(snapshot["stages"]["mmr"]["skipped"] == 2 and snapshot["stages"]["mmr"]["count"] == 0, "skips should be counted")
+    assert_true(snapshot["outcomes"] == {"full": 2}, f"unexpected outcomes: {snapshot['outcomes']}")
+    assert_true("❌ model error" in trace.to_markdown(), "debug output should show stage errors")
+
+    histogram = search_trace._Histogram()
+    for ms in [0.5] * 90 + [30.0] * 9 + [20000.0]:
+        histogram.add(ms)
+    assert_true(histogram.percentile(0.50) == 1, "p50 should be the upper bound of its bucket")
+    assert_true(histogram.percentile(0.95) == 50, "p95 should be the upper bound of its bucket")
+    assert_true(histogram.percentile(0.999) == 20000.0, "overflow bucket should report max")
+
+
+async def search_with_debug() -> tuple[str, str, str]:
+    first = await server.call_tool("search_knowledge_base", {"query": "追蹤測試 創新", "debug": True})
+    again = await server.call_tool("search_knowledge_base", {"query": "追蹤測試 創新"})
+    report = await server.call_tool("get_search_metrics", {"reset": True})
+    return first[0].text, again[0].text, report[0].text
+
+
+def test_debug_argument_and_metrics_tool():
+    originals = (vector_search.needs_reindex, search_cache._search_cache, search_trace._search_metrics)
+    vector_search.needs_reindex = lambda persist_directory: True  # 只用關鍵字搜尋
+    search_cache._search_cache = SearchCache()
+    search_trace._search_metrics = SearchMetrics()
+
+    try:
+        first, again, report = asyncio.run(search_with_debug())
+        after_reset = search_trace.get_metrics().snapshot()
+    finally:
+        vector_search.needs_reindex, search_cache._search_cache, search_trace._search_metrics = originals
+        worker_pool.shutdown()
+
+    for label in ("結果快取查詢", "同義詞擴展", "關鍵字搜尋", "語意搜尋", "RRF 融合", "時間加權", "MMR 多樣性", "格式化"):
+        assert_true(f"| {label} |" in first, f"debug output should include stage {label}")
+    assert_true("略過：語意搜尋不可用" in first, "skipped rerank should be explained")
+    assert_true("搜尋追蹤" not in again, "trace should only be shown with debug")
+    assert_true("完整搜尋 1 次" in report and "結果快取命中 1 次" in report, "metrics should count outcomes")
+    assert_true(after_reset["outcomes"] == {}, "reset should clear metrics")
+
+
+if __name__ == "__main__":
+    test_trace_and_histograms()
+    test_debug_argument_and_metrics_tool()
+    print("search-trace: PASS")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+語意近似查詢快取測試
+
+確認：
+1. 相似度達門檻、同 category、同索引世代的查詢才會命中
+2. 影子模式只比對不回傳，並依前幾名 chunk 是否一致統計誤判
+3. search_knowledge_base 對換句話說的查詢直接回傳快取結果
+"""
+
+import asyncio
+
+import search_cache
+import semantic_cache
+import server
+import vector_search
+import worker_pool
+from keyword_index import get_keyword_index
+from search_cache import SearchCache
+from semantic_cache import SemanticQueryCache
+
+# 假的查詢向量：同一組的查詢視為換句話說
+FAKE_EMBEDDINGS = {
+    "Phase 1 補助上限": [1.0, 0.0, 0.0],
+    "第一階段補助金額上限是多少": [0.97, 0.2, 0.0],
+    "創新性怎麼寫": [0.0, 0.0, 1.0],
+}
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_threshold_category_and_generation():
+    cache = SemanticQueryCache(threshold=0.95)
+    cache.add("Phase 1 補助上限", FAKE_EMBEDDINGS["Phase 1 補助上限"], "all", "g1", "結果", ["a", "b", "c"])
+
+    hit = cache.lookup(FAKE_EMBEDDINGS["第一階段補助金額上限是多少"], "all", "g1")
+    assert_true(hit is not None and hit["query"] == "Phase 1 補助上限", "paraphrase should hit")
+    assert_true(cache.lookup(FAKE_EMBEDDINGS["創新性怎麼寫"], "all", "g1") is None, "unrelated query should miss")
+    assert_true(cache.lookup(FAKE_EMBEDDINGS["Phase 1 補助上限"], "faq", "g1") is None, "other category should miss")
+    assert_true(cache.lookup(FAKE_EMBEDDINGS["Phase 1 補助上限"], "all", "g2") is None, "new index generation should miss")
+    assert_true(cache.stats()["size"] == 0, "old generation entries should be dropped")
+    assert_true(not SemanticQueryCache().enabled, "cache should be disabled without a threshold")
+
+
+def test_shadow_mode_counts_false_hits():
+    cache = SemanticQueryCache(threshold=0.8, shadow=True)
+    cache.add("q", [1.0, 0.0], "all", "g1", "結果", ["a", "b", "c", "d"])
+
+    close = cache.lookup([0.99, 0.1], "all", "g1")
+    assert_true(cache.verify(close, ["c", "a", "b", "x"]), "same top chunks in another order are a true hit")
+    far = cache.lookup([0.85, 0.5], "all", "g1")
+    assert_true(not cache.verify(far, ["a", "x", "y"]), "different top chunks are a false hit")
+
+    stats = cache.stats()
+    assert_true(stats["verified"] == 2 and stats["false_hits"] == 1, f"unexpected stats: {stats}")
+    report = {row["threshold"]: row for row in cache.threshold_report((0.8, 0.9))}
+    assert_true(report[0.8]["hits"] == 2 and report[0.8]["false_hits"] == 1, f"unexpected report: {report}")
+    assert_true(report[0.9]["hits"] == 1 and report[0.9]["false_hits"] == 0, f"unexpected report: {report}")
+
+
+async def search_twice() -> tuple[str, str]:
+    first = await server.search_knowledge_base("Phase 1 補助上限")
+    second = await server.search_knowledge_base("第一階段補助金額上限是多少")
+    return first, second
+
+
+def test_search_serves_paraphrased_query():
+    get_keyword_index(server.PERSIST_DIR)
+    originals = (vector_search.encode_query, vector_search.needs_reindex, semantic_cache._semantic_cache, search_cache._search_cache)
+    vector_search.encode_query = lambda query: FAKE_EMBEDDINGS[query]
+    vector_search.needs_reindex = lambda persist_directory: True  # 只用關鍵字搜尋
+    semantic_cache._semantic_cache = SemanticQueryCache(threshold=0.95)
+    search_cache._search_cache = SearchCache()
+
+    try:
+        first, second = asyncio.run(search_twice())
+        stats = semantic_cache.get_semantic_cache().stats()
+    finally:
+        vector_search.encode_query, vector_search.needs_reindex, semantic_cache._semantic_cache, search_cache._search_cache = originals
+        worker_pool.shutdown()
+
+    assert_true("相近查詢「Phase 1 補助上限」" in second, "paraphrased query should be served from the semantic cache")
+    assert_true(second.startswith(first), "served result should be the cached answer")
+    assert_true(stats["hits"] == 1 and stats["misses"] == 1, f"unexpected stats: {stats}")
+
+
+if __name__ == "__main__":
+    test_threshold_category_and_generation()
+    test_shadow_mode_counts_false_hits()
+    test_search_serves_paraphrased_query()
+    print("semantic-cache: PASS")
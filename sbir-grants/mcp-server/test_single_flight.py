@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+請求合併（single-flight）測試
+
+確認：
+1. 同時進行、參數相同（key 順序不同也算）的搜尋只跑一次語意搜尋
+2. 參數不同的呼叫不合併；呼叫結束後再次呼叫會重新執行
+3. 例外傳給所有等待中的呼叫端；其中一個呼叫端取消不影響其他呼叫端
+"""
+
+import asyncio
+import time
+
+import search_cache
+import server
+import vector_search
+import worker_pool
+from search_cache import SearchCache
+from single_flight import SingleFlight
+
+SLOW_SECONDS = 0.3
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+async def concurrent_searches() -> list:
+    return await asyncio.gather(
+        server.call_tool("search_knowledge_base", {"query": "合併測試 創新", "category": "all"}),
+        server.call_tool("search_knowledge_base", {"category": "all", "query": "合併測試 創新"}),
+        server.call_tool("search_knowledge_base", {"query": "合併測試 市場", "category": "all"}),
+    )
+
+
+def test_identical_searches_run_once():
+    queries: list[str] = []
+
+    def slow_semantic_search(query: str, persist_directory: str, n_results: int = 10) -> list:
+        queries.append(query)
+        time.sleep(SLOW_SECONDS)
+        return []
+
+    originals = (vector_search.needs_reindex, vector_search.semantic_search, search_cache._search_cache)
+    vector_search.needs_reindex = lambda persist_directory: False
+    vector_search.semantic_search = slow_semantic_search
+    search_cache._search_cache = SearchCache()
+
+    try:
+        first, second, other = asyncio.run(concurrent_searches())
+    finally:
+        vector_search.needs_reindex, vector_search.semantic_search, search_cache._search_cache = originals
+        worker_pool.shutdown()
+
+    assert_true(sorted(queries) == ["合併測試 創新", "合併測試 市場"], f"identical calls should run once: {queries}")
+    assert_true(first is second, "coalesced callers should share one result")
+    assert_true(other[0].text != first[0].text, "different arguments must not be coalesced")
+
+
+async def exercise_single_flight() -> tuple:
+    flight = SingleFlight()
+    runs = []
+
+    async def work(value: str) -> str:
+        runs.append(value)
+        await asyncio.sleep(0.05)
+        if value == "bad":
+            raise RuntimeError("boom")
+        return value
+
+    # 其中一個呼叫端取消，另一個仍拿到結果
+    cancelled = asyncio.ensure_future(flight.run(("t", "a"), lambda: work("a")))
+    waiting = asyncio.ensure_future(flight.run(("t", "a"), lambda: work("a")))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    shared = await waiting
+
+    errors = await asyncio.gather(
+        flight.run(("t", "bad"), lambda: work("bad")),
+        flight.run(("t", "bad"), lambda: work("bad")),
+        return_exceptions=True,
+    )
+    again = await flight.run(("t", "a"), lambda: work("a"))
+    return shared, errors, again, runs, flight.stats()
+
+
+def test_cancellation_errors_and_completion():
+    shared, errors, again, runs, stats = asyncio.run(exercise_single_flight())
+
+    assert_true(shared == "a" and again == "a", "callers should receive the shared result")
+    assert_true(all(isinstance(e, RuntimeError) for e in errors), f"errors should reach every caller: {errors}")
+    assert_true(runs == ["a", "bad", "a"], f"finished calls should not be reused: {runs}")
+    assert_true(stats == {"in_flight": 0, "calls": 5, "coalesced": 2}, f"unexpected stats: {stats}")
+
+
+if __name__ == "__main__":
+    test_identical_searches_run_once()
+    test_cancellation_errors_and_completion()
+    print("single-flight: PASS")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+CJK 分詞測試
+"""
+
+from tokenizer import query_terms, segment, tokenize
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def test_tokenize_mixed_text():
+    terms = tokenize("Phase 1 補助")
+    assert_true(terms == ["phase", "1", "補", "助", "補助"], f"unexpected terms: {terms}")
+    assert_true(tokenize("ＴＡＭ") == ["tam"], "full-width latin should be normalized")
+
+
+def test_query_terms():
+    assert_true(query_terms("補助") == ["補助"], "short han keyword is one term")
+    assert_true(query_terms("補助金額") == ["補助金", "助金額"], "long han keyword uses overlapping trigrams")
+    assert_true(query_terms("%") == [], "punctuation has no terms")
+
+
+def test_segment_with_vocabulary():
+    words = segment("Phase 1 補助金額上限", {"補助金額"})
+    assert_true(words == ["phase", "1", "補助金額", "上限"], f"unexpected segmentation: {words}")
+    assert_true(segment("研究計畫書撰寫") == ["研究", "究計", "計畫", "畫書", "書撰", "撰寫"], "long unmatched run falls back to bigrams")
+
+
+if __name__ == "__main__":
+    test_tokenize_mixed_text()
+    test_query_terms()
+    test_segment_with_vocabulary()
+    print("tokenizer: PASS")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+背景版本檢查測試
+
+確認：
+1. 搜尋過程不執行任何子程序（git fetch 不在搜尋路徑上）
+2. 背景檢查的結果附在下一次搜尋後面，且只附一次
+3. 離線模式不啟動檢查
+"""
+
+import asyncio
+import os
+import subprocess
+
+import search_cache
+import server
+import update_check
+import vector_search
+import worker_pool
+from search_cache import SearchCache
+
+NOTICE = "\n\n---\n💡 **有新版本可用！**"
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+async def run_scenario() -> tuple[list, str, str]:
+    update_check.start(server.PROJECT_ROOT, delay=0, interval=3600)
+    while update_check.get_status()["last_check"] is None:
+        await asyncio.sleep(0.01)
+
+    spawned = []
+    original_run, original_popen = subprocess.run, subprocess.Popen
+    subprocess.run = lambda *args, **kwargs: spawned.append(args) or original_run(*args, **kwargs)
+    subprocess.Popen = lambda *args, **kwargs: spawned.append(args) or original_popen(*args, **kwargs)
+    try:
+        first = await server.search_knowledge_base("版本檢查測試 創新")
+        second = await server.search_knowledge_base("版本檢查測試 市場")
+    finally:
+        subprocess.run, subprocess.Popen = original_run, original_popen
+        update_check.stop()
+    return spawned, first, second
+
+
+def test_search_never_runs_git():
+    originals = (update_check.check_for_updates, vector_search.needs_reindex, search_cache._search_cache)
+    update_check.check_for_updates = lambda project_root: NOTICE
+    vector_search.needs_reindex = lambda persist_directory: True  # 只用關鍵字搜尋
+    search_cache._search_cache = SearchCache()
+
+    try:
+        spawned, first, second = asyncio.run(run_scenario())
+    finally:
+        update_check.check_for_updates, vector_search.needs_reindex, search_cache._search_cache = originals
+        update_check._pending_notice = None
+        update_check._last_check = None
+        worker_pool.shutdown()
+
+    assert_true(spawned == [], f"search should not spawn subprocesses: {spawned}")
+    assert_true(first.endswith(NOTICE), "background check result should be appended")
+    assert_true(NOTICE not in second, "each notice should be shown only once")
+
+
+async def start_offline():
+    return update_check.start(server.PROJECT_ROOT, delay=0)
+
+
+def test_offline_mode_skips_check():
+    os.environ[update_check.OFFLINE_ENV] = "1"
+    try:
+        assert_true(asyncio.run(start_offline()) is None, "offline mode should not schedule a check")
+    finally:
+        del os.environ[update_check.OFFLINE_ENV]
+
+
+if __name__ == "__main__":
+    test_search_never_runs_git()
+    test_offline_mode_skips_check()
+    print("update-check: PASS")
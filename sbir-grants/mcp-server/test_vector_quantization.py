@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+向量量化測試
+
+確認：
+1. int8（每列 scale）與 float16 的還原誤差，SQLite BLOB 編解碼（含舊版 JSON 文字）
+2. flat 向量庫以 int8 / float16 儲存時矩陣變小，前幾名與 float32 幾乎相同；
+   啟用全精度重新計分時分數與順序與 float32 完全一致
+3. benchmark 的量化比較回報各格式的大小與指標差
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import benchmark
+import server
+import vector_search
+from vector_quantization import decode_blob, dequantize, encode_blob, quantize
+from vector_search import FlatVectorStore
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def unit_rows(rng, n: int, dim: int) -> np.ndarray:
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_codecs():
+    rng = np.random.default_rng(3)
+    vectors = unit_rows(rng, 50, 384)
+
+    codes, scales = quantize(vectors, "int8")
+    assert_true(codes.dtype == np.int8 and scales.shape == (50,), "int8 should keep one scale per vector")
+    assert_true(np.abs(dequantize(codes, scales) - vectors).max() <= scales.max() / 2 + 1e-6, "int8 error should be within half a step")
+
+    half, none = quantize(vectors, "float16")
+    assert_true(half.dtype == np.float16 and none is None, "float16 needs no scale")
+    assert_true(np.abs(dequantize(half) - vectors).max() < 1e-3, "float16 error should be small")
+
+    for dtype, size in (("float32", 1 + 384 * 4), ("float16", 1 + 384 * 2), ("int8", 5 + 384)):
+        blob = encode_blob(vectors[0], dtype)
+        assert_true(len(blob) == size, f"{dtype} blob should be {size} bytes")
+        assert_true(np.abs(decode_blob(blob) - vectors[0]).max() < 0.01, f"{dtype} blob should round-trip")
+    assert_true(np.allclose(decode_blob(json.dumps([0.5, -1.0])), [0.5, -1.0]), "legacy JSON text should still decode")
+
+
+def test_quantized_flat_store():
+    rng = np.random.default_rng(11)
+    vectors = unit_rows(rng, 2000, 64)
+    ids = [f"doc{i}.md::chunk_0" for i in range(len(vectors))]
+    queries = unit_rows(rng, 20, 64)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {}
+        for name, dtype, rescore in (("f32", "float32", 0), ("f16", "float16", 0), ("i8", "int8", 0), ("i8r", "int8", 100)):
+            stores[name] = FlatVectorStore(os.path.join(tmp, name), dtype=dtype, rescore=rescore)
+            stores[name].upsert(ids, vectors, [""] * len(ids), [{}] * len(ids))
+
+        sizes = {name: store.index_bytes() for name, store in stores.items()}
+        assert_true(sizes["f16"] < sizes["f32"] * 0.55 and sizes["i8"] < sizes["f32"] * 0.3, f"compressed matrices should be smaller: {sizes}")
+        assert_true(sizes["i8r"] > sizes["f32"], "rescoring keeps a float32 copy")
+
+        for query in queries:
+            exact = stores["f32"].query(query, 10)
+            exact_ids = [hit[0] for hit in exact]
+            for name in ("f16", "i8"):
+                approx_ids = [hit[0] for hit in stores[name].query(query, 10)]
+                assert_true(len(set(approx_ids) & set(exact_ids)) >= 8, f"{name} top-10 should mostly match float32")
+            rescored = stores["i8r"].query(query, 10)
+            assert_true([hit[0] for hit in rescored] == exact_ids, "rescoring should restore the exact order")
+            assert_true(np.allclose([hit[3] for hit in rescored], [hit[3] for hit in exact], atol=1e-6), "rescoring should use full precision")
+
+        # 壓縮格式的 upsert 以還原值保留其他向量
+        stores["i8"].upsert([ids[0]], queries[:1], ["新"], [{}])
+        assert_true(stores["i8"].count() == len(ids) and stores["i8"].query(queries[0], 1)[0][0] == ids[0], "upsert should replace within int8")
+
+
+class FakeModel:
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for ch in text:
+                vectors[row, ord(ch) % self.dim] += 1.0
+        return vectors
+
+
+def test_benchmark_quantization_report():
+    originals = (server.PERSIST_DIR, vector_search.get_embedding_model, vector_search._vector_store,
+                 os.environ.get(vector_search.VECTOR_BACKEND_ENV))
+    model = FakeModel(32)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            server.PERSIST_DIR = tmp
+            vector_search.get_embedding_model = lambda: model
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+
+            query_set = benchmark.load_query_set()
+            documents = []
+            for item in query_set["queries"]:
+                for path in item["relevant"]:
+                    documents.append({"id": f"{path}::chunk_0", "content": item["query"], "metadata": {"file_path": path}})
+            vector_search.index_documents(documents, tmp)
+
+            report = benchmark.evaluate_quantization()
+    finally:
+        server.PERSIST_DIR, vector_search.get_embedding_model, vector_search._vector_store, backend = originals
+        if backend is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = backend
+        from embedding_cache import get_embedding_cache
+        get_embedding_cache().clear()
+
+    assert_true(set(report) == {"float32", "float16", "int8", "int8+rescore50"}, f"unexpected variants: {list(report)}")
+    assert_true(report["float32"]["delta"]["recall@10"] == 0 and report["float32"]["overlap@10"] == 1.0, "float32 is the reference")
+    assert_true(report["int8"]["bytes"] < report["float16"]["bytes"] < report["float32"]["bytes"], "sizes should shrink with precision")
+    assert_true(report["float32"]["metrics"]["recall@10"] > 0.5, f"fake embeddings should find exact query text: {report['float32']}")
+    # 內容相同的 chunk 向量相同，名次可能對調，只要求前 10 名幾乎一致
+    for name in ("float16", "int8", "int8+rescore50"):
+        assert_true(report[name]["overlap@10"] >= 0.95, f"{name} should mostly agree with float32: {report[name]}")
+        assert_true(abs(report[name]["delta"]["recall@10"]) <= 0.05, f"{name} recall should barely change: {report[name]}")
+
+
+if __name__ == "__main__":
+    test_codecs()
+    test_quantized_flat_store()
+    test_benchmark_quantization_report()
+    print("vector-quantization: PASS")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+flat 向量庫測試
+
+以隨機向量確認：
+1. 精確 top-k 與暴力排序一致，相似度為 cosine
+2. upsert 取代既有 id，其他程序寫入後讀取端自動重新載入
+3. SBIR_VECTOR_BACKEND=flat 時 index_documents、semantic_search、get_index_count 改用 flat 向量庫
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import vector_search
+from vector_search import FlatVectorStore
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def random_vectors(rng, n: int, dim: int = 16) -> np.ndarray:
+    return rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def test_exact_top_k_and_upsert():
+    rng = np.random.default_rng(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FlatVectorStore(tmp)
+        assert_true(store.count() == 0 and store.query([1.0] * 16, 5) == [], "empty store should return nothing")
+
+        vectors = random_vectors(rng, 200)
+        ids = [f"doc{i}.md::chunk_0" for i in range(200)]
+        store.upsert(ids, vectors.tolist(), [f"內容 {i}" for i in ids], [{"file": i} for i in ids])
+        assert_true(store.count() == 200, "all vectors should be stored")
+
+        query = rng.normal(size=16)
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+        hits = store.query(query.tolist(), 10)
+        assert_true([hit[0] for hit in hits] == [ids[i] for i in expected], "top-k should match brute force")
+        assert_true(abs(hits[0][3] - float(normalized[expected[0]] @ (query / np.linalg.norm(query)))) < 1e-5,
+                    "similarity should be cosine")
+        assert_true(hits[0][1] == f"內容 {ids[expected[0]]}" and hits[0][2] == {"file": ids[expected[0]]},
+                    "content and metadata should follow the vector")
+
+        # 另一個程序（另一個實例）取代既有 id 並新增一筆
+        writer = FlatVectorStore(tmp)
+        writer.upsert([ids[0], "new.md::chunk_0"], [query.tolist(), (-query).tolist()], ["新內容", "反向"], [{}, {}])
+        assert_true(store.count() == 201, "reader should reload after another writer replaced the index")
+        top = store.query(query.tolist(), 1)[0]
+        assert_true(top[0] == ids[0] and top[1] == "新內容" and top[3] > 0.999, "upsert should replace the old vector")
+        assert_true(store.query((-query).tolist(), 1)[0][0] == "new.md::chunk_0", "new id should be searchable")
+
+        embeddings = store.get_embeddings([ids[0], "missing"])
+        assert_true(list(embeddings) == [ids[0]], "unknown ids should be skipped")
+        assert_true(len([f for f in os.listdir(tmp) if f.endswith(".npy")]) == 1, "old matrix files should be removed")
+        assert_true({chunk["id"] for chunk in store.get_all()} == set(ids) | {"new.md::chunk_0"}, "get_all should list every chunk")
+
+
+class FakeModel:
+    """以字元碼產生固定向量的 encode（不需要下載模型）"""
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        vectors = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for ch in text:
+                vectors[row, ord(ch) % 8] += 1.0
+        return vectors
+
+
+def test_backend_selection():
+    original_env = os.environ.get(vector_search.VECTOR_BACKEND_ENV)
+    originals = (vector_search.get_embedding_model, vector_search._vector_store)
+    model = FakeModel()
+    vector_search.get_embedding_model = lambda: model
+    os.environ[vector_search.VECTOR_BACKEND_ENV] = "flat"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            assert_true(vector_search.get_index_count(tmp) == 0, "new directory should have no vectors")
+            documents = [
+                {"id": f"doc{i % 4}.md::chunk_0", "content": text, "metadata": {"file": f"doc{i % 4}.md"}}
+                for i, text in enumerate(["aaaa", "abab", "cccc", "hhhh"] * 4)
+            ]
+            # id 重複的文件以最後一次為準
+            vector_search.index_documents(documents, tmp)
+            assert_true(vector_search.get_index_count(tmp) == 4, "duplicate ids should be replaced")
+            assert_true(isinstance(vector_search.get_vector_store(tmp), FlatVectorStore), "flat backend should be selected")
+
+            results = vector_search.semantic_search("aaaa", tmp, n_results=2)
+            assert_true(results[0]["id"] == "doc0.md::chunk_0" and results[0]["similarity"] > 0.999,
+                        f"exact match should rank first: {results}")
+            assert_true(all(result["similarity"] >= 0.25 for result in results), "low similarities should be filtered")
+            assert_true(abs(results[0]["distance"] - (1 - results[0]["similarity"])) < 1e-9, "distance should be cosine distance")
+    finally:
+        vector_search.get_embedding_model, vector_search._vector_store = originals
+        if original_env is None:
+            os.environ.pop(vector_search.VECTOR_BACKEND_ENV, None)
+        else:
+            os.environ[vector_search.VECTOR_BACKEND_ENV] = original_env
+        from embedding_cache import get_embedding_cache
+        get_embedding_cache().clear()
+
+
+if __name__ == "__main__":
+    test_exact_top_k_and_upsert()
+    test_backend_selection()
+    print("vector-store: PASS")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+背景預熱測試
+
+以 time.sleep 模擬模型載入，確認：
+1. 預熱期間的搜尋不等待模型，以關鍵字搜尋回應且不寫入快取
+2. 預熱完成後 get_server_status 回報各元件已就緒與載入耗時
+"""
+
+import asyncio
+import time
+
+import search_cache
+import server
+import vector_search
+import warmup
+import worker_pool
+from keyword_index import get_keyword_index
+from search_cache import SearchCache
+
+LOAD_SECONDS = 0.8
+
+
+def slow_embedding_model():
+    time.sleep(LOAD_SECONDS)
+    return object()
+
+
+def fake_semantic_search(query: str, persist_directory: str, n_results: int = 10) -> list:
+    return [{
+        "id": "references/methodology_innovation.md::chunk_0",
+        "content": "創新性論述",
+        "similarity": 0.9,
+        "metadata": {"file": "methodology_innovation.md", "file_path": "references/methodology_innovation.md"},
+    }]
+
+
+def assert_true(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+async def run_scenario() -> tuple[str, float, str, str]:
+    # 關鍵字索引是降級搜尋本身需要的，先載入，只量測模型預熱的影響
+    get_keyword_index(server.PERSIST_DIR)
+    task = warmup.start(server.PERSIST_DIR)
+    assert_true(task is not None, "warm-up should start when enabled")
+
+    started = time.perf_counter()
+    during = await server.search_knowledge_base("預熱測試 創新性")
+    elapsed = time.perf_counter() - started
+
+    await task
+    after = await server.search_knowledge_base("預熱測試 創新性")
+    status = (await server.get_server_status())[0].text
+    return during, elapsed, after, status
+
+
+def test_search_during_warmup_falls_back_to_keywords():
+    originals = (
+        vector_search.get_index_count, vector_search.get_embedding_model, vector_search.get_rerank_model,
+        vector_search.needs_reindex, vector_search.semantic_search, vector_search.rerank_results,
+    )
+    vector_search.get_index_count = lambda persist_directory: 5
+    vector_search.get_embedding_model = slow_embedding_model
+    vector_search.get_rerank_model = lambda: object()
+    vector_search.needs_reindex = lambda persist_directory: False
+    vector_search.semantic_search = fake_semantic_search
+    vector_search.rerank_results = lambda query, results, top_k=5: results[:top_k]
+    original_cache = search_cache._search_cache
+    search_cache._search_cache = SearchCache()  # 只用記憶體層，不讀寫本機的磁碟快取
+
+    try:
+        during, elapsed, after, status = asyncio.run(run_scenario())
+    finally:
+        (
+            vector_search.get_index_count, vector_search.get_embedding_model, vector_search.get_rerank_model,
+            vector_search.needs_reindex, vector_search.semantic_search, vector_search.rerank_results,
+        ) = originals
+        warmup._warmup_task = None
+        warmup._status = {name: {"state": "cold"} for name in warmup.COMPONENTS}
+        worker_pool.shutdown()
+        search_cache._search_cache = original_cache
+
+    assert_true(elapsed < LOAD_SECONDS, f"search waited for model loading ({elapsed:.2f}s)")
+    assert_true("🔍 關鍵字搜尋" in during and "背景載入中" in during, "search during warm-up should be keyword-only")
+    assert_true("混合搜尋" in after and "背景載入中" not in after, "search after warm-up should be hybrid")
+    assert_true("💡 *此結果來自快取" not in after, "degraded result must not be cached")
+    assert_true(status.count("✅ 已就緒") == 4, f"all components should be warm:\n{status}")
+
+
+if __name__ == "__main__":
+    test_search_during_warmup_falls_back_to_keywords()
+    print("warmup: PASS")
@@ -0,0 +1,117 @@
+"""
+CJK 分詞模組 - 關鍵字索引、同義詞展開與計畫書檢核共用
+
+中文沒有空白分詞，因此：
+- 連續漢字切成字元 n-gram（單字、bigram、trigram）
+- 英文字、數字各自視為一個詞（如 `Phase 1` → phase / 1、`TAM` → tam）
+
+索引時用 tokenize() 產生 terms；查詢時用 query_terms() 把關鍵字轉成
+「必須同時出現」的 terms，關鍵字比對就變成索引交集，而不是整份文字的子字串掃描。
+（單段文字對一串固定關鍵字的比對見 keyword_matcher.py）
+"""
+
+import re
+import unicodedata
+
+# 漢字 n-gram 長度（單字 n-gram 用於「月」「億」這類單字關鍵字）
+HAN_NGRAM_SIZES = (1, 2, 3)
+MAX_NGRAM = max(HAN_NGRAM_SIZES)
+
+# 英文字、數字、漢字（含擴充 A 與相容區）
+_RUN_PATTERN = re.compile(r'[a-z]+|[0-9]+|[\u3400-\u9fff\uf900-\ufaff]+')
+
+
+def normalize(text: str) -> str:
+    """全形轉半形（NFKC）並轉小寫"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _is_han(run: str) -> bool:
+    return not run.isascii()
+
+
+def split_runs(text: str) -> list[str]:
+    """切成英文字、數字與連續漢字片段（已正規化）"""
+    return _RUN_PATTERN.findall(normalize(text))
+
+
+def han_ngrams(run: str, sizes: tuple = HAN_NGRAM_SIZES) -> list[str]:
+    """連續漢字的字元 n-gram"""
+    grams = []
+    for n in sizes:
+        grams.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return grams
+
+
+def tokenize(text: str) -> list[str]:
+    """索引用：英數單字 + 漢字 n-gram"""
+    terms = []
+    for run in split_runs(text):
+        if _is_han(run):
+            terms.extend(han_ngrams(run))
+        else:
+            terms.append(run)
+    return terms
+
+
+def query_terms(keyword: str) -> list[str]:
+    """
+    查詢用：關鍵字 → 必須同時出現的 terms
+
+    長度不超過 MAX_NGRAM 的漢字片段本身就是一個 term（精確比對）；
+    更長的片段取重疊的 MAX_NGRAM-gram，交集即近似於整段出現。
+    """
+    terms = []
+    for run in split_runs(keyword):
+        if _is_han(run) and len(run) > MAX_NGRAM:
+            terms.extend(han_ngrams(run, (MAX_NGRAM,)))
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))
+
+
+def segment(text: str, vocabulary: set[str] | None = None) -> list[str]:
+    """
+    查詢分詞：英數單字照原樣，連續漢字以 vocabulary（如同義詞表）做最長匹配
+
+    匹配不到的漢字片段若不超過 MAX_NGRAM 字則整段保留，否則拆成 bigram，
+    避免「補助金額上限」整串變成一個只能子字串比對的巨大關鍵字。
+
+    Example:
+        >>> segment("Phase 1 補助金額上限", {"補助金額"})
+        ["phase", "1", "補助金額", "上限"]
+    """
+    vocabulary = vocabulary or set()
+    max_len = max((len(w) for w in vocabulary), default=0)
+    words = []
+
+    def _flush(fragment: str) -> None:
+        if not fragment:
+            return
+        if len(fragment) <= MAX_NGRAM:
+            words.append(fragment)
+        else:
+            words.extend(han_ngrams(fragment, (2,)))
+
+    for run in split_runs(text):
+        if not _is_han(run):
+            words.append(run)
+            continue
+
+        i = 0
+        pending = ""
+        while i < len(run):
+            for n in range(min(max_len, len(run) - i), 1, -1):
+                if run[i:i + n] in vocabulary:
+                    _flush(pending)
+                    pending = ""
+                    words.append(run[i:i + n])
+                    i += n
+                    break
+            else:
+                pending += run[i]
+                i += 1
+        _flush(pending)
+
+    return words
+
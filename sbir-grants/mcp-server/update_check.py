@@ -0,0 +1,124 @@
+"""
+版本檢查模組 - 在背景定期檢查知識庫是否有新版本
+
+原本 search_knowledge_base 在回應前同步執行 git rev-parse / git fetch（逾時 10 秒），
+每天第一個搜尋要多等一次網路往返。現在由 server 啟動後的背景 task 定期檢查，
+結果記在記憶體中，搜尋時有提醒就附上（每次檢查結果只附一次），搜尋本身不執行任何子程序。
+
+設定環境變數 SBIR_OFFLINE=1 可完全不檢查（不連網）。
+"""
+
+import asyncio
+import logging
+import os
+import subprocess
+import time
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_ENV = "SBIR_OFFLINE"
+
+# 每 24 小時檢查一次；啟動後稍等再檢查，避免與模型預熱搶資源
+VERSION_CHECK_INTERVAL = 86400
+STARTUP_DELAY_SECONDS = 30
+
+_check_task = None
+_pending_notice: str | None = None
+_last_check: float | None = None
+
+
+def is_offline() -> bool:
+    """是否為離線模式（不檢查新版本）"""
+    return os.environ.get(OFFLINE_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def check_for_updates(project_root: str) -> str | None:
+    """
+    檢查是否有新版本可用（阻塞：執行 git 子程序並連網）
+    返回更新提醒訊息，如果已是最新則返回 None
+    """
+    try:
+        # 取得本地最新 commit
+        local_result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=project_root,
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        if local_result.returncode != 0:
+            return None
+        local_commit = local_result.stdout.strip()[:7]
+
+        # 取得遠端最新 commit
+        subprocess.run(
+            ["git", "fetch", "--quiet"],
+            cwd=project_root,
+            capture_output=True,
+            timeout=10
+        )
+
+        remote_result = subprocess.run(
+            ["git", "rev-parse", "origin/main"],
+            cwd=project_root,
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        if remote_result.returncode != 0:
+            return None
+        remote_commit = remote_result.stdout.strip()[:7]
+
+        # 比較版本
+        if local_commit != remote_commit:
+            return f"\n\n---\n💡 **有新版本可用！** 您的版本：`{local_commit}`，最新版本：`{remote_commit}`\n請說「**更新知識庫**」來獲得最新內容。"
+
+        return None
+
+    except Exception:
+        # 任何錯誤都靜默忽略
+        return None
+
+
+async def _check_periodically(project_root: str, delay: float, interval: float) -> None:
+    global _pending_notice, _last_check
+    await asyncio.sleep(delay)
+    while True:
+        # 在 event loop 預設的執行緒池中執行，不佔用 worker_pool
+        _pending_notice = await asyncio.to_thread(check_for_updates, project_root)
+        _last_check = time.time()
+        await asyncio.sleep(interval)
+
+
+def start(project_root: str, delay: float = STARTUP_DELAY_SECONDS,
+          interval: float = VERSION_CHECK_INTERVAL) -> asyncio.Task | None:
+    """在目前的 event loop 啟動背景版本檢查（離線模式時回傳 None）"""
+    global _check_task
+    if is_offline() or _check_task is not None:
+        return _check_task
+    _check_task = asyncio.get_running_loop().create_task(_check_periodically(project_root, delay, interval))
+    return _check_task
+
+
+def stop() -> None:
+    """停止背景版本檢查"""
+    global _check_task
+    if _check_task is not None:
+        _check_task.cancel()
+        _check_task = None
+
+
+def take_notice() -> str | None:
+    """取出尚未顯示的更新提醒（只回傳一次；不執行任何子程序）"""
+    global _pending_notice
+    notice, _pending_notice = _pending_notice, None
+    return notice
+
+
+def get_status() -> dict:
+    """版本檢查狀態"""
+    return {
+        "offline": is_offline(),
+        "running": _check_task is not None and not _check_task.done(),
+        "last_check": _last_check,
+    }
@@ -0,0 +1,112 @@
+"""
+向量量化模組 - 以 float16 / int8 儲存 chunk embeddings
+
+embeddings 原本以 Python float list（.tolist()）或 JSON 文字保存，每個維度佔 8～20 bytes。
+這裡提供：
+- float16：每維 2 bytes，誤差約 1e-3
+- int8：每個向量一個 float32 scale（max|v| / 127），每維 1 byte
+
+flat 向量庫（vector_search.FlatVectorStore）直接在壓縮後的矩陣上計分，
+可選擇保留一份 float32 向量，只對前幾名候選以全精度重新計分。
+
+環境變數：
+- SBIR_VECTOR_DTYPE：float32（預設）、float16 或 int8，建立 flat 索引時套用
+- SBIR_VECTOR_RESCORE：以全精度重新計分的候選數（0 為關閉）；
+  建立索引時大於 0 才會另存 float32 向量
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+DTYPE_ENV = "SBIR_VECTOR_DTYPE"
+RESCORE_ENV = "SBIR_VECTOR_RESCORE"
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+DEFAULT_DTYPE = "float32"
+
+# 壓縮矩陣分塊計分，避免轉成 float32 時配置整個矩陣大小的暫存
+SCORE_BLOCK_ROWS = 4096
+
+# SQLite BLOB 的格式代碼（第一個 byte）
+_BLOB_CODES = {"float32": 0, "float16": 1, "int8": 2}
+_BLOB_DTYPES = {code: dtype for dtype, code in _BLOB_CODES.items()}
+
+
+def read_vector_dtype() -> str:
+    """SBIR_VECTOR_DTYPE（未設定或無效時為 float32）"""
+    dtype = os.environ.get(DTYPE_ENV, DEFAULT_DTYPE).strip().lower()
+    if dtype not in VECTOR_DTYPES:
+        print(f"未知的向量格式 {DTYPE_ENV}={dtype!r}，改用 {DEFAULT_DTYPE}")
+        return DEFAULT_DTYPE
+    return dtype
+
+
+def read_rescore_candidates() -> int:
+    """SBIR_VECTOR_RESCORE（未設定或無效時為 0，即不重新計分）"""
+    value = os.environ.get(RESCORE_ENV, "0").strip()
+    try:
+        return max(0, int(value))
+    except ValueError:
+        print(f"{RESCORE_ENV}={value!r} 不是有效的整數，不重新計分")
+        return 0
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    壓縮向量矩陣（每列一個向量）
+
+    Returns:
+        (壓縮後的矩陣, 每列的 scale；只有 int8 才有，其餘為 None)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"不支援的向量格式: {dtype}")
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray | None = None) -> np.ndarray:
+    """還原為 float32 矩陣"""
+    vectors = np.asarray(codes, dtype=np.float32)
+    return vectors * scales[:, None] if scales is not None else vectors
+
+
+def score(codes: np.ndarray, scales: np.ndarray | None, query: np.ndarray) -> np.ndarray:
+    """壓縮矩陣與查詢向量的內積（float32 矩陣一次計算，其餘分塊轉換）"""
+    query = np.asarray(query, dtype=np.float32)
+    if codes.dtype == np.float32:
+        return codes @ query
+    scores = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+        block = codes[start:start + SCORE_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query
+    return scores * scales if scales is not None else scores
+
+
+def encode_blob(vector, dtype: str = DEFAULT_DTYPE) -> bytes:
+    """單一向量 → SQLite BLOB（格式代碼 + int8 的 scale + 資料）"""
+    codes, scales = quantize(np.asarray(vector, dtype=np.float32)[None, :], dtype)
+    header = struct.pack("<B", _BLOB_CODES[dtype])
+    if scales is not None:
+        header += struct.pack("<f", float(scales[0]))
+    return header + codes[0].tobytes()
+
+
+def decode_blob(blob) -> np.ndarray:
+    """SQLite BLOB（或舊版的 JSON 文字）→ float32 向量"""
+    if isinstance(blob, str):
+        return np.asarray(json.loads(blob), dtype=np.float32)
+    dtype = _BLOB_DTYPES[blob[0]]
+    if dtype == "int8":
+        (scale,) = struct.unpack_from("<f", blob, 1)
+        return np.frombuffer(blob, dtype=np.int8, offset=5).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.dtype(dtype), offset=1).astype(np.float32)
@@ -1,75 +1,481 @@
 """
 向量搜尋服務 - RAG 語意搜尋核心模組
 
-使用 ChromaDB + sentence-transformers 實現語意搜尋
+使用 sentence-transformers 實現語意搜尋，向量存放在可替換的向量庫（環境變數 SBIR_VECTOR_BACKEND）：
+- chroma（預設）：ChromaDB 持久化 collection
+- flat：chroma_db/ 下的 float32 .npy 矩陣（memory-mapped）+ JSON metadata，
+  以一次矩陣乘向量做精確 top-k。知識庫只有數千個 chunk，不需要 HNSW，
+  也省去 ChromaDB client 的啟動成本
 """
 
+import json
 import os
+import threading
+import time
+import uuid
 
+import numpy as np
 
-# 懶加載的全域變數
-_chroma_client = None
-_embedding_model = None
-_rerank_model = None
-_collection = None
+import model_registry
+from index_versions import resolve_persist_directory
+
+
+# 懶加載的全域變數（模型由 model_registry 統一保存）；ChromaDB client 依目錄各一個，
+# 索引換版（見 index_versions.py）後開啟新目錄的 client，舊目錄的 client 隨之釋放
+_chroma_clients = {}
+_collections = {}
+
+# 背景預熱與 worker 執行緒可能同時觸發載入，避免同一個 client 被建立兩次
+_load_lock = threading.RLock()
 
 # 配置
-MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+MODEL_NAME = model_registry.EMBEDDING_MODEL_NAME
+RERANK_MODEL_NAME = model_registry.RERANK_MODEL_NAME
 COLLECTION_NAME = 'sbir_knowledge_base'
 
+VECTOR_BACKEND_ENV = "SBIR_VECTOR_BACKEND"
+VECTOR_BACKENDS = ("chroma", "flat")
+DEFAULT_VECTOR_BACKEND = "chroma"
 
-def get_embedding_model():
-    """懶加載 Embedding 模型"""
-    global _embedding_model
-    if _embedding_model is None:
-        try:
-            from sentence_transformers import SentenceTransformer
-            print(f"正在載入 Embedding 模型: {MODEL_NAME}")
-            _embedding_model = SentenceTransformer(MODEL_NAME)
-            print("Embedding 模型載入完成")
-        except Exception as e:
-            print(f"載入 Embedding 模型失敗: {e}")
-            raise
-    return _embedding_model
+# flat 向量庫的 metadata 檔（指向目前的 .npy 矩陣檔），放在 persist_directory 中
+FLAT_INDEX_FILENAME = "flat_index.json"
 
+# index_documents：每次寫入向量庫的 chunk 數（ChromaDB 單次寫入上限約 5000；
+# flat 向量庫每次寫入重寫整個矩陣，批次越大重寫次數越少）
+WRITE_BATCH_SIZE = 512
 
-def get_chroma_client(persist_directory: str):
-    """懶加載 ChromaDB 客戶端"""
-    global _chroma_client
-    if _chroma_client is None:
-        try:
-            import chromadb
-            from chromadb.config import Settings
+# encode 的批次大小依可用記憶體調整：每個 chunk 以約 4MB 的中間張量估計
+# （MiniLM、最長 128 tokens，保守值），最多使用可用記憶體的 10%
+ENCODE_BATCH_RANGE = (16, 256)
+DEFAULT_ENCODE_BATCH = 64
+ENCODE_BYTES_PER_ITEM = 4 * 1024 * 1024
+ENCODE_MEMORY_FRACTION = 0.1
+
+# 建立索引的進度檢查點（中斷後重新執行時從這裡繼續），放在 persist_directory 中
+CHECKPOINT_FILENAME = "index_progress.json"
 
-            # 確保目錄存在
-            os.makedirs(persist_directory, exist_ok=True)
+_vector_store = None
 
-            _chroma_client = chromadb.PersistentClient(
-                path=persist_directory,
-                settings=Settings(anonymized_telemetry=False)
-            )
-            print(f"ChromaDB 客戶端初始化完成: {persist_directory}")
-        except Exception as e:
-            print(f"初始化 ChromaDB 失敗: {e}")
-            raise
-    return _chroma_client
+
+def get_embedding_model():
+    """懶加載 Embedding 模型（整個 process 共用一份，見 model_registry）"""
+    return model_registry.get_embedding_model()
+
+
+def get_chroma_client(persist_directory: str):
+    """懶加載 ChromaDB 客戶端（每個目錄一個）"""
+    client = _chroma_clients.get(persist_directory)
+    if client is None:
+        with _load_lock:
+            client = _chroma_clients.get(persist_directory)
+            if client is None:
+                try:
+                    import chromadb
+                    from chromadb.config import Settings
+
+                    # 確保目錄存在
+                    os.makedirs(persist_directory, exist_ok=True)
+
+                    client = chromadb.PersistentClient(
+                        path=persist_directory,
+                        settings=Settings(anonymized_telemetry=False)
+                    )
+                    _chroma_clients[persist_directory] = client
+                    print(f"ChromaDB 客戶端初始化完成: {persist_directory}")
+                except Exception as e:
+                    print(f"初始化 ChromaDB 失敗: {e}")
+                    raise
+    return client
 
 
 def get_collection(persist_directory: str):
     """獲取或創建 collection"""
-    global _collection
-    if _collection is None:
-        client = get_chroma_client(persist_directory)
-        _collection = client.get_or_create_collection(
-            name=COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}
+    collection = _collections.get(persist_directory)
+    if collection is None:
+        with _load_lock:
+            collection = _collections.get(persist_directory)
+            if collection is None:
+                client = get_chroma_client(persist_directory)
+                collection = client.get_or_create_collection(
+                    name=COLLECTION_NAME,
+                    metadata={"hnsw:space": "cosine"}
+                )
+                _collections[persist_directory] = collection
+    return collection
+
+
+def _release_chroma_clients(keep: str) -> None:
+    """釋放其他目錄的 ChromaDB client（換版後舊版本目錄不再查詢）"""
+    for directory in [d for d in _chroma_clients if d != keep]:
+        _chroma_clients.pop(directory, None)
+        _collections.pop(directory, None)
+
+
+def get_vector_backend() -> str:
+    """目前設定的向量庫（SBIR_VECTOR_BACKEND，未設定或無效時為 chroma）"""
+    backend = os.environ.get(VECTOR_BACKEND_ENV, DEFAULT_VECTOR_BACKEND).strip().lower()
+    if backend not in VECTOR_BACKENDS:
+        print(f"未知的向量庫 {VECTOR_BACKEND_ENV}={backend!r}，改用 {DEFAULT_VECTOR_BACKEND}")
+        return DEFAULT_VECTOR_BACKEND
+    return backend
+
+
+class ChromaVectorStore:
+    """ChromaDB collection（cosine 距離）"""
+
+    name = "chroma"
+
+    def __init__(self, persist_directory: str):
+        self.persist_directory = persist_directory
+        self._collection = None
+
+    @property
+    def collection(self):
+        # 保留自己的 collection：換版後進行中的查詢仍使用原本的目錄
+        if self._collection is None:
+            self._collection = get_collection(self.persist_directory)
+        return self._collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids: list[str], embeddings: list, contents: list[str], metadatas: list[dict]) -> None:
+        # 一次 upsert（已存在的 id 直接取代），不再先 get / delete 再 add
+        self.collection.upsert(ids=ids, documents=contents,
+                               embeddings=np.asarray(embeddings, dtype=np.float32).tolist(), metadatas=metadatas)
+
+    def delete(self, ids: list[str]) -> None:
+        if ids:
+            self.collection.delete(ids=list(ids))
+
+    def ids(self) -> list[str]:
+        return self.collection.get(include=[])['ids']
+
+    def query(self, embedding: list[float], n_results: int) -> list[tuple[str, str, dict, float]]:
+        """最相近的 n_results 個 chunk：[(id, 內容, metadata, cosine 相似度), ...]"""
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"]
         )
-    return _collection
+        hits = []
+        if results['ids'] and results['ids'][0]:
+            for i, chunk_id in enumerate(results['ids'][0]):
+                distance = results['distances'][0][i] if results['distances'] else 0
+                hits.append((
+                    chunk_id,
+                    results['documents'][0][i] if results['documents'] else "",
+                    results['metadatas'][0][i] if results['metadatas'] else {},
+                    1 - distance,  # cosine distance 轉為 similarity
+                ))
+        return hits
+
+    def get_all(self) -> list[dict]:
+        results = self.collection.get(include=["documents", "metadatas"])
+        return [
+            {"id": chunk_id, "content": content or "", "metadata": metadata or {}}
+            for chunk_id, content, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+        ]
+
+    def get_embeddings(self, ids: list[str]) -> dict:
+        results = self.collection.get(ids=list(ids), include=["embeddings"])
+        return {chunk_id: embedding for chunk_id, embedding in zip(results['ids'], results['embeddings'])}
+
+
+class _FlatMatrix:
+    """flat 向量庫的矩陣：搜尋用的（可能已壓縮）矩陣，加上選用的 float32 全精度矩陣"""
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray | None = None, full: np.ndarray | None = None):
+        self.codes = codes
+        self.scales = scales
+        self.full = full
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def score(self, query: np.ndarray) -> np.ndarray:
+        from vector_quantization import score
+        return score(self.codes, self.scales, query)
+
+    def rows(self, indices) -> np.ndarray:
+        """指定列的 float32 向量（有全精度矩陣時取用，否則還原壓縮值）"""
+        from vector_quantization import dequantize
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.full is not None:
+            return np.asarray(self.full[indices], dtype=np.float32)
+        return dequantize(self.codes[indices], self.scales[indices] if self.scales is not None else None)
+
+
+class FlatVectorStore:
+    """
+    單一 .npy 矩陣的精確搜尋向量庫
+
+    - flat_index.json：模型名稱、維度、格式、chunk id / 內容 / metadata，以及目前的矩陣檔名
+    - flat_index.<token>.npy：L2 正規化後的矩陣（列順序與 ids 相同），以 mmap 唯讀載入。
+      格式依 SBIR_VECTOR_DTYPE 為 float32、float16 或 int8（另有每列 scale 檔），
+      壓縮格式且 SBIR_VECTOR_RESCORE > 0 時另存 float32 矩陣，供前幾名候選以全精度重新計分
+      （見 vector_quantization.py）
+
+    寫入時先寫新的矩陣檔，再以 os.replace 原子地換掉 JSON，最後刪除舊矩陣檔；
+    讀取端以 JSON 的修改時間與 inode 判斷是否重新載入（其他程序重建索引後自動生效）。
+    """
 
+    name = "flat"
+
+    def __init__(self, persist_directory: str, dtype: str | None = None, rescore: int | None = None):
+        """
+        Args:
+            persist_directory: 索引目錄
+            dtype: 寫入時的矩陣格式，None 時取自 SBIR_VECTOR_DTYPE
+            rescore: 以全精度重新計分的候選數，None 時取自 SBIR_VECTOR_RESCORE
+        """
+        from vector_quantization import read_rescore_candidates, read_vector_dtype
+
+        self.persist_directory = persist_directory
+        self.meta_path = os.path.join(persist_directory, FLAT_INDEX_FILENAME)
+        self.dtype = dtype or read_vector_dtype()
+        self.rescore = read_rescore_candidates() if rescore is None else rescore
+        self._lock = threading.Lock()
+        self._mtime = None
+        # (metadata, 矩陣, id → 列號)；整組替換，讀取端不會拿到新舊混合的狀態
+        self._state: tuple = (None, None, {})
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.persist_directory, filename)
+
+    def _load(self) -> tuple[dict | None, _FlatMatrix | None, dict]:
+        """載入（或在檔案更新後重新載入）metadata 與矩陣"""
+        try:
+            # os.replace 換上新檔時 inode 也會改變，連續寫入落在同一個 mtime 單位也能察覺
+            stat = os.stat(self.meta_path)
+            mtime = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._mtime:
+                if mtime is None:
+                    self._state = (None, None, {})
+                else:
+                    with open(self.meta_path, 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                    files = meta["files"]
+                    matrix = _FlatMatrix(
+                        np.load(self._path(files["vectors"]), mmap_mode="r"),
+                        np.load(self._path(files["scales"])) if "scales" in files else None,
+                        np.load(self._path(files["full"]), mmap_mode="r") if "full" in files else None,
+                    )
+                    if len(matrix) != len(meta["ids"]):
+                        raise ValueError(f"flat 向量索引損毀：{len(matrix)} 個向量、{len(meta['ids'])} 個 id")
+                    self._state = (meta, matrix, {chunk_id: i for i, chunk_id in enumerate(meta["ids"])})
+                self._mtime = mtime
+            return self._state
+
+    def count(self) -> int:
+        meta, _, _ = self._load()
+        return len(meta["ids"]) if meta else 0
+
+    def index_bytes(self) -> int:
+        """矩陣檔（含 scale 與全精度矩陣）的磁碟大小"""
+        meta, _, _ = self._load()
+        if not meta:
+            return 0
+        return sum(os.path.getsize(self._path(filename)) for filename in meta["files"].values())
+
+    def upsert(self, ids: list[str], embeddings, contents: list[str], metadatas: list[dict]) -> None:
+        meta, matrix, _ = self._load()
+        # 同一批中重複的 id 以最後一筆為準
+        rows = sorted({chunk_id: i for i, chunk_id in enumerate(ids)}.values())
+        ids = [ids[i] for i in rows]
+        contents = [contents[i] for i in rows]
+        metadatas = [metadatas[i] for i in rows]
+        new_vectors = np.asarray(embeddings, dtype=np.float32)[rows]
+
+        if meta:
+            replaced = set(ids)
+            keep = [i for i, chunk_id in enumerate(meta["ids"]) if chunk_id not in replaced]
+            vectors = np.concatenate([matrix.rows(keep), new_vectors])
+            all_ids = [meta["ids"][i] for i in keep] + list(ids)
+            all_contents = [meta["documents"][i] for i in keep] + list(contents)
+            all_metadatas = [meta["metadatas"][i] for i in keep] + list(metadatas)
+        else:
+            vectors, all_ids, all_contents, all_metadatas = new_vectors, list(ids), list(contents), list(metadatas)
+
+        self._write(vectors, all_ids, all_contents, all_metadatas, old_meta=meta)
+
+    def delete(self, ids: list[str]) -> None:
+        meta, matrix, _ = self._load()
+        removed = set(ids)
+        if not meta or not removed.intersection(meta["ids"]):
+            return
+        keep = [i for i, chunk_id in enumerate(meta["ids"]) if chunk_id not in removed]
+        self._write(
+            matrix.rows(keep),
+            [meta["ids"][i] for i in keep],
+            [meta["documents"][i] for i in keep],
+            [meta["metadatas"][i] for i in keep],
+            old_meta=meta,
+        )
 
-def index_documents(documents: list, persist_directory: str):
+    def ids(self) -> list[str]:
+        meta, _, _ = self._load()
+        return list(meta["ids"]) if meta else []
+
+    def _write(self, vectors: np.ndarray, ids: list[str], contents: list[str], metadatas: list[dict],
+               old_meta: dict | None) -> None:
+        from vector_quantization import quantize
+
+        os.makedirs(self.persist_directory, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True) if len(vectors) else np.ones((0, 1), dtype=np.float32)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+
+        token = uuid.uuid4().hex[:12]
+        codes, scales = quantize(vectors, self.dtype)
+        arrays = {"vectors": codes}
+        if scales is not None:
+            arrays["scales"] = scales
+        if self.dtype != "float32" and self.rescore > 0:
+            arrays["full"] = vectors
+        files = {}
+        for kind, array in arrays.items():
+            files[kind] = f"flat_index.{token}.{kind}.npy"
+            np.save(self._path(files[kind]), np.ascontiguousarray(array))
+
+        meta = {
+            "model": MODEL_NAME,
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "dtype": self.dtype,
+            "files": files,
+            "ids": ids,
+            "documents": contents,
+            "metadatas": metadatas,
+        }
+        tmp_path = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+        for filename in (old_meta or {}).get("files", {}).values():
+            try:
+                os.remove(self._path(filename))
+            except OSError:
+                pass  # Windows 上仍被 mmap 時無法刪除，下次重建時再覆蓋
+
+    def query(self, embedding, n_results: int) -> list[tuple[str, str, dict, float]]:
+        """
+        精確 top-k：一次矩陣乘向量（cosine 相似度）
+
+        壓縮格式且有全精度矩陣時，先以壓縮矩陣取前 max(n_results, rescore) 名，
+        再以 float32 重新計分排序。
+        """
+        meta, matrix, _ = self._load()
+        if not meta or n_results <= 0:
+            return []
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        vector = vector / norm if norm > 0 else vector
+        scores = matrix.score(vector)
+
+        rescore = matrix.full is not None and self.rescore > 0
+        k = min(max(n_results, self.rescore) if rescore else n_results, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        if rescore:
+            scores = np.zeros_like(scores)
+            scores[top] = matrix.rows(top) @ vector
+        top = top[np.argsort(-scores[top], kind="stable")][:n_results]
+        return [(meta["ids"][i], meta["documents"][i], meta["metadatas"][i], float(scores[i])) for i in top]
+
+    def get_all(self) -> list[dict]:
+        meta, _, _ = self._load()
+        if not meta:
+            return []
+        return [
+            {"id": chunk_id, "content": content or "", "metadata": metadata or {}}
+            for chunk_id, content, metadata in zip(meta["ids"], meta["documents"], meta["metadatas"])
+        ]
+
+    def get_embeddings(self, ids: list[str]) -> dict:
+        """已 L2 正規化的向量（壓縮格式時為還原值或全精度值）"""
+        meta, matrix, positions = self._load()
+        if not meta:
+            return {}
+        found = [chunk_id for chunk_id in ids if chunk_id in positions]
+        if not found:
+            return {}
+        return dict(zip(found, matrix.rows([positions[chunk_id] for chunk_id in found]).tolist()))
+
+
+def get_vector_store(persist_directory: str):
     """
-    建立文件索引
+    懶加載目前設定的向量庫（ChromaVectorStore 或 FlatVectorStore）
+
+    persist_directory 已切換到版本目錄時（見 index_versions.py）開啟目前版本，
+    server 不需重啟即可使用 build_index.py 新建立的索引
+    """
+    global _vector_store
+    backend = get_vector_backend()
+    directory = resolve_persist_directory(persist_directory)
+    store = _vector_store
+    if store is None or store.name != backend or store.persist_directory != directory:
+        with _load_lock:
+            store = _vector_store
+            if store is None or store.name != backend or store.persist_directory != directory:
+                if store is not None and store.persist_directory != directory:
+                    print(f"索引目錄已切換：{directory}")
+                store = FlatVectorStore(directory) if backend == "flat" else ChromaVectorStore(directory)
+                _release_chroma_clients(keep=directory)
+                _vector_store = store
+    return store
+
+
+def auto_encode_batch_size() -> int:
+    """依可用記憶體決定 encode 的批次大小（無法取得記憶體資訊時為 DEFAULT_ENCODE_BATCH）"""
+    available = model_registry.available_memory_bytes()
+    if available is None:
+        return DEFAULT_ENCODE_BATCH
+    low, high = ENCODE_BATCH_RANGE
+    return max(low, min(high, int(available * ENCODE_MEMORY_FRACTION // ENCODE_BYTES_PER_ITEM)))
+
+
+def _documents_signature(documents: list, known: list) -> str:
+    """檢查點對應的寫入內容（模型、向量庫、每個 chunk 的 id、內容與是否沿用已知向量）"""
+    import hashlib
+    digest = hashlib.sha256(f"{MODEL_NAME}\0{get_vector_backend()}\0".encode("utf-8"))
+    for doc, vector in zip(documents, known):
+        digest.update(doc["id"].encode("utf-8") + b"\0" + doc["content"].encode("utf-8")
+                      + (b"\0e\0" if vector is None else b"\0k\0"))
+    return digest.hexdigest()
+
+
+def read_checkpoint(persist_directory: str) -> dict | None:
+    """未完成的建立索引進度（沒有時為 None）"""
+    try:
+        with open(os.path.join(persist_directory, CHECKPOINT_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(persist_directory: str, checkpoint: dict) -> None:
+    path = os.path.join(persist_directory, CHECKPOINT_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(persist_directory: str) -> None:
+    try:
+        os.remove(os.path.join(persist_directory, CHECKPOINT_FILENAME))
+    except OSError:
+        pass
+
+
+def index_documents(documents: list, persist_directory: str, embeddings: list | None = None,
+                    batch_size: int | None = None, checkpoint: bool = False, progress=None) -> int:
+    """
+    建立文件索引（寫入目前設定的向量庫）
 
     documents: [
         {
@@ -79,47 +485,125 @@ def index_documents(documents: list, persist_directory: str):
         },
         ...
     ]
+    embeddings: 與 documents 對應的已知向量（如 chunker.chunk_embeddings_from_sentences 的結果），
+        為 None 的項目才送進模型 encode
+    batch_size: encode 的批次大小（None 時依可用記憶體決定，見 auto_encode_batch_size）
+    checkpoint: 每寫入 WRITE_BATCH_SIZE 個 chunk 記錄一次進度；同一組文件再次建立時
+        從上次完成的位置繼續，全部完成後刪除檢查點
+    progress: progress(已寫入數, 總數)，每批寫入後呼叫
+
+    Returns: 本次寫入的 chunk 數（從檢查點繼續時不含先前已完成的部分）
     """
-    collection = get_collection(persist_directory)
-    model = get_embedding_model()
-
-    # 分批處理，避免記憶體不足
-    batch_size = 10
+    store = get_vector_store(persist_directory)
+    # 檢查點放在實際寫入的目錄（版本目錄）
+    persist_directory = store.persist_directory
+    known = embeddings or [None] * len(documents)
+    model = get_embedding_model() if any(vector is None for vector in known) else None
+    encode_batch = batch_size or auto_encode_batch_size()
     total = len(documents)
 
-    for i in range(0, total, batch_size):
-        batch = documents[i:i + batch_size]
+    start = 0
+    signature = _documents_signature(documents, known) if checkpoint else None
+    if checkpoint:
+        saved = read_checkpoint(persist_directory)
+        if saved and saved.get("signature") == signature and 0 < saved.get("done", 0) <= total:
+            start = saved["done"]
+            print(f"從檢查點繼續：已完成 {start}/{total} 個文件")
+
+    reused = 0
+    started = time.perf_counter()
+    for i in range(start, total, WRITE_BATCH_SIZE):
+        batch = documents[i:i + WRITE_BATCH_SIZE]
 
         ids = [doc["id"] for doc in batch]
         contents = [doc["content"] for doc in batch]
         metadatas = [doc.get("metadata", {}) for doc in batch]
 
-        # 生成 embeddings
-        embeddings = model.encode(contents, show_progress_bar=False).tolist()
+        # 生成 embeddings（保持 numpy 陣列，不轉成 Python float list）；已知向量的項目不再 encode
+        batch_vectors = known[i:i + WRITE_BATCH_SIZE]
+        missing = [j for j, vector in enumerate(batch_vectors) if vector is None]
+        encoded = model.encode([contents[j] for j in missing], batch_size=encode_batch,
+                               show_progress_bar=False) if missing else []
+        encoded = dict(zip(missing, encoded))
+        batch_embeddings = np.asarray([
+            encoded[j] if vector is None else vector for j, vector in enumerate(batch_vectors)
+        ], dtype=np.float32)
+        reused += len(batch) - len(missing)
+
+        # 一批只寫入一次；已存在的 id 會被取代
+        store.upsert(ids, batch_embeddings, contents, metadatas)
+
+        done = min(i + WRITE_BATCH_SIZE, total)
+        if checkpoint:
+            _write_checkpoint(persist_directory, {"signature": signature, "done": done, "total": total})
+        if progress is not None:
+            progress(done, total)
+        print(f"已索引 {done}/{total} 個文件")
+
+    if checkpoint:
+        clear_checkpoint(persist_directory)
+
+    written = total - start
+    seconds = time.perf_counter() - started
+    note = f"（{reused} 個沿用分段時的句子向量，未重新 encode）" if reused else ""
+    speed = f"，{written / seconds:.1f} 個/秒（encode 批次 {encode_batch}）" if written and seconds > 0 else ""
+    print(f"\n索引建立完成！共 {total} 個文件{note}{speed}")
+    return written
+
+
+def export_flat_index(persist_directory: str) -> int:
+    """
+    把 ChromaDB 中既有的向量（不重新 encode）匯出成 flat 向量庫
 
-        # 檢查是否已存在，如果存在就更新
-        existing_ids = set()
-        try:
-            existing = collection.get(ids=ids)
-            existing_ids = set(existing['ids'])
-        except Exception:
-            pass
-
-        # 先刪除已存在的
-        if existing_ids:
-            collection.delete(ids=list(existing_ids))
-
-        # 新增到 collection
-        collection.add(
-            ids=ids,
-            documents=contents,
-            embeddings=embeddings,
-            metadatas=metadatas
-        )
+    Returns:
+        匯出的 chunk 數
+    """
+    persist_directory = resolve_persist_directory(persist_directory)
+    source = ChromaVectorStore(persist_directory)
+    chunks = source.get_all()
+    if not chunks:
+        return 0
+    embeddings = source.get_embeddings([chunk["id"] for chunk in chunks])
+    target = FlatVectorStore(persist_directory)
+    meta, _, _ = target._load()
+    target._write(
+        np.asarray([embeddings[chunk["id"]] for chunk in chunks], dtype=np.float32),
+        [chunk["id"] for chunk in chunks],
+        [chunk["content"] for chunk in chunks],
+        [chunk["metadata"] for chunk in chunks],
+        old_meta=meta,
+    )
+    return len(chunks)
 
-        print(f"已索引 {min(i + batch_size, total)}/{total} 個文件")
 
-    print(f"\n索引建立完成！共 {total} 個文件")
+def encode_queries(queries: list[str]) -> list[list[float]]:
+    """
+    查詢字串 → 查詢向量（依序對應）
+
+    以「模型名稱 + 正規化後的查詢」快取，未命中的查詢合併成一次 encode。
+    語意搜尋與多查詢擴展等需要查詢向量的地方都應透過這裡取得。
+    """
+    from embedding_cache import get_embedding_cache, normalize_query
+    from onnx_backend import model_id
+
+    cache = get_embedding_cache()
+    normalized = [normalize_query(q) for q in queries]
+    embeddings = [cache.get(model_id(MODEL_NAME), q) for q in normalized]
+
+    missing = list(dict.fromkeys(q for q, emb in zip(normalized, embeddings) if emb is None))
+    if missing:
+        model = get_embedding_model()
+        encoded = dict(zip(missing, model.encode(missing, show_progress_bar=False).tolist()))
+        for q, emb in encoded.items():
+            cache.set(model_id(MODEL_NAME), q, emb)
+        embeddings = [emb if emb is not None else encoded[q] for q, emb in zip(normalized, embeddings)]
+
+    return embeddings
+
+
+def encode_query(query: str) -> list[float]:
+    """單一查詢字串 → 查詢向量（見 encode_queries）"""
+    return encode_queries([query])[0]
 
 
 def semantic_search(query: str, persist_directory: str, n_results: int = 10) -> list:
@@ -137,51 +621,87 @@ def semantic_search(query: str, persist_directory: str, n_results: int = 10) ->
         ...
     ]
     """
-    collection = get_collection(persist_directory)
-    model = get_embedding_model()
+    store = get_vector_store(persist_directory)
 
     # 檢查是否有索引
-    if collection.count() == 0:
+    if store.count() == 0:
         print("警告：索引為空，請先執行 build_index.py")
         return []
 
-    # 生成查詢向量
-    query_embedding = model.encode([query], show_progress_bar=False)[0].tolist()
+    # 生成查詢向量（重複的查詢直接取用快取）
+    query_embedding = encode_query(query)
 
     # 執行搜尋
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        include=["documents", "metadatas", "distances"]
-    )
-
-    # 格式化結果
     formatted_results = []
-    if results['ids'] and results['ids'][0]:
-        for i in range(len(results['ids'][0])):
-            distance = results['distances'][0][i] if results['distances'] else 0
-            similarity = 1 - distance  # cosine distance 轉為 similarity
-
-            # 過濾掉完全不相關的結果 (閾值 0.25 可根據 embeddings 模型調整)
-            if similarity < 0.25:
-                continue
-
-            formatted_results.append({
-                "id": results['ids'][0][i],
-                "content": results['documents'][0][i][:2000] + "..." if results['documents'] else "",
-                "distance": distance,
-                "similarity": similarity,
-                "metadata": results['metadatas'][0][i] if results['metadatas'] else {}
-            })
+    for chunk_id, content, metadata, similarity in store.query(query_embedding, n_results):
+        # 過濾掉完全不相關的結果 (閾值 0.25 可根據 embeddings 模型調整)
+        if similarity < 0.25:
+            continue
+
+        formatted_results.append({
+            "id": chunk_id,
+            "content": content[:2000] + "..." if content else "",
+            "distance": 1 - similarity,
+            "similarity": similarity,
+            "metadata": metadata or {}
+        })
 
     return formatted_results
 
 
+def delete_documents(paths, persist_directory: str) -> int:
+    """
+    刪除指定文件的所有 chunks（chunk id 以 `文件路徑::` 開頭）
+
+    Returns: 刪除的 chunk 數
+    """
+    prefixes = tuple(f"{path}::" for path in paths)
+    if not prefixes:
+        return 0
+    store = get_vector_store(persist_directory)
+    ids = [chunk_id for chunk_id in store.ids() if chunk_id.startswith(prefixes)]
+    store.delete(ids)
+    return len(ids)
+
+
+def delete_stale_chunks(keep_ids, persist_directory: str) -> int:
+    """
+    刪除不在 keep_ids 中的 chunks（從檢查點繼續完整重建時，清掉上次建立留下的舊 chunks）
+
+    Returns: 刪除的 chunk 數
+    """
+    keep = set(keep_ids)
+    store = get_vector_store(persist_directory)
+    ids = [chunk_id for chunk_id in store.ids() if chunk_id not in keep]
+    if ids:
+        store.delete(ids)
+    return len(ids)
+
+
+def get_all_chunks(persist_directory: str) -> list:
+    """
+    取出向量索引中的所有 chunk（不含 embeddings），供關鍵字索引即時建立時使用
+
+    Returns: [{"id": "path::chunk_0", "content": "...", "metadata": {...}}, ...]
+    """
+    return get_vector_store(persist_directory).get_all()
+
+
+def get_chunk_embeddings(ids: list[str], persist_directory: str) -> dict:
+    """
+    依 chunk id 取出已索引的 embeddings（不存在的 id 不會出現在結果中）
+
+    Returns: {"path::chunk_0": [0.01, ...], ...}
+    """
+    if not ids:
+        return {}
+    return get_vector_store(persist_directory).get_embeddings(ids)
+
+
 def get_index_count(persist_directory: str) -> int:
     """獲取索引文件數量"""
     try:
-        collection = get_collection(persist_directory)
-        return collection.count()
+        return get_vector_store(persist_directory).count()
     except Exception:
         return 0
 
@@ -192,19 +712,11 @@ def needs_reindex(persist_directory: str) -> bool:
 
 
 def get_rerank_model():
-    """懶加載 Re-ranking 模型"""
-    global _rerank_model
-    if _rerank_model is None:
-        try:
-            from sentence_transformers import CrossEncoder
-            model_name = "cross-encoder/ms-marco-MiniLM-L-6-v2"
-            print(f"正在載入 Re-ranking 模型: {model_name}")
-            _rerank_model = CrossEncoder(model_name)
-            print("Re-ranking 模型載入完成")
-        except Exception as e:
-            print(f"載入 Re-ranking 模型失敗: {e}")
-            return None
-    return _rerank_model
+    """懶加載 Re-ranking 模型（載入失敗時回傳 None，搜尋略過 rerank）"""
+    try:
+        return model_registry.get_rerank_model()
+    except Exception:
+        return None
 
 
 def rerank_results(query: str, results: list, top_k: int = 5) -> list:
@@ -215,12 +727,21 @@ def rerank_results(query: str, results: list, top_k: int = 5) -> list:
         return results[:top_k]
 
     try:
-        pairs = []
-        for r in results:
-            content = r.get('content', '')
-            pairs.append([query, content[:500]])
-
-        scores = model.predict(pairs)
+        from embedding_cache import normalize_query
+        from onnx_backend import model_id
+        from rerank_cache import get_rerank_cache
+
+        query = normalize_query(query)
+        contents = [r.get('content', '')[:500] for r in results]
+
+        # 只有未快取的 (query, chunk) 送進模型
+        cache = get_rerank_cache()
+        scores = cache.lookup(model_id(RERANK_MODEL_NAME), query, contents)
+        missing = list(dict.fromkeys(c for c, score in zip(contents, scores) if score is None))
+        if missing:
+            predicted = dict(zip(missing, (float(s) for s in model.predict([[query, c] for c in missing]))))
+            cache.store(model_id(RERANK_MODEL_NAME), query, predicted)
+            scores = [score if score is not None else predicted[c] for c, score in zip(contents, scores)]
 
         for i, score in enumerate(scores):
             results[i]['rerank_score'] = float(score)
@@ -233,41 +754,74 @@ def rerank_results(query: str, results: list, top_k: int = 5) -> list:
         return results[:top_k]
 
 
-def mmr_sort(results: list, lambda_param: float = 0.7) -> list:
-    """MMR 多樣性排序"""
-    if not results:
-        return []
+def _mmr_relevance(result: dict) -> float:
+    """MMR 的相關度：rerank 分數優先，其次語意相似度、融合分數（後兩者放大到與 logit 相近的尺度）"""
+    if 'rerank_score' in result:
+        return result['rerank_score']
+    if 'similarity' in result:
+        return result['similarity'] * 10
+    return result.get('final_score', 0) * 10
+
 
-    selected: list[dict] = []
-    candidates = results.copy()
+def file_kernel(results: list) -> np.ndarray:
+    """同一份文件的兩個結果相似度為 1，其餘為 0（沒有路徑的結果不與任何結果相似）"""
+    codes = {}
+    keys = []
+    for i, r in enumerate(results):
+        path = r.get('metadata', {}).get('file_path') or r.get('path')
+        keys.append(codes.setdefault(path, len(codes)) if path else -1 - i)
+    keys = np.array(keys)
+    return ((keys[:, None] == keys[None, :]) & (keys[:, None] >= 0)).astype(np.float64)
 
-    while len(selected) < len(results):
-        best_score = -float('inf')
-        best_idx = -1
 
-        for i, candidate in enumerate(candidates):
-            if 'rerank_score' in candidate:
-                relevance = candidate['rerank_score']
-            elif 'similarity' in candidate:
-                relevance = candidate['similarity'] * 10
-            else:
-                relevance = candidate.get('final_score', 0) * 10
+def cosine_kernel(embeddings) -> np.ndarray:
+    """結果兩兩之間的 cosine 相似度（一次算完）"""
+    matrix = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+    return matrix @ matrix.T
 
-            diversity_penalty = 0
-            if selected:
-                candidate_path = candidate.get('metadata', {}).get('file_path') or candidate.get('path')
-                for sel in selected:
-                    sel_path = sel.get('metadata', {}).get('file_path') or sel.get('path')
-                    if candidate_path and sel_path and candidate_path == sel_path:
-                        diversity_penalty += 1
 
-            mmr_score = relevance - (diversity_penalty * (1 - lambda_param) * 5)
+def mmr_sort(results: list, lambda_param: float = 0.7, top_k: int | None = None,
+             similarity=None, redundancy: str = "sum") -> list:
+    """
+    MMR 多樣性排序
+
+    每一步選出 相關度 - 重複度 × (1 - lambda) × 5 最高的結果，
+    重複度由候選與已選結果的相似度累計：
 
-            if mmr_score > best_score:
-                best_score = mmr_score
-                best_idx = i
+    - similarity: n×n 相似度矩陣（如 cosine_kernel(embeddings)）；
+      None 時使用 file_kernel（同檔案為 1）
+    - redundancy: "sum" 累加與已選結果的相似度（file_kernel 下即同檔案已選幾筆），
+      "max" 取最大相似度（標準 MMR，適合 embedding 相似度）
+    - top_k: 選滿 k 筆即停止，只回傳這 k 筆；None 時排序全部結果
 
-        if best_idx != -1:
-            selected.append(candidates.pop(best_idx))
+    每選一筆只更新一次重複度向量，不再對已選結果逐一比對路徑。
+    """
+    if not results:
+        return []
 
-    return selected
+    n = len(results)
+    k = n if top_k is None else max(0, min(top_k, n))
+    kernel = file_kernel(results) if similarity is None else np.asarray(similarity, dtype=np.float64)
+    if kernel.shape != (n, n):
+        raise ValueError(f"similarity 矩陣大小應為 {n}x{n}，實際為 {kernel.shape}")
+    if redundancy not in ("sum", "max"):
+        raise ValueError(f"未知的 redundancy: {redundancy}")
+
+    relevance = np.array([_mmr_relevance(r) for r in results], dtype=np.float64)
+    redundant = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+
+    order = []
+    for _ in range(k):
+        scores = np.where(available, relevance - (redundant * (1 - lambda_param) * 5), -np.inf)
+        best = int(np.argmax(scores))
+        order.append(best)
+        available[best] = False
+        if redundancy == "sum":
+            redundant += kernel[:, best]
+        else:
+            np.maximum(redundant, kernel[:, best], out=redundant)
+
+    return [results[i] for i in order]
@@ -0,0 +1,109 @@
+"""
+背景預熱模組 - server 啟動時在背景載入索引與模型
+
+Embedding 與 Re-ranking 模型原本在第一次搜尋時才載入（可能還要下載），
+第一個查詢看起來像當機。server.main() 在 MCP handshake 進行的同時，
+以背景 task 依序載入關鍵字索引、向量索引、Embedding 模型與 Re-ranking 模型。
+
+預熱期間的搜尋不等待模型：尚未載入完成的語意搜尋 / rerank 階段直接略過，
+以關鍵字搜尋回應。
+
+設定環境變數 SBIR_PREWARM=0 可關閉預熱（回到第一次搜尋時才載入）。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+PREWARM_ENV = "SBIR_PREWARM"
+
+# 預熱的元件（依序載入）
+COMPONENTS = ("keyword_index", "vector_index", "embedding_model", "rerank_model")
+
+COMPONENT_LABELS = {
+    "keyword_index": "關鍵字索引",
+    "vector_index": "向量索引",
+    "embedding_model": "Embedding 模型",
+    "rerank_model": "Re-ranking 模型",
+}
+
+# 元件狀態：cold（未載入）/ loading / warm / skipped / failed
+_status: dict[str, dict] = {name: {"state": "cold"} for name in COMPONENTS}
+_warmup_task = None
+
+
+def is_enabled() -> bool:
+    """是否在啟動時預熱（預設開啟）"""
+    return os.environ.get(PREWARM_ENV, "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _load(name: str, loader: Callable[[], object]) -> None:
+    """載入單一元件並記錄耗時（在 worker 執行緒中執行）"""
+    _status[name] = {"state": "loading"}
+    started = time.perf_counter()
+    try:
+        loader()
+        _status[name] = {"state": "warm", "seconds": time.perf_counter() - started}
+    except Exception as e:
+        _status[name] = {"state": "failed", "seconds": time.perf_counter() - started, "error": str(e)}
+        logger.warning(f"預熱 {COMPONENT_LABELS[name]} 失敗: {e}")
+
+
+def _require(value: object, message: str) -> object:
+    if not value:
+        raise RuntimeError(message)
+    return value
+
+
+async def _warmup(persist_directory: str) -> None:
+    # 在 event loop 預設的執行緒池中載入，不佔用 worker_pool（預熱期間搜尋仍需要 worker）
+    from keyword_index import get_keyword_index
+    from vector_search import get_embedding_model, get_index_count, get_rerank_model
+
+    await asyncio.to_thread(_load, "keyword_index", lambda: get_keyword_index(persist_directory))
+    await asyncio.to_thread(_load, "vector_index", lambda: _require(
+        get_index_count(persist_directory), "向量索引為空或無法使用（請執行 build_index.py）"
+    ))
+
+    # 沒有向量索引時語意搜尋用不到模型，不佔用記憶體
+    if _status["vector_index"]["state"] != "warm":
+        for name in ("embedding_model", "rerank_model"):
+            _status[name] = {"state": "skipped"}
+        return
+
+    await asyncio.to_thread(_load, "embedding_model", get_embedding_model)
+    await asyncio.to_thread(_load, "rerank_model", lambda: _require(get_rerank_model(), "Re-ranking 模型載入失敗"))
+
+
+def start(persist_directory: str) -> asyncio.Task | None:
+    """在目前的 event loop 啟動背景預熱（未啟用時回傳 None）"""
+    global _warmup_task
+    if not is_enabled() or _warmup_task is not None:
+        return _warmup_task
+    _warmup_task = asyncio.get_running_loop().create_task(_warmup(persist_directory))
+    return _warmup_task
+
+
+def is_loading(name: str) -> bool:
+    """
+    元件是否正在預熱中（搜尋時用來決定是否略過該階段）
+
+    未啟動預熱時一律回傳 False，維持第一次使用時才載入的行為。
+    """
+    if _warmup_task is None or _warmup_task.done():
+        return False
+    return _status[name]["state"] in ("cold", "loading")
+
+
+def get_status() -> dict:
+    """各元件的預熱狀態與載入耗時"""
+    return {
+        "enabled": is_enabled(),
+        "started": _warmup_task is not None,
+        "done": _warmup_task is not None and _warmup_task.done(),
+        "components": {name: dict(_status[name]) for name in COMPONENTS},
+    }
@@ -0,0 +1,66 @@
+"""
+背景執行緒池 - 把阻塞運算移出 asyncio event loop
+
+MCP server 以 stdio 單一 event loop 同時處理多個 tool 呼叫；
+embedding encode、Chroma query、CrossEncoder predict、git 子程序等阻塞呼叫
+若直接在 async 函式中執行，會讓 get_progress 這類輕量呼叫排在後面等好幾秒。
+
+使用執行緒而非行程：模型只需在 server 內載入一份，
+PyTorch / ONNX 推論與檔案、網路 I/O 執行期間都會釋放 GIL。
+
+工作執行緒數可用環境變數 SBIR_WORKERS 設定（預設 min(4, CPU 核心數)）。
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+WORKERS_ENV = "SBIR_WORKERS"
+
+# 懶加載的全域變數
+_executor = None
+
+
+def get_worker_count() -> int:
+    """讀取工作執行緒數（無效值時使用預設）"""
+    default = min(4, os.cpu_count() or 1)
+    value = os.environ.get(WORKERS_ENV, "")
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"{WORKERS_ENV}={value!r} 不是有效的整數，改用預設值 {default}")
+        return default
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """懶加載共用的執行緒池"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_worker_count(), thread_name_prefix="sbir-worker")
+    return _executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    在執行緒池中執行阻塞函式，並在 event loop 上等待結果
+
+    Example:
+        >>> results = await run_blocking(semantic_search, query, PERSIST_DIR, n_results=15)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown() -> None:
+    """關閉執行緒池（server 結束時呼叫）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None